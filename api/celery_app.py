@@ -1,7 +1,51 @@
+"""
+Celery application
+Optimization jobs are routed by size into two queues so a huge solve never
+sits in front of a small interactive one. Run one worker pool per queue with
+concurrency sized for it, e.g.
+
+    celery -A api.celery_app worker -Q urgent,interactive -c 4 -n interactive@%h
+    celery -A api.celery_app worker -Q urgent,bulk -c 1 -n bulk@%h
+
+Each bulk solve already runs its components in parallel, so a low
+concurrency suits the bulk queue. Urgent plans go to a third queue that both
+pools consume ahead of their own (queues are read in the order given), so
+the slot a preempted bulk job frees goes to the urgent plan.
+"""
 from celery import Celery
+from celery.schedules import crontab
+from typing import Dict
 import os
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6000/0")
+# Hour (UTC) of the nightly incremental model retrain
+TRAINING_SCHEDULE_HOUR = int(os.getenv("ML_TRAINING_SCHEDULE_HOUR", "2"))
+
+INTERACTIVE_QUEUE = "interactive"
+BULK_QUEUE = "bulk"
+URGENT_QUEUE = "urgent"
+# Jobs over at least this many candidate wagons go to the bulk queue
+BULK_QUEUE_MIN_WAGONS = int(os.getenv("OPTIMIZER_BULK_MIN_WAGONS", "1000"))
+# Plan priorities that skip the bulk queue and preempt running bulk jobs
+URGENT_PRIORITIES = tuple(
+    priority.strip() for priority in os.getenv("OPTIMIZER_URGENT_PRIORITIES", "Critical,High").split(",")
+)
+# Seconds a new worker process may take to start: the worker_process_init
+# hook pre-warms solvers, ML models and the route matrix (Celery's default
+# of 4 s would kill processes still warming up)
+WORKER_PROC_ALIVE_TIMEOUT = float(os.getenv("CELERY_WORKER_PROC_ALIVE_TIMEOUT", "60"))
+# (soft, hard) time limits in seconds per queue; the soft limit lets the task
+# return an error result before the hard limit kills the worker process
+QUEUE_TIME_LIMITS = {
+    INTERACTIVE_QUEUE: (
+        int(os.getenv("OPTIMIZER_INTERACTIVE_SOFT_TIME_LIMIT", "120")),
+        int(os.getenv("OPTIMIZER_INTERACTIVE_TIME_LIMIT", "150")),
+    ),
+    BULK_QUEUE: (
+        int(os.getenv("OPTIMIZER_BULK_SOFT_TIME_LIMIT", "1800")),
+        int(os.getenv("OPTIMIZER_BULK_TIME_LIMIT", "1900")),
+    ),
+}
 
 celery_app = Celery(
     "sail_optimizer",
@@ -11,7 +55,10 @@ celery_app = Celery(
 )
 
 celery_app.conf.task_routes = {
-    "api.tasks.optimize_formation_task": "optimization"
+    "api.tasks.optimize_formation_task": INTERACTIVE_QUEUE,
+    "api.tasks.optimize_formation_batch_task": BULK_QUEUE,
+    "api.tasks.train_models_task": BULK_QUEUE,
+    "api.tasks.purge_results_task": BULK_QUEUE,
 }
 
 celery_app.conf.update(
@@ -20,4 +67,55 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    task_default_queue=INTERACTIVE_QUEUE,
+    # Long CPU-bound tasks: reserve one task at a time so queued jobs stay
+    # available to idle workers, and acknowledge only after completion so a
+    # crashed worker's job is redelivered
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Redelivery after the visibility timeout must not race a running bulk job
+    # Workers read their queues in the order given (urgent first)
+    broker_transport_options={
+        "visibility_timeout": QUEUE_TIME_LIMITS[BULK_QUEUE][1] + 600,
+        "queue_order_strategy": "priority",
+    },
+    task_time_limit=QUEUE_TIME_LIMITS[INTERACTIVE_QUEUE][1],
+    task_soft_time_limit=QUEUE_TIME_LIMITS[INTERACTIVE_QUEUE][0],
+    worker_proc_alive_timeout=WORKER_PROC_ALIVE_TIMEOUT,
 )
+
+celery_app.conf.task_annotations = {
+    "api.tasks.optimize_formation_batch_task": {
+        "soft_time_limit": QUEUE_TIME_LIMITS[BULK_QUEUE][0],
+        "time_limit": QUEUE_TIME_LIMITS[BULK_QUEUE][1],
+    },
+    "api.tasks.train_models_task": {
+        "soft_time_limit": QUEUE_TIME_LIMITS[BULK_QUEUE][0],
+        "time_limit": QUEUE_TIME_LIMITS[BULK_QUEUE][1],
+    },
+}
+
+
+def optimization_queue_options(n_wagons: int, urgent: bool = False) -> Dict:
+    """
+    apply_async options (queue and time limits) for a job over n_wagons
+    candidate wagons. Urgent jobs use the urgent queue, which every worker
+    pool serves first, keeping the time limits their size calls for.
+    """
+    size_queue = BULK_QUEUE if n_wagons >= BULK_QUEUE_MIN_WAGONS else INTERACTIVE_QUEUE
+    soft_time_limit, time_limit = QUEUE_TIME_LIMITS[size_queue]
+    queue = URGENT_QUEUE if urgent else size_queue
+    return {'queue': queue, 'soft_time_limit': soft_time_limit, 'time_limit': time_limit}
+
+
+celery_app.conf.beat_schedule = {
+    "nightly-model-training": {
+        "task": "api.tasks.train_models_task",
+        "schedule": crontab(hour=TRAINING_SCHEDULE_HOUR, minute=0),
+    },
+    "nightly-result-purge": {
+        "task": "api.tasks.purge_results_task",
+        "schedule": crontab(hour=TRAINING_SCHEDULE_HOUR, minute=30),
+    },
+}
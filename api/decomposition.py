@@ -0,0 +1,256 @@
+"""
+Problem decomposition for Rake Formation
+Splits the wagon/order assignment into independent components (wagon groups
+that can only serve disjoint sets of orders, e.g. different wagon types or
+stockyards), solves them concurrently in a process pool and merges the
+results into the RakeFormationOptimizer output schema.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Optional
+import numpy as np
+import os
+import time
+
+from .optimizer import RakeFormationOptimizer
+
+DEFAULT_POOL_SIZE = int(os.getenv("OPTIMIZER_POOL_SIZE", str(os.cpu_count() or 1)))
+# Below this many feasible pairs, process start-up costs more than it saves
+MIN_PAIRS_FOR_POOL = int(os.getenv("OPTIMIZER_MIN_PAIRS_FOR_POOL", "5000"))
+
+
+def find_components(optimizer: RakeFormationOptimizer,
+                    pairs: Optional[List[Tuple[int, int]]] = None) -> List[Tuple[List[int], List[int]]]:
+    """
+    Group orders that share at least one candidate wagon (union-find over the
+    compatible pairs, computed unless given) and attach every wagon to its
+    orders' group.
+    Returns [(wagon_indices, order_indices)]; wagons that no order can take
+    are left out since they are never assigned.
+    """
+    if pairs is None:
+        pairs = optimizer._compatible_pairs()
+    parent = list(range(len(optimizer.orders)))
+    
+    def find(o_idx):
+        while parent[o_idx] != o_idx:
+            parent[o_idx] = parent[parent[o_idx]]
+            o_idx = parent[o_idx]
+        return o_idx
+    
+    first_order = {}
+    for w_idx, o_idx in pairs:
+        if w_idx not in first_order:
+            first_order[w_idx] = o_idx
+        else:
+            root_a, root_b = find(first_order[w_idx]), find(o_idx)
+            if root_a != root_b:
+                parent[root_b] = root_a
+    
+    components = {}
+    for o_idx in range(len(optimizer.orders)):
+        components.setdefault(find(o_idx), ([], []))[1].append(o_idx)
+    for w_idx in sorted(first_order):
+        components[find(first_order[w_idx])][0].append(w_idx)
+    return list(components.values())
+
+
+def _sub_cost_matrix(optimizer: RakeFormationOptimizer, w_indices: List[int], o_indices: List[int]):
+    """Slice the optimizer's normalized cost matrix down to one component"""
+    if optimizer.cost_matrix is not None:
+        return optimizer.cost_matrix[np.ix_(w_indices, o_indices)]
+    
+    rows, cols, values = optimizer.cost_triplets
+    w_map = np.full(len(optimizer.wagons), -1, dtype=np.int64)
+    o_map = np.full(len(optimizer.orders), -1, dtype=np.int64)
+    w_map[w_indices] = np.arange(len(w_indices))
+    o_map[o_indices] = np.arange(len(o_indices))
+    in_range = (rows >= 0) & (rows < len(w_map)) & (cols >= 0) & (cols < len(o_map))
+    sub_rows = np.full(len(rows), -1, dtype=np.int64)
+    sub_cols = np.full(len(cols), -1, dtype=np.int64)
+    sub_rows[in_range] = w_map[rows[in_range]]
+    sub_cols[in_range] = o_map[cols[in_range]]
+    keep = (sub_rows >= 0) & (sub_cols >= 0)
+    return {'rows': sub_rows[keep], 'cols': sub_cols[keep], 'values': values[keep]}
+
+
+def _solve_component(wagons, orders, cost_matrix, settings, engine, warm_start, fix_warm_start) -> Dict:
+    """Process pool entry point: solve one component with a fresh optimizer"""
+    optimizer = RakeFormationOptimizer(wagons, orders, cost_matrix, use_cache=False, **settings)
+    return optimizer.optimize(engine=engine, warm_start=warm_start, fix_warm_start=fix_warm_start)
+
+
+class DecomposedRakeFormationOptimizer(RakeFormationOptimizer):
+    """
+    RakeFormationOptimizer that solves independent components concurrently.
+    Falls back to the monolithic solve when the problem has a single
+    component or is too small to be worth a process pool.
+    """
+    
+    def __init__(self, *args, max_workers: Optional[int] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_workers = max_workers or DEFAULT_POOL_SIZE
+    
+    def _optimize(self, engine, on_solution, warm_start, fix_warm_start) -> Dict:
+        """
+        Same contract as RakeFormationOptimizer.optimize (caching included).
+        When the problem is split, on_solution only receives the merged final
+        solution.
+        """
+        # Every compatible pair lies in exactly one component
+        pairs = self._compatible_pairs()
+        components = find_components(self, pairs)
+        if len(components) <= 1 or len(pairs) < MIN_PAIRS_FOR_POOL:
+            return super()._optimize(engine, on_solution, warm_start, fix_warm_start)
+        
+        start = time.perf_counter()
+        pool_size = max(1, min(self.max_workers, len(components)))
+        # Share the CPU budget between concurrently solved components
+        settings = {
+            'time_limit_seconds': self.time_limit_seconds,
+            'num_workers': max(1, self.num_workers // pool_size),
+            'relative_gap': self.relative_gap,
+            'should_stop': self.should_stop,
+            'partial': self.partial,
+        }
+        jobs = []
+        for w_indices, o_indices in components:
+            wagons = [self.wagons[w_idx] for w_idx in w_indices]
+            orders = [self.orders[o_idx] for o_idx in o_indices]
+            sub_warm_start = None
+            if warm_start:
+                wagon_ids = {str(wagon.get('id')) for wagon in wagons}
+                sub_warm_start = {
+                    wagon_id: order_id for wagon_id, order_id in warm_start.items()
+                    if str(wagon_id) in wagon_ids
+                }
+            jobs.append((
+                wagons, orders, _sub_cost_matrix(self, w_indices, o_indices),
+                settings, engine, sub_warm_start, fix_warm_start
+            ))
+        
+        try:
+            with ProcessPoolExecutor(max_workers=pool_size) as pool:
+                results = list(pool.map(_solve_component, *zip(*jobs)))
+        except (OSError, AssertionError):
+            # No child processes allowed here (e.g. daemonic worker): solve in-process
+            results = [_solve_component(*job) for job in jobs]
+        
+        merged = self._merge_results(results, engine, time.perf_counter() - start, warm_start)
+        if on_solution is not None and merged.get('assignments'):
+            on_solution({key: value for key, value in merged.items() if key != 'message'})
+        return merged
+    
+    def _merge_results(self, results: List[Dict], engine: str, solve_time: float, warm_start) -> Dict:
+        """Combine component results into one RakeFormationOptimizer-style result"""
+        for result in results:
+            if 'error' in result:
+                return result
+        
+        # Every order must be satisfied, so one component without a solution
+        # (proven infeasible, or none found in time) leaves the whole problem
+        # without one; in partial mode it only leaves its own orders
+        # unserved (or unsolved)
+        unanswered = [result for result in results if result['status'] in ('infeasible', 'no_solution')]
+        if self.partial:
+            solved = [result for result in results if result['status'] not in ('infeasible', 'no_solution')]
+            failed = unanswered if not solved else []
+        else:
+            solved = results
+            failed = unanswered
+        # Proven infeasibility outranks running out of time
+        failed_status = (
+            'infeasible' if any(result['status'] == 'infeasible' for result in failed) else 'no_solution'
+        )
+        interrupted = next((result['interrupted'] for result in results if result.get('interrupted')), None)
+        
+        # Components build and solve concurrently: report the slowest build
+        # and the wall time of the pooled solve
+        report = {
+            'engine': engine,
+            'model_build_seconds': max(result.get('model_build_seconds', 0) for result in results),
+            'solve_time_seconds': round(solve_time, 4),
+            'components': len(results),
+        }
+        if interrupted:
+            report['interrupted'] = interrupted
+        if warm_start:
+            # Previous wagons outside every component count as removed
+            kept = 0 if failed else sum(
+                result['warm_start']['kept'] for result in results if 'warm_start' in result
+            )
+            added = 0 if failed else sum(len(result['assignments']) for result in results) - kept
+            report['warm_start'] = {
+                'previous_assignments': len(warm_start),
+                'kept': kept,
+                'added': added,
+                'removed': len(warm_start) - kept,
+                'changed': added + len(warm_start) - kept,
+                'fixed': sum(result['warm_start']['fixed'] for result in results if 'warm_start' in result),
+            }
+        
+        # A component stopped without an incumbent leaves no complete solution
+        if not failed and any(result['status'] == 'interrupted' for result in solved):
+            return {
+                'status': 'interrupted',
+                'message': f"Solve stopped ({interrupted}) before a feasible solution was found",
+                'assignments': [],
+                'objective_value': None,
+                'best_bound': None,
+                'gap': None,
+                **report
+            }
+        
+        unserved = [order_id for result in results for order_id in result.get('unserved_order_ids', [])]
+        unsolved = [order_id for result in results for order_id in result.get('unsolved_order_ids', [])]
+        if self.partial:
+            report['unserved_order_ids'] = unserved
+            report['unsolved_order_ids'] = unsolved
+        
+        if failed:
+            return {
+                'status': failed_status,
+                'message': (
+                    'No feasible solution found. Check constraints.' if failed_status == 'infeasible' else
+                    'No solution found within the time limit; the problem was not proven infeasible'
+                ),
+                'assignments': [],
+                'objective_value': None,
+                'best_bound': None,
+                'gap': None,
+                **report
+            }
+        
+        assignments = []
+        for result in solved:
+            for assignment in result['assignments']:
+                assignments.append({**assignment, 'sequence_order': len(assignments) + 1})
+        total_cost = sum(result['total_cost'] for result in solved)
+        objective = sum(result['objective_value'] for result in solved)
+        # A component without a bound (e.g. heuristic out of time) leaves none
+        bounds = [result['best_bound'] for result in solved]
+        bound = None if None in bounds else sum(bounds)
+        status = 'optimal' if not unsolved and all(result['status'] == 'optimal' for result in solved) else 'feasible'
+        
+        merged = {
+            'status': status,
+            'assignments': assignments,
+            'total_cost': total_cost,
+            'cost_savings': self._calculate_savings(total_cost),
+            'time_savings_hours': self._calculate_time_savings(assignments),
+            'objective_value': objective,
+            'best_bound': bound,
+            'gap': self._relative_gap(objective, bound),
+            **report
+        }
+        if interrupted:
+            merged['message'] = f"Solve stopped ({interrupted}); returning the best incumbent"
+        elif unsolved:
+            merged['message'] = (
+                f"{len(unserved)} order(s) cannot be served and {len(unsolved)} got no solution in time; "
+                "both were left empty"
+            )
+        elif unserved:
+            merged['message'] = f"{len(unserved)} order(s) cannot be served and were left empty"
+        elif status == 'feasible':
+            merged['message'] = 'Found feasible solution but not proven optimal (time or gap limit reached)'
+        return merged
@@ -0,0 +1,106 @@
+"""
+Optimization job events over Redis pub/sub
+Tasks publish progress, incumbent and completion events on a per-job
+channel; the API streams them to clients (Server-Sent Events) instead of
+clients polling the Celery result backend. The latest event of each job is
+also kept under a short-lived key, so a client that connects mid-solve or
+after the job finished still gets the current state right away.
+"""
+from typing import AsyncIterator, Dict, Optional
+import json
+import os
+
+from .celery_app import REDIS_URL
+
+JOB_EVENTS_REDIS_URL = os.getenv("JOB_EVENTS_REDIS_URL", REDIS_URL)
+JOB_EVENT_TTL_SECONDS = int(os.getenv("JOB_EVENT_TTL_SECONDS", "3600"))
+# Idle seconds between keep-alive comments on an open stream
+JOB_EVENT_HEARTBEAT_SECONDS = float(os.getenv("JOB_EVENT_HEARTBEAT_SECONDS", "15"))
+JOB_EVENT_CHANNEL_PREFIX = "optimization:events:"
+JOB_EVENT_LAST_PREFIX = "optimization:last_event:"
+
+# Bulky result fields left out of completion events (read them from the status endpoint)
+COMPLETION_OMITTED_FIELDS = ('assignments', 'plans')
+
+
+class JobEvents:
+    """Publishes job events (sync, from workers) and subscribes to them (async, from the API)"""
+    
+    def __init__(self, redis_url: str = JOB_EVENTS_REDIS_URL, ttl_seconds: int = JOB_EVENT_TTL_SECONDS):
+        self.redis_url = redis_url
+        self.ttl_seconds = ttl_seconds
+        self._redis = None
+        self._async_redis = None
+    
+    def _client(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+    
+    def _async_client(self):
+        if self._async_redis is None:
+            import redis.asyncio
+            self._async_redis = redis.asyncio.Redis.from_url(self.redis_url)
+        return self._async_redis
+    
+    @staticmethod
+    def channel(job_id: str) -> str:
+        return f"{JOB_EVENT_CHANNEL_PREFIX}{job_id}"
+    
+    def publish(self, job_id: Optional[str], event: str, data: Dict):
+        """Publish an event for a job; a no-op for tasks run without a job id"""
+        if not job_id:
+            return
+        if event == 'completion':
+            data = {key: value for key, value in data.items() if key not in COMPLETION_OMITTED_FIELDS}
+        payload = json.dumps({'event': event, 'job_id': job_id, 'data': data}, default=str)
+        try:
+            pipeline = self._client().pipeline()
+            pipeline.setex(f"{JOB_EVENT_LAST_PREFIX}{job_id}", self.ttl_seconds, payload)
+            pipeline.publish(self.channel(job_id), payload)
+            pipeline.execute()
+        except Exception:
+            # Streaming is best effort; it must never fail an optimization
+            pass
+    
+    async def subscribe(self, job_id: str,
+                        heartbeat_seconds: float = JOB_EVENT_HEARTBEAT_SECONDS) -> AsyncIterator[Optional[Dict]]:
+        """
+        Events of a job, starting with its latest one, until the completion
+        event. Yields None after heartbeat_seconds without an event.
+        """
+        client = self._async_client()
+        pubsub = client.pubsub()
+        try:
+            # Subscribe before reading the last event so nothing falls in between
+            await pubsub.subscribe(self.channel(job_id))
+            last = await client.get(f"{JOB_EVENT_LAST_PREFIX}{job_id}")
+            if last is not None:
+                event = json.loads(last)
+                yield event
+                if event['event'] == 'completion':
+                    return
+            
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat_seconds)
+                if message is None:
+                    yield None
+                    continue
+                event = json.loads(message['data'])
+                yield event
+                if event['event'] == 'completion':
+                    return
+        finally:
+            await pubsub.aclose()
+
+
+def format_sse(event: Optional[Dict]) -> str:
+    """Server-Sent Events frame for an event (a keep-alive comment for None)"""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+# Global instance
+job_events = JobEvents()
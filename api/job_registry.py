@@ -0,0 +1,208 @@
+"""
+In-flight optimization registry
+One Redis entry per plan holds the job currently optimizing it and a
+fingerprint of the inputs it was started with. Submitting the same plan with
+the same inputs while that job runs returns its job id instead of queueing a
+duplicate solve; submitting after the plan (or its wagon pool) changed
+supersedes the stale job, which is revoked and skips writing its result.
+Entries are removed when the job finishes and expire as a safety net; an
+entry whose job Celery reports finished, revoked or lost is taken over.
+
+Running jobs can also be asked to stop: a per-job stop flag ('cancelled',
+'superseded' or 'preempted') is polled by the solver through StopCheck, and
+bulk jobs are tracked so urgent plans can preempt them. A job is preempted at
+most OPTIMIZER_MAX_PREEMPTIONS times, so a stream of urgent plans cannot
+starve it.
+"""
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import time
+
+from celery import states
+
+from .celery_app import celery_app, REDIS_URL, QUEUE_TIME_LIMITS, BULK_QUEUE
+
+JOB_REGISTRY_REDIS_URL = os.getenv("JOB_REGISTRY_REDIS_URL", REDIS_URL)
+# Longer than any job may run
+JOB_REGISTRY_TTL_SECONDS = int(os.getenv("JOB_REGISTRY_TTL_SECONDS", str(QUEUE_TIME_LIMITS[BULK_QUEUE][1] + 600)))
+# A job still PENDING (queued, or unknown to Celery) this long after its
+# claim is taken as lost, e.g. never published or dropped by the broker
+JOB_REGISTRY_PENDING_GRACE_SECONDS = int(os.getenv("JOB_REGISTRY_PENDING_GRACE_SECONDS", "900"))
+# Preemptions a bulk job yields to before it runs to completion
+MAX_PREEMPTIONS = int(os.getenv("OPTIMIZER_MAX_PREEMPTIONS", "3"))
+JOB_REGISTRY_PREFIX = "optimization:inflight:plan:"
+JOB_STOP_PREFIX = "optimization:stop:"
+JOB_PREEMPTIONS_PREFIX = "optimization:preemptions:"
+RUNNING_BULK_JOBS_KEY = "optimization:running:bulk"
+
+
+def input_fingerprint(inputs: Dict) -> str:
+    """Stable hash of a job's inputs"""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class JobRegistry:
+    """Per-plan in-flight job lock; every operation is atomic (WATCH/MULTI)"""
+    
+    def __init__(self, redis_url: str = JOB_REGISTRY_REDIS_URL, ttl_seconds: int = JOB_REGISTRY_TTL_SECONDS,
+                 pending_grace_seconds: int = JOB_REGISTRY_PENDING_GRACE_SECONDS,
+                 max_preemptions: int = MAX_PREEMPTIONS):
+        self.redis_url = redis_url
+        self.ttl_seconds = ttl_seconds
+        self.pending_grace_seconds = pending_grace_seconds
+        self.max_preemptions = max_preemptions
+        self._redis = None
+    
+    def _client(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+    
+    @staticmethod
+    def _key(plan_id: int) -> str:
+        return f"{JOB_REGISTRY_PREFIX}{plan_id}"
+    
+    def current(self, plan_id: int) -> Optional[Dict]:
+        """The plan's in-flight entry {'job_id', 'fingerprint', 'claimed_at'}, if any"""
+        payload = self._client().get(self._key(plan_id))
+        return json.loads(payload) if payload is not None else None
+    
+    def _job_state(self, job_id: str) -> str:
+        return celery_app.AsyncResult(job_id).state
+    
+    def _in_flight(self, entry: Dict) -> bool:
+        """
+        Whether the entry's job can still finish: not done or revoked, and
+        not PENDING past the grace period. An unreachable result backend
+        keeps the entry.
+        """
+        try:
+            state = self._job_state(entry['job_id'])
+        except Exception:
+            return True
+        if state in states.READY_STATES:
+            return False
+        if state == states.PENDING:
+            return time.time() - entry.get('claimed_at', time.time()) < self.pending_grace_seconds
+        return True
+    
+    def claim(self, plan_id: int, fingerprint: str, job_id: str) -> Tuple[str, Optional[str]]:
+        """
+        Register job_id for the plan unless a job with the same fingerprint
+        is in flight. Returns (job id to report, superseded job id): the
+        existing job's id and None for a duplicate, otherwise job_id and the
+        stale job's id (None when the plan was idle or its job is no longer
+        in flight).
+        """
+        key = self._key(plan_id)
+        outcome = {}
+        
+        def transaction(pipe):
+            payload = pipe.get(key)
+            existing = json.loads(payload) if payload is not None else None
+            if existing is not None and not self._in_flight(existing):
+                existing = None
+            if existing is not None and existing['fingerprint'] == fingerprint:
+                outcome['result'] = (existing['job_id'], None)
+                return
+            pipe.multi()
+            pipe.set(
+                key, json.dumps({'job_id': job_id, 'fingerprint': fingerprint, 'claimed_at': time.time()}),
+                ex=self.ttl_seconds
+            )
+            outcome['result'] = (job_id, existing['job_id'] if existing is not None else None)
+        
+        self._client().transaction(transaction, key)
+        return outcome['result']
+    
+    def is_current(self, plan_id: int, job_id: Optional[str]) -> bool:
+        """False once a newer job superseded job_id (True when unknown or Redis is unreachable)"""
+        if not job_id:
+            return True
+        try:
+            entry = self.current(plan_id)
+        except Exception:
+            return True
+        return entry is None or entry['job_id'] == job_id
+    
+    def release(self, plan_id: int, job_id: str):
+        """Remove the plan's entry if it still belongs to job_id"""
+        key = self._key(plan_id)
+        
+        def transaction(pipe):
+            payload = pipe.get(key)
+            if payload is not None and json.loads(payload)['job_id'] == job_id:
+                pipe.multi()
+                pipe.delete(key)
+        
+        try:
+            self._client().transaction(transaction, key)
+        except Exception:
+            # The entry expires on its own
+            pass
+    
+    def request_stop(self, job_id: str, reason: str):
+        """Ask a job to stop; its solver is interrupted on the next StopCheck"""
+        self._client().set(f"{JOB_STOP_PREFIX}{job_id}", reason, ex=self.ttl_seconds)
+    
+    def stop_reason(self, job_id: str) -> Optional[str]:
+        reason = self._client().get(f"{JOB_STOP_PREFIX}{job_id}")
+        return reason.decode() if reason is not None else None
+    
+    def clear_stop(self, job_id: str):
+        self._client().delete(f"{JOB_STOP_PREFIX}{job_id}")
+    
+    def mark_running_bulk(self, job_id: str):
+        self._client().sadd(RUNNING_BULK_JOBS_KEY, job_id)
+    
+    def mark_finished(self, job_id: str):
+        try:
+            self._client().srem(RUNNING_BULK_JOBS_KEY, job_id)
+        except Exception:
+            pass
+    
+    def preempt_bulk_jobs(self) -> List[str]:
+        """
+        Ask every running bulk job that has not used up its max_preemptions
+        to yield; each stops and requeues itself. Returns the preempted ids.
+        """
+        client = self._client()
+        preempted = []
+        for job_id in sorted(job_id.decode() for job_id in client.smembers(RUNNING_BULK_JOBS_KEY)):
+            key = f"{JOB_PREEMPTIONS_PREFIX}{job_id}"
+            count = client.incr(key)
+            client.expire(key, self.ttl_seconds)
+            if count > self.max_preemptions:
+                continue
+            self.request_stop(job_id, 'preempted')
+            preempted.append(job_id)
+        return preempted
+
+
+class StopCheck:
+    """
+    should_stop callable for the optimizer: the job's stop reason, or
+    'timed out' past the deadline (epoch seconds). Picklable, so it also
+    works inside decomposed solves running in child processes.
+    """
+    
+    def __init__(self, job_id: Optional[str], deadline: Optional[float] = None):
+        self.job_id = job_id
+        self.deadline = deadline
+    
+    def __call__(self) -> Optional[str]:
+        if self.deadline is not None and time.time() >= self.deadline:
+            return 'timed out'
+        if not self.job_id:
+            return None
+        try:
+            return job_registry.stop_reason(self.job_id)
+        except Exception:
+            return None
+
+
+# Global instance
+job_registry = JobRegistry()
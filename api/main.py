@@ -1,13 +1,20 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import os
+import uuid
 from dotenv import load_dotenv
 
 from .database import get_db, engine
 from . import models, schemas, auth
-from .tasks import optimize_formation_task
+from .tasks import optimize_formation_task, optimize_formation_batch_task
+from .optimizer import ENGINES
+from .celery_app import celery_app, optimization_queue_options, URGENT_PRIORITIES
+from .job_registry import job_registry, input_fingerprint
+from .result_store import load_summary, load_assignments, RESULT_PAGE_SIZE, RESULT_MAX_PAGE_SIZE
 
 load_dotenv()
 
@@ -100,6 +107,9 @@ def create_plan(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
+    if plan.optimization_engine and plan.optimization_engine.lower() not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown optimization engine. Use one of: {', '.join(ENGINES)}")
+    
     db_plan = models.FormationPlan(
         **plan.dict(),
         created_by=str(current_user.id)
@@ -109,40 +119,177 @@ def create_plan(
     db.refresh(db_plan)
     return db_plan
 
+def _request_stop(job_id: str, reason: str):
+    try:
+        job_registry.request_stop(job_id, reason)
+    except Exception:
+        pass
+
+def _wagon_pool(db: Session, stockyard_ids):
+    """
+    (count, latest update) of the Available wagons at the given stockyards:
+    the size an optimization job is routed by, and part of its inputs
+    """
+    return tuple(db.query(func.count(models.Wagon.id), func.max(models.Wagon.updated_at)).filter(
+        models.Wagon.current_stockyard_id.in_(list(stockyard_ids)),
+        models.Wagon.status == "Available"
+    ).one())
+
 @app.post("/api/v1/plans/{plan_id}/optimize")
 def optimize_plan(
     plan_id: int,
+    engine: Optional[str] = None,
+    anytime: bool = False,
+    incremental: bool = False,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """
     Trigger background optimization job for a formation plan.
+    The solver engine can be chosen per call; otherwise the plan's
+    optimization_engine (or the service default) is used. With anytime=true
+    improving incumbents are reported by the status endpoint as they are found.
+    With incremental=true the solve is warm-started from the plan's current
+    wagon assignments and only re-plans around wagons that changed.
+    While a job for the plan with the same inputs is running its job ID is
+    returned instead of starting another; a job started before the plan or
+    its wagon pool changed is superseded by a new one.
     Returns immediately with job ID for polling.
     """
+    if engine and engine.lower() not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown optimization engine. Use one of: {', '.join(ENGINES)}")
+    
     plan = db.query(models.FormationPlan).filter(models.FormationPlan.id == plan_id).first()
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
     
-    # Trigger Celery task (non-blocking)
-    task = optimize_formation_task.delay(plan_id)
+    pool_size, pool_updated_at = _wagon_pool(db, [plan.origin_stockyard_id])
+    fingerprint = input_fingerprint({
+        'plan_updated_at': plan.updated_at,
+        'origin_stockyard_id': plan.origin_stockyard_id,
+        'destination': plan.destination,
+        'route': plan.route,
+        'engine': engine or plan.optimization_engine,
+        'anytime': anytime,
+        'incremental': incremental,
+        'wagon_pool': (pool_size, pool_updated_at),
+    })
     
-    return {
+    # One in-flight job per plan: reuse a running job with the same inputs,
+    # supersede one started before the plan or its wagon pool changed
+    job_id, superseded_job_id = str(uuid.uuid4()), None
+    try:
+        claimed_job_id, superseded_job_id = job_registry.claim(plan_id, fingerprint, job_id)
+    except Exception:
+        claimed_job_id = job_id  # Registry unreachable: run without deduplication
+    if claimed_job_id != job_id:
+        return {
+            "job_id": claimed_job_id,
+            "status": "processing",
+            "deduplicated": True,
+            "message": "An optimization with the same inputs is already running. Use job_id to check status."
+        }
+    if superseded_job_id:
+        # A queued stale job never starts; a running one is interrupted and
+        # stops before saving
+        celery_app.control.revoke(superseded_job_id)
+        _request_stop(superseded_job_id, 'superseded')
+    
+    # Trigger Celery task (non-blocking), routed by the size of the wagon pool;
+    # urgent plans use the urgent queue, which every worker pool reads first
+    urgent = plan.priority in URGENT_PRIORITIES
+    try:
+        task = optimize_formation_task.apply_async(
+            args=(plan_id, engine, anytime, incremental),
+            task_id=job_id,
+            **optimization_queue_options(pool_size, urgent=urgent)
+        )
+    except Exception:
+        # Never queued: free the plan so the next submit is not deduplicated
+        # onto a job that does not exist
+        job_registry.release(plan_id, job_id)
+        raise HTTPException(status_code=503, detail="Could not queue the optimization. Try again.")
+    
+    # Running bulk jobs yield to the queued urgent plan
+    preempted_job_ids = []
+    if urgent:
+        try:
+            preempted_job_ids = job_registry.preempt_bulk_jobs()
+        except Exception:
+            pass
+    
+    response = {
         "job_id": task.id,
         "status": "processing",
         "message": "Optimization task started. Use job_id to check status."
     }
+    if superseded_job_id:
+        response["superseded_job_id"] = superseded_job_id
+    if preempted_job_ids:
+        response["preempted_job_ids"] = preempted_job_ids
+    return response
+
+@app.post("/api/v1/plans/optimize/batch")
+def optimize_plans_batch(
+    request: schemas.BatchOptimizeRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Trigger one joint optimization for several plans (explicit plan_ids or
+    all Draft plans at origin_stockyard_id) so they share the wagon pool.
+    Poll the result with the status endpoint of any of the plans.
+    """
+    if request.engine and request.engine.lower() not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown optimization engine. Use one of: {', '.join(ENGINES)}")
+    
+    query = db.query(models.FormationPlan.id, models.FormationPlan.origin_stockyard_id)
+    if request.plan_ids:
+        query = query.filter(models.FormationPlan.id.in_(request.plan_ids))
+    elif request.origin_stockyard_id is not None:
+        query = query.filter(
+            models.FormationPlan.origin_stockyard_id == request.origin_stockyard_id,
+            models.FormationPlan.status == "Draft"
+        )
+    else:
+        raise HTTPException(status_code=400, detail="Provide plan_ids or origin_stockyard_id")
+    
+    plans = query.all()
+    plan_ids = [row.id for row in plans]
+    if not plan_ids:
+        raise HTTPException(status_code=404, detail="No matching plans found")
+    
+    task = optimize_formation_batch_task.apply_async(
+        args=(plan_ids, request.engine),
+        **optimization_queue_options(_wagon_pool(db, {row.origin_stockyard_id for row in plans})[0])
+    )
+    
+    return {
+        "job_id": task.id,
+        "plan_ids": plan_ids,
+        "status": "processing",
+        "message": "Batch optimization task started. Use job_id to check status."
+    }
 
 @app.get("/api/v1/plans/{plan_id}/optimize/status/{job_id}")
-def get_optimization_status(job_id: str):
-    """Check status of optimization job"""
-    from .celery_app import celery_app
+def get_optimization_status(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(RESULT_PAGE_SIZE, ge=1, le=RESULT_MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
+    """
+    Check status of optimization job. Assignments of a finished job, or of a
+    running job's latest incumbent, are read from the result store and paged
+    with offset/limit (assignments_total holds the full count).
+    """
     task_result = celery_app.AsyncResult(job_id)
     
     if task_result.ready():
         if task_result.successful():
             return {
                 "status": "completed",
-                "result": task_result.result
+                "result": _with_assignment_page(db, task_result.result, offset, limit)
             }
         else:
             return {
@@ -150,10 +297,96 @@ def get_optimization_status(job_id: str):
                 "error": str(task_result.info)
             }
     else:
-        return {
+        if task_result.state == 'PENDING':
+            # Unknown to the result backend: the Celery result may have
+            # expired while the stored result remains
+            summary = load_summary(db, job_id)
+            if summary is not None:
+                return {
+                    "status": "completed",
+                    "result": _with_assignment_page(db, summary, offset, limit)
+                }
+        info = task_result.info if isinstance(task_result.info, dict) else {}
+        response = {
             "status": "processing",
-            "progress": task_result.info.get('progress', 0) if isinstance(task_result.info, dict) else 0
+            "progress": info.get('progress', 0)
         }
+        if 'incumbent' in info:
+            response["incumbent"] = _with_assignment_page(db, info['incumbent'], offset, limit)
+        return response
+
+def _with_assignment_page(db: Session, result, offset: int, limit: int):
+    """A task result with one page of its stored assignments filled in"""
+    if not isinstance(result, dict) or 'result_ref' not in result:
+        return result
+    page = load_assignments(db, result['result_ref'], offset, limit)
+    assignments, total = page if page is not None else ([], result.get('assignments_total', 0))
+    return {**result, 'assignments': assignments, 'offset': offset, 'limit': limit, 'assignments_total': total}
+
+@app.post("/api/v1/plans/{plan_id}/optimize/cancel/{job_id}")
+def cancel_optimization(
+    plan_id: int,
+    job_id: str,
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Cancel an optimization job. A queued job never starts; a running one has
+    its solver interrupted within about a second and finishes with status
+    'cancelled' and the best incumbent found so far (not saved).
+    """
+    task_result = celery_app.AsyncResult(job_id)
+    if task_result.ready():
+        return {"job_id": job_id, "status": "completed", "message": "Job already finished"}
+    
+    try:
+        job_registry.request_stop(job_id, 'cancelled')
+    except Exception:
+        raise HTTPException(status_code=503, detail="Job registry unavailable; cannot cancel")
+    celery_app.control.revoke(job_id)
+    job_registry.release(plan_id, job_id)
+    
+    if task_result.state == 'PENDING':
+        # Still queued: no task will report completion, so do it here
+        from .job_events import job_events
+        job_events.publish(job_id, 'completion', {'status': 'cancelled', 'plan_id': plan_id})
+        return {"job_id": job_id, "status": "cancelled", "message": "Queued job cancelled"}
+    return {
+        "job_id": job_id,
+        "status": "cancelling",
+        "message": "Solver interrupted; the status endpoint reports the best incumbent shortly."
+    }
+
+@app.get("/api/v1/plans/{plan_id}/optimize/stream/{job_id}")
+async def stream_optimization_events(job_id: str):
+    """
+    Stream an optimization job's progress, incumbent and completion events
+    as Server-Sent Events (use with EventSource instead of polling the
+    status endpoint). The stream starts with the job's latest event and
+    closes after the completion event.
+    """
+    from .job_events import job_events, format_sse
+    
+    async def event_stream():
+        async for event in job_events.subscribe(job_id):
+            yield format_sse(event)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/v1/optimizer/cache/stats")
+def get_optimizer_cache_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """Optimization result cache counters, summed over the API and worker processes"""
+    from .optimization_cache import optimization_cache
+    return optimization_cache.stats()
+
+@app.get("/api/v1/predictions/cache/stats")
+def get_prediction_cache_stats(current_user: models.User = Depends(auth.get_current_user)):
+    """Prediction memo cache counters, summed over the API and worker processes"""
+    from .prediction_cache import prediction_cache
+    return prediction_cache.stats()
 
 # Tracking & Analytics endpoints
 @app.get("/api/v1/rakes/live")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, JSON, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -63,6 +63,7 @@ class FormationPlan(Base):
     priority = Column(String, default="Medium")
     projected_savings = Column(Float, default=0)
     time_savings_hours = Column(Float, default=0)
+    optimization_engine = Column(String)  # Solver engine override; None uses the default
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     submitted_at = Column(DateTime)
@@ -77,6 +78,25 @@ class PlanWagonAssignment(Base):
     sequence_order = Column(Integer, nullable=False)
     assigned_at = Column(DateTime, default=datetime.utcnow)
 
+class OptimizationResult(Base):
+    __tablename__ = "optimization_results"
+    
+    job_id = Column(String, primary_key=True)
+    plan_id = Column(Integer, ForeignKey("formation_plans.id"), index=True)  # None for batch jobs
+    status = Column(String, nullable=False)
+    summary = Column(JSON)  # The task result without its assignment list
+    assignment_count = Column(Integer, default=0)
+    assignments = Column(LargeBinary)  # Results stored before chunking: zlib-compressed JSON list
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class OptimizationResultChunk(Base):
+    __tablename__ = "optimization_result_chunks"
+    
+    job_id = Column(String, primary_key=True)
+    first_index = Column(Integer, primary_key=True)  # Position of the chunk's first assignment
+    count = Column(Integer, nullable=False)
+    assignments = Column(LargeBinary)  # zlib-compressed JSON list of assignments
+
 class Route(Base):
     __tablename__ = "routes"
     
@@ -89,6 +109,7 @@ class Route(Base):
     waypoints = Column(JSON)
     status = Column(String, default="Active")
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class RakeMovement(Base):
     __tablename__ = "rake_movements"
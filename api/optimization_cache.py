@@ -0,0 +1,233 @@
+"""
+Content-addressed cache of optimization results
+Identical optimizer inputs (wagons, orders, cost matrix, engine settings)
+hash to the same key, so repeated "optimize" clicks on unchanged plans are
+answered from the cache instead of re-solving.
+
+Backends (OPTIMIZER_CACHE_BACKEND):
+- memory: per-process LRU with TTL (default)
+- redis: shared between workers; entries expire via TTL and the server's
+  maxmemory-policy (allkeys-lru) handles LRU eviction
+- off: caching disabled
+
+Hit/miss/eviction counters are summed in Redis with either backend, since
+optimizations run in the Celery workers while stats are read by the API.
+Each process batches its increments and flushes them at most every
+OPTIMIZER_CACHE_STATS_FLUSH_SECONDS, so lookups do not wait on Redis.
+"""
+from collections import OrderedDict
+from typing import Dict, Optional, Any
+import atexit
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+CACHE_BACKEND = os.getenv("OPTIMIZER_CACHE_BACKEND", "memory")
+CACHE_TTL_SECONDS = int(os.getenv("OPTIMIZER_CACHE_TTL_SECONDS", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("OPTIMIZER_CACHE_MAX_ENTRIES", "256"))
+CACHE_REDIS_URL = os.getenv("OPTIMIZER_CACHE_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6000/0"))
+CACHE_KEY_PREFIX = "optimizer:result:"
+CACHE_STATS_KEY = "optimizer:cache_stats"
+CACHE_STATS_FLUSH_SECONDS = float(os.getenv("OPTIMIZER_CACHE_STATS_FLUSH_SECONDS", "10"))
+# Connect/read timeout so an unreachable Redis costs a lookup little time
+CACHE_REDIS_TIMEOUT_SECONDS = float(os.getenv("OPTIMIZER_CACHE_REDIS_TIMEOUT_SECONDS", "0.5"))
+
+
+def _json_default(value):
+    """Serialize NumPy scalars/arrays and anything else as plain JSON"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def compute_cache_key(optimizer, engine: str, **options) -> str:
+    """
+    Canonical SHA-256 over the optimizer inputs: wagons and orders as
+    sorted-key JSON, the normalized cost matrix as raw array bytes, and the
+    engine settings plus any per-call options (e.g. warm start).
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(optimizer.wagons, sort_keys=True, default=_json_default).encode())
+    digest.update(json.dumps(optimizer.orders, sort_keys=True, default=_json_default).encode())
+    
+    if optimizer.cost_matrix is not None:
+        dense = np.ascontiguousarray(optimizer.cost_matrix, dtype=np.float64)
+        digest.update(b'dense' + str(dense.shape).encode() + dense.tobytes())
+    else:
+        # Sort triplets so equal sparse matrices hash equally regardless of entry order
+        rows, cols, values = optimizer.cost_triplets
+        order = np.lexsort((cols, rows))
+        digest.update(b'sparse')
+        for array in (rows[order], cols[order], values[order]):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    
+    settings = {
+        'engine': engine,
+        'time_limit_seconds': optimizer.time_limit_seconds,
+        'num_workers': optimizer.num_workers,
+        'relative_gap': optimizer.relative_gap,
+        **options,
+    }
+    digest.update(json.dumps(settings, sort_keys=True, default=_json_default).encode())
+    return digest.hexdigest()
+
+
+class OptimizationCache:
+    """LRU + TTL result store with hit/miss counters"""
+    
+    def __init__(self, backend: str = CACHE_BACKEND, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 max_entries: int = CACHE_MAX_ENTRIES, redis_url: str = CACHE_REDIS_URL):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.redis_url = redis_url
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        self._redis = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._unflushed = {}  # counter -> increments not yet added in Redis
+        self._flushed_at = time.monotonic()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.backend != 'off'
+    
+    def _client(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(
+                self.redis_url,
+                socket_connect_timeout=CACHE_REDIS_TIMEOUT_SECONDS,
+                socket_timeout=CACHE_REDIS_TIMEOUT_SECONDS
+            )
+        return self._redis
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached result for key, or None (counted as a miss)"""
+        if not self.enabled:
+            return None
+        
+        result = None
+        expired = 0
+        if self.backend == 'redis':
+            try:
+                payload = self._client().get(CACHE_KEY_PREFIX + key)
+                if payload is not None:
+                    result = json.loads(payload)
+            except Exception:
+                # An unreachable cache must never fail the optimization
+                result = None
+        else:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    expires_at, cached = entry
+                    if expires_at > time.monotonic():
+                        self._entries.move_to_end(key)
+                        result = copy.deepcopy(cached)
+                    else:
+                        del self._entries[key]
+                        expired = 1
+        
+        self._count(hits=int(result is not None), misses=int(result is None), evictions=expired)
+        return result
+    
+    def set(self, key: str, result: Dict):
+        """Store a result under key with the configured TTL"""
+        if not self.enabled:
+            return
+        
+        if self.backend == 'redis':
+            payload = json.dumps(result, default=_json_default)
+            try:
+                self._client().setex(CACHE_KEY_PREFIX + key, self.ttl_seconds, payload)
+            except Exception:
+                pass
+            return
+        
+        # Round-trip through JSON so cached results never alias caller objects
+        cached = json.loads(json.dumps(result, default=_json_default))
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, cached)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._count(evictions=evicted)
+    
+    def _count(self, **increments: int):
+        """Add to this process's counters; the shared ones get them on the next flush"""
+        with self._lock:
+            for name, amount in increments.items():
+                if amount:
+                    setattr(self, name, getattr(self, name) + amount)
+                    self._unflushed[name] = self._unflushed.get(name, 0) + amount
+            due = time.monotonic() - self._flushed_at >= CACHE_STATS_FLUSH_SECONDS
+        if due:
+            self.flush_stats()
+    
+    def flush_stats(self):
+        """Add this process's unflushed counter increments to the shared ones in Redis"""
+        with self._lock:
+            unflushed, self._unflushed = self._unflushed, {}
+            self._flushed_at = time.monotonic()
+        if not unflushed:
+            return
+        try:
+            pipeline = self._client().pipeline()
+            for name, amount in unflushed.items():
+                pipeline.hincrby(CACHE_STATS_KEY, name, amount)
+            pipeline.execute()
+        except Exception:
+            # Counters are best effort: keep them for the next flush
+            with self._lock:
+                for name, amount in unflushed.items():
+                    self._unflushed[name] = self._unflushed.get(name, 0) + amount
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters summed over every process (from Redis), with this process's
+        own counters under 'process'. If Redis is unreachable the top-level
+        counters fall back to this process ('scope' says which).
+        Flushes this process's counters first.
+        """
+        self.flush_stats()
+        with self._lock:
+            local = {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+            entries = len(self._entries)
+        counters, scope = local, 'process'
+        try:
+            shared = self._client().hgetall(CACHE_STATS_KEY)
+            counters = {name: int(shared.get(name.encode(), 0)) for name in local}
+            scope = 'all processes'
+        except Exception:
+            pass
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'backend': self.backend,
+            'scope': scope,
+            **counters,
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0,
+            'ttl_seconds': self.ttl_seconds,
+            'process': {**local, 'entries': entries},
+        }
+
+
+# Global instance
+optimization_cache = OptimizationCache()
+atexit.register(optimization_cache.flush_stats)
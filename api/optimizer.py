@@ -1,124 +1,1116 @@
 """
 Google OR-Tools MIP Optimizer for Rake Formation
 This module implements the core optimization logic using Mixed-Integer Programming
+(SCIP) or constraint programming (CP-SAT with parallel search workers), plus a
+greedy heuristic with an LP lower bound for interactive requests
 """
 from ortools.linear_solver import pywraplp
-from typing import List, Dict, Tuple
+from ortools.sat.python import cp_model
+from typing import List, Dict, Tuple, Union, Optional, Callable, Any
 import numpy as np
+import math
+import multiprocessing
+import os
+import threading
+import time
+
+from .optimization_cache import optimization_cache, compute_cache_key
+
+DEFAULT_BASE_COST = 100.0      # Base cost for pairs missing from the cost matrix
+DELAY_PENALTY_PER_MIN = 50.0   # $50 per min of predicted delay
+MIN_FILL_RATIO = 0.95          # Orders must receive at least 95% of required capacity
+MAX_FILL_RATIO = 1.1           # ... and at most 110%
+
+# Solver engines: 'scip' (MIP via pywraplp), 'cpsat' (parallel CP-SAT) or
+# 'heuristic' (greedy + repair with an LP lower bound, for interactive use)
+ENGINES = ('scip', 'cpsat', 'heuristic')
+DEFAULT_ENGINE = os.getenv("OPTIMIZER_ENGINE", "scip")
+DEFAULT_TIME_LIMIT_SECONDS = float(os.getenv("OPTIMIZER_TIME_LIMIT_SECONDS", "60"))
+DEFAULT_NUM_WORKERS = int(os.getenv("OPTIMIZER_NUM_WORKERS", str(os.cpu_count() or 1)))
+DEFAULT_RELATIVE_GAP = float(os.getenv("OPTIMIZER_RELATIVE_GAP", "0.0"))
+# Seconds between should_stop checks while a solver runs
+STOP_POLL_SECONDS = float(os.getenv("OPTIMIZER_STOP_POLL_SECONDS", "0.25"))
+# Seconds an interrupted solver gets to return its incumbent before it is abandoned
+STOP_GRACE_SECONDS = float(os.getenv("OPTIMIZER_STOP_GRACE_SECONDS", "0.5"))
+# Run stoppable SCIP solves in a forked child process, so one that ignores an
+# interrupt is killed instead of burning CPU in an abandoned thread
+KILLABLE_SOLVES = os.getenv("OPTIMIZER_KILLABLE_SOLVES", "true").lower() == "true"
+# Seconds the heuristic engine gives its LP lower bound after the greedy
+# pass (0 skips the bound); about 0.3 s covers 1000 wagons
+HEURISTIC_BOUND_TIME_SECONDS = float(os.getenv("OPTIMIZER_HEURISTIC_BOUND_TIME_SECONDS", "1.0"))
+
+# CP-SAT works on integers: capacities in kg, costs in cents
+CAPACITY_SCALE = 1000
+COST_SCALE = 100
+SCALE_EPSILON = 1e-6
+# Variables/rows added between deadline checks of a time-boxed model build
+BUILD_CHUNK_SIZE = 4096
+
+CostMatrix = Union[Dict, np.ndarray, List[List[float]], Any]
+
+
+def normalize_cost_matrix(cost_matrix: CostMatrix, n_wagons: int, n_orders: int):
+    """
+    Convert any supported cost matrix format to numeric arrays.
+    
+    Accepted formats:
+    - dense 2D array / nested list of shape (wagons, orders)
+    - scipy.sparse matrix (implicit entries use DEFAULT_BASE_COST)
+    - {'rows': [...], 'cols': [...], 'values': [...]} sparse triplets
+    - legacy {"<w_idx>_<o_idx>": cost} dict (conversion shim)
+    
+    Returns (dense, triplets): exactly one of them is not None. Dense is a
+    float array of shape (n_wagons, n_orders); triplets is (rows, cols, values).
+    """
+    if cost_matrix is None:
+        return np.full((n_wagons, n_orders), DEFAULT_BASE_COST), None
+    
+    if hasattr(cost_matrix, 'tocoo'):
+        coo = cost_matrix.tocoo()
+        return None, (
+            np.asarray(coo.row, dtype=np.int64),
+            np.asarray(coo.col, dtype=np.int64),
+            np.asarray(coo.data, dtype=np.float64),
+        )
+    
+    if isinstance(cost_matrix, dict):
+        if {'rows', 'cols', 'values'} <= cost_matrix.keys():
+            return None, (
+                np.asarray(cost_matrix['rows'], dtype=np.int64),
+                np.asarray(cost_matrix['cols'], dtype=np.int64),
+                np.asarray(cost_matrix['values'], dtype=np.float64),
+            )
+        # Legacy string-keyed format; keys that are not "w_o" were never read
+        rows, cols, values = [], [], []
+        for key, value in cost_matrix.items():
+            w_part, sep, o_part = str(key).partition('_')
+            if sep and w_part.isdigit() and o_part.isdigit():
+                rows.append(int(w_part))
+                cols.append(int(o_part))
+                values.append(float(value))
+        return None, (
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(cols, dtype=np.int64),
+            np.asarray(values, dtype=np.float64),
+        )
+    
+    dense = np.asarray(cost_matrix, dtype=np.float64)
+    if dense.shape != (n_wagons, n_orders):
+        raise ValueError(
+            f"cost_matrix shape {dense.shape} does not match "
+            f"({n_wagons} wagons, {n_orders} orders)"
+        )
+    return dense, None
+
+
+class _IncumbentCallback(cp_model.CpSolverSolutionCallback):
+    """Forwards every improving CP-SAT solution as selected pair indices"""
+    
+    def __init__(self, x, publish: Callable):
+        super().__init__()
+        self._x = x
+        self._publish = publish
+    
+    def on_solution_callback(self):
+        selected = [p_idx for p_idx, var in enumerate(self._x) if self.BooleanValue(var)]
+        self._publish(
+            selected,
+            self.ObjectiveValue() / COST_SCALE,
+            self.BestObjectiveBound() / COST_SCALE,
+        )
+
+
+class _SolveWatcher:
+    """
+    Runs a solve in a helper thread and polls should_stop meanwhile. Once it
+    returns a reason the solver is interrupted (SCIP/GLOP InterruptSolve,
+    CP-SAT StopSearch) and normally returns its best incumbent. SCIP only
+    notices interrupts between its internal steps, so a solve that has not
+    returned STOP_GRACE_SECONDS later is abandoned (it winds down in the
+    background) and run() returns None.
+    """
+    
+    def __init__(self, should_stop: Optional[Callable[[], Optional[str]]], interrupt: Callable):
+        self.should_stop = should_stop
+        self.interrupt = interrupt
+        self.reason = None
+        self.abandoned = False
+    
+    def _check(self) -> Optional[str]:
+        try:
+            return self.should_stop()
+        except Exception:
+            return None
+    
+    def run(self, solve: Callable):
+        if self.should_stop is None:
+            return solve()
+        # Stopped while the model was being built
+        self.reason = self._check()
+        if self.reason:
+            self.abandoned = True
+            return None
+        
+        outcome = {}
+        
+        def target():
+            try:
+                outcome['value'] = solve()
+            except BaseException as e:
+                outcome['error'] = e
+        
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        interrupted_at = None
+        while True:
+            thread.join(STOP_POLL_SECONDS)
+            if not thread.is_alive():
+                break
+            if interrupted_at is None:
+                self.reason = self._check()
+                if self.reason:
+                    interrupted_at = time.monotonic()
+                    self.interrupt()
+            elif time.monotonic() - interrupted_at >= STOP_GRACE_SECONDS:
+                self.abandoned = True
+                return None
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['value']
+
+
+def _finite(bound: float, penalty: float = 0.0) -> Optional[float]:
+    """A solver's bound, or None when it is infinite or includes unserved-order penalties"""
+    return bound if not penalty and math.isfinite(bound) else None
+
+
+def _call_in_subprocess(solve: Callable, should_stop: Callable[[], Optional[str]]) -> Optional[Dict]:
+    """
+    Run solve() (which returns a picklable result) in a forked child process
+    and poll should_stop meanwhile. The child handles the stop itself (see
+    _SolveWatcher) and exits, taking an abandoned solver thread with it; a
+    child still running 2 * STOP_GRACE_SECONDS after the stop is killed and
+    None is returned. Calls solve() in-process when no child can be started
+    (e.g. in a daemonic process).
+    """
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    
+    def target():
+        try:
+            sender.send(('value', solve()))
+        except BaseException as e:
+            sender.send(('error', e))
+    
+    process = context.Process(target=target, daemon=True)
+    try:
+        process.start()
+    except (OSError, AssertionError):
+        receiver.close()
+        sender.close()
+        return solve()
+    sender.close()
+    stopped_at = None
+    try:
+        while True:
+            if receiver.poll(STOP_POLL_SECONDS):
+                kind, value = receiver.recv()
+                if kind == 'error':
+                    raise value
+                return value
+            if not process.is_alive():
+                raise RuntimeError(f"Solver process exited with code {process.exitcode}")
+            if stopped_at is None:
+                try:
+                    if should_stop():
+                        stopped_at = time.monotonic()
+                except Exception:
+                    pass
+            elif time.monotonic() - stopped_at >= 2 * STOP_GRACE_SECONDS:
+                return None
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        receiver.close()
+
 
 class RakeFormationOptimizer:
-    def __init__(self, wagons: List[Dict], orders: List[Dict], cost_matrix: Dict):
+    def __init__(
+        self,
+        wagons: List[Dict],
+        orders: List[Dict],
+        cost_matrix: CostMatrix,
+        engine: Optional[str] = None,
+        time_limit_seconds: Optional[float] = None,
+        num_workers: Optional[int] = None,
+        relative_gap: Optional[float] = None,
+        use_cache: bool = True,
+        should_stop: Optional[Callable[[], Optional[str]]] = None,
+        partial: bool = False,
+    ):
         self.wagons = wagons
         self.orders = orders
-        self.cost_matrix = cost_matrix
-        self.solver = pywraplp.Solver.CreateSolver('SCIP')
-        
-    def optimize(self) -> Dict:
-        """
-        Execute MIP optimization for rake formation
-        Returns optimal assignment of wagons to orders
+        self.cost_matrix, self.cost_triplets = normalize_cost_matrix(
+            cost_matrix, len(wagons), len(orders)
+        )
+        self.engine = (engine or DEFAULT_ENGINE).lower()
+        self.time_limit_seconds = (
+            DEFAULT_TIME_LIMIT_SECONDS if time_limit_seconds is None else time_limit_seconds
+        )
+        self.num_workers = num_workers or DEFAULT_NUM_WORKERS
+        self.relative_gap = DEFAULT_RELATIVE_GAP if relative_gap is None else relative_gap
+        self.use_cache = use_cache
+        self.should_stop = should_stop
+        self.partial = partial
+    
+    def optimize(
+        self,
+        engine: Optional[str] = None,
+        on_solution: Optional[Callable[[Dict], None]] = None,
+        warm_start: Optional[Dict[Any, Any]] = None,
+        fix_warm_start: bool = False,
+    ) -> Dict:
         """
-        if not self.solver:
-            return {"error": "Solver not available"}
+        Execute optimization for rake formation with the selected engine
+        ('scip' MIP, 'cpsat' constraint programming or the fast 'heuristic').
+        Returns the optimal assignment of wagons to orders, or the best
+        incumbent when a time/gap limit stops the search first.
         
-        # Decision variables: x[w,o] = 1 if wagon w is assigned to order o
-        x = {}
-        for w_idx, wagon in enumerate(self.wagons):
-            for o_idx, order in enumerate(self.orders):
-                x[(w_idx, o_idx)] = self.solver.BoolVar(f'x_{w_idx}_{o_idx}')
+        on_solution (anytime mode) is called with every improving incumbent
+        as it is found. pywraplp exposes no solution callbacks, so with SCIP
+        it only receives the final solution.
         
-        # Constraint 1: Each wagon assigned to at most one order
-        for w_idx in range(len(self.wagons)):
-            self.solver.Add(
-                sum(x[(w_idx, o_idx)] for o_idx in range(len(self.orders))) <= 1
+        warm_start maps wagon_id -> order_id from a previous solution and is
+        passed to the solver as a hint. With fix_warm_start, hinted pairs that
+        are still feasible are fixed to 1 as long as their capacity fits the
+        order's 110% maximum, so only the changed part of the fleet is searched.
+        If no assignment completes the fixed pairs, the solve is repeated with
+        the hint alone ('fixed': 0 in the warm_start report).
+        
+        Results are cached by a hash of all inputs and settings (see
+        optimization_cache); a hit returns immediately with 'cached': True.
+        
+        should_stop (set at construction) is polled every STOP_POLL_SECONDS
+        during the solve; once it returns a reason (e.g. 'cancelled') the
+        solver is interrupted and the result carries 'interrupted': reason,
+        with the best incumbent as a 'feasible' solution or, when none was
+        found yet, status 'interrupted'. It must be picklable for decomposed
+        solves. Interrupted results are not cached.
+        
+        Status 'infeasible' means the solver proved that no assignment
+        exists. A solve that ends (time limit, abandoned) without any
+        solution and without that proof has status 'no_solution' and keeps
+        the best bound found.
+        
+        With partial (set at construction) an order may be left empty instead
+        of making the whole problem infeasible: serving as many orders as
+        possible outranks cost, and the orders left empty are listed in
+        'unserved_order_ids'. Status is 'infeasible' only when no order can
+        be served. Orders left empty by a solution that is not proven
+        optimal may still be servable; they are listed in
+        'unsolved_order_ids' instead (as are all orders of a 'no_solution'
+        result).
+        """
+        engine = (engine or self.engine).lower()
+        if engine not in ENGINES:
+            return {"error": f"Unknown optimization engine '{engine}'. Use one of: {', '.join(ENGINES)}"}
+        
+        cache_key = None
+        if self.use_cache and optimization_cache.enabled:
+            cache_key = compute_cache_key(
+                self, engine, warm_start=warm_start, fix_warm_start=fix_warm_start, partial=self.partial
             )
+            cached = optimization_cache.get(cache_key)
+            if cached is not None:
+                cached['cached'] = True
+                if on_solution is not None and cached.get('assignments'):
+                    on_solution(cached)
+                return cached
         
-        # Constraint 2: Order capacity constraints
-        for o_idx, order in enumerate(self.orders):
-            total_capacity = sum(
-                x[(w_idx, o_idx)] * self.wagons[w_idx].get('capacity_tonnes', 0)
-                for w_idx in range(len(self.wagons))
+        result = self._optimize(engine, on_solution, warm_start, fix_warm_start)
+        if cache_key is not None and 'error' not in result and not result.get('interrupted'):
+            optimization_cache.set(cache_key, result)
+        return result
+    
+    def _optimize(self, engine, on_solution, warm_start, fix_warm_start) -> Dict:
+        """Build and solve the model (uncached); see optimize()"""
+        start = time.perf_counter()
+        
+        # Only feasible (wagon, order) pairs get a decision variable, so the
+        # model grows with compatible pairs instead of wagons x orders.
+        # wagon_pairs / order_pairs hold indices into pairs.
+        pairs = self._compatible_pairs()
+        wagon_pairs = [[] for _ in self.wagons]
+        order_pairs = [[] for _ in self.orders]
+        for p_idx, (w_idx, o_idx) in enumerate(pairs):
+            wagon_pairs[w_idx].append(p_idx)
+            order_pairs[o_idx].append(p_idx)
+        costs = self._pair_costs(pairs)
+        # Partial mode: orders that cannot reach their minimum stay empty
+        empty = self._unreachable_orders(pairs) if self.partial else None
+        
+        hinted = self._warm_start_pairs(pairs, warm_start) if warm_start else set()
+        fixed = self._safe_fixed_pairs(pairs, hinted) if fix_warm_start else set()
+        
+        def publish(selected, objective, bound):
+            if on_solution is not None:
+                incumbent = self._solution_payload(pairs, costs, selected, objective, bound, proven=False)
+                incumbent.update(engine=engine, elapsed_seconds=round(time.perf_counter() - start, 4))
+                on_solution(incumbent)
+        
+        def solve(penalty, fixed):
+            if engine == 'cpsat':
+                return self._solve_cpsat(pairs, wagon_pairs, order_pairs, costs, hinted, fixed, publish, empty, penalty)
+            if engine == 'heuristic':
+                return self._solve_heuristic(pairs, wagon_pairs, order_pairs, costs, hinted, fixed)
+            return self._killable(
+                lambda: self._solve_scip(pairs, wagon_pairs, order_pairs, costs, hinted, fixed, empty, penalty)
             )
-            # Ensure we meet minimum requirement but don't exceed max
-            required = order.get('required_capacity', 0)
-            self.solver.Add(total_capacity >= required * 0.95)  # 95% minimum
-            self.solver.Add(total_capacity <= required * 1.1)   # 110% maximum
         
-        # Constraint 3: Wagon type compatibility
-        for w_idx, wagon in enumerate(self.wagons):
-            for o_idx, order in enumerate(self.orders):
-                wagon_type = wagon.get('wagon_type', '')
-                compatible_types = order.get('compatible_wagon_types', [])
-                if compatible_types and wagon_type not in compatible_types:
-                    self.solver.Add(x[(w_idx, o_idx)] == 0)
-        
-        # Constraint 4: Stockyard capacity (prevent overloading sidings)
-        stockyard_loads = {}
-        for w_idx, wagon in enumerate(self.wagons):
-            stockyard_id = wagon.get('current_stockyard_id')
-            if stockyard_id:
-                if stockyard_id not in stockyard_loads:
-                    stockyard_loads[stockyard_id] = []
-                for o_idx in range(len(self.orders)):
-                    stockyard_loads[stockyard_id].append(x[(w_idx, o_idx)])
+        def resolve(solution, penalty, fixed):
+            first_seconds = solution['solve_seconds']
+            solution = solve(penalty, fixed)
+            if 'solve_seconds' in solution:
+                solution['solve_seconds'] += first_seconds
+            return solution
         
-        # Objective function: Minimize total cost
-        objective = self.solver.Objective()
-        for w_idx, wagon in enumerate(self.wagons):
-            for o_idx, order in enumerate(self.orders):
-                # Cost factors: distance, delay penalty, material handling
-                base_cost = self.cost_matrix.get(f"{w_idx}_{o_idx}", 100)
-                delay_penalty = wagon.get('predicted_delay', 0) * 50  # $50 per min delay
-                material_cost = wagon.get('material_handling_cost', 0)
-                
-                total_cost = base_cost + delay_penalty + material_cost
-                objective.SetCoefficient(x[(w_idx, o_idx)], total_cost)
+        solution = solve(0.0, fixed)
+        if (fixed and not solution.get('interrupted') and (solution.get('status') == 'infeasible' or (
+                engine == 'heuristic' and solution.get('status') == 'no_solution'))):
+            # The fixed wagons cannot be completed to a feasible assignment
+            # (e.g. they overshoot what the other wagons can make up for):
+            # keep the previous solution as a hint only
+            fixed = set()
+            solution = resolve(solution, 0.0, fixed)
+        if (self.partial and engine != 'heuristic' and solution.get('status') == 'infeasible'
+                and not solution.get('interrupted')):
+            # Proven: the servable orders do not fit together, so let the
+            # solver choose which to leave empty (served flags with a
+            # penalty). A solve that only ran out of time is not retried.
+            solution = resolve(solution, self._unserved_penalty(pairs, costs), fixed)
+        if engine != 'cpsat' and solution.get('selected'):
+            publish(solution['selected'], solution['objective'], solution['bound'])
+        if 'error' in solution:
+            return solution
+        if (self.partial and solution['status'] in ('optimal', 'feasible') and not solution['selected']
+                and self._unserved_orders(pairs, [])):
+            # Partial mode always has the empty solution; it is no answer
+            # (and only proves infeasibility when it is optimal)
+            status = 'infeasible' if solution['status'] == 'optimal' else 'no_solution'
+            solution = {**solution, 'status': status, 'objective': None, 'bound': None}
+        total_time = time.perf_counter() - start
         
-        objective.SetMinimization()
+        report = {
+            'engine': engine,
+            'model_build_seconds': round(total_time - solution['solve_seconds'], 4),
+            'solve_time_seconds': round(solution['solve_seconds'], 4),
+        }
+        if warm_start:
+            report['warm_start'] = self._warm_start_report(
+                pairs, warm_start, hinted, fixed, solution['selected']
+            )
         
-        # Solve
-        status = self.solver.Solve()
+        if solution.get('interrupted'):
+            report['interrupted'] = solution['interrupted']
+            if not solution['selected']:
+                return {
+                    'status': 'interrupted',
+                    'message': f"Solve stopped ({solution['interrupted']}) before a feasible solution was found",
+                    'assignments': [],
+                    'objective_value': None,
+                    'best_bound': solution['bound'],
+                    'gap': None,
+                    **report
+                }
+            return {
+                'status': 'feasible',
+                'message': f"Solve stopped ({solution['interrupted']}); returning the best incumbent",
+                **self._solution_payload(
+                    pairs, costs, solution['selected'], solution['objective'], solution['bound'], proven=False
+                ),
+                **report
+            }
         
-        if status == pywraplp.Solver.OPTIMAL:
-            assignments = []
-            total_cost = 0
-            
-            for w_idx, wagon in enumerate(self.wagons):
-                for o_idx, order in enumerate(self.orders):
-                    if x[(w_idx, o_idx)].solution_value() > 0.5:
-                        assignments.append({
-                            'wagon_id': wagon['id'],
-                            'order_id': order.get('id'),
-                            'sequence_order': len(assignments) + 1,
-                            'capacity_allocated': wagon.get('capacity_tonnes', 0)
-                        })
-                        total_cost += (
-                            self.cost_matrix.get(f"{w_idx}_{o_idx}", 100) +
-                            wagon.get('predicted_delay', 0) * 50 +
-                            wagon.get('material_handling_cost', 0)
-                        )
-            
+        if solution['status'] == 'optimal':
             return {
                 'status': 'optimal',
-                'assignments': assignments,
-                'total_cost': total_cost,
-                'cost_savings': self._calculate_savings(total_cost),
-                'time_savings_hours': self._calculate_time_savings(assignments)
+                **self._solution_payload(pairs, costs, solution['selected'], solution['objective'], solution['bound']),
+                **report
             }
         
-        elif status == pywraplp.Solver.FEASIBLE:
+        elif solution['status'] == 'feasible':
             return {
                 'status': 'feasible',
-                'message': 'Found feasible solution but not optimal',
-                'assignments': []
+                'message': (
+                    'Found feasible solution but not proven optimal (time or gap limit reached)'
+                    if engine != 'heuristic' else
+                    'Heuristic solution; gap is measured against the LP lower bound'
+                    if solution['bound'] is not None else
+                    'Heuristic solution; no LP lower bound within the time budget'
+                ),
+                **self._solution_payload(
+                    pairs, costs, solution['selected'], solution['objective'], solution['bound'], proven=False
+                ),
+                **report
+            }
+        elif solution['status'] == 'no_solution':
+            return {
+                'status': 'no_solution',
+                'message': (
+                    'Heuristic found no feasible assignment; retry with the scip or cpsat engine'
+                    if engine == 'heuristic' else
+                    'No solution found within the time limit; the problem was not proven infeasible'
+                ),
+                'assignments': [],
+                'objective_value': None,
+                'best_bound': solution['bound'],
+                'gap': None,
+                **({'unserved_order_ids': [], 'unsolved_order_ids': self._order_ids(self._unserved_orders(pairs, []))}
+                   if self.partial else {}),
+                **report
             }
         else:
             return {
                 'status': 'infeasible',
                 'message': 'No feasible solution found. Check constraints.',
-                'assignments': []
+                'assignments': [],
+                'objective_value': None,
+                'best_bound': None,
+                'gap': None,
+                **({'unserved_order_ids': self._order_ids(self._unserved_orders(pairs, []))} if self.partial else {}),
+                **report
             }
     
+    def _solution_payload(self, pairs, costs, selected, objective, bound, proven=True) -> Dict:
+        """
+        Assignments, cost figures, objective and bound for a set of selected
+        pairs. In partial mode a solution that is not proven optimal only
+        counts orders that cannot reach their minimum as unserved; its other
+        empty orders are unsolved.
+        """
+        assignments = []
+        total_cost = 0
+        
+        for p_idx in selected:
+            w_idx, o_idx = pairs[p_idx]
+            wagon = self.wagons[w_idx]
+            assignments.append({
+                'wagon_id': wagon['id'],
+                'order_id': self.orders[o_idx].get('id'),
+                'sequence_order': len(assignments) + 1,
+                'capacity_allocated': wagon.get('capacity_tonnes', 0)
+            })
+            total_cost += float(costs[p_idx])
+        
+        payload = {
+            'assignments': assignments,
+            'total_cost': total_cost,
+            'cost_savings': self._calculate_savings(total_cost),
+            'time_savings_hours': self._calculate_time_savings(assignments),
+            'objective_value': objective,
+            'best_bound': bound,
+            'gap': self._relative_gap(objective, bound),
+        }
+        if self.partial:
+            unserved = self._unserved_orders(pairs, selected)
+            unsolved = []
+            if not proven:
+                unreachable = self._unreachable_orders(pairs)
+                unsolved = [o_idx for o_idx in unserved if not unreachable[o_idx]]
+                unserved = [o_idx for o_idx in unserved if unreachable[o_idx]]
+            payload['unserved_order_ids'] = self._order_ids(unserved)
+            payload['unsolved_order_ids'] = self._order_ids(unsolved)
+        return payload
+    
+    def _killable(self, solve: Callable) -> Dict:
+        """
+        Run a stoppable solve in a child process (KILLABLE_SOLVES), or
+        in-process when nothing can stop it
+        """
+        if self.should_stop is None or not KILLABLE_SOLVES:
+            return solve()
+        start = time.perf_counter()
+        result = _call_in_subprocess(solve, self.should_stop)
+        if result is None:
+            # Killed after ignoring the stop: no incumbent
+            try:
+                reason = self.should_stop()
+            except Exception:
+                reason = None
+            result = {'status': 'no_solution', 'selected': [], 'objective': None, 'bound': None,
+                      'solve_seconds': time.perf_counter() - start, 'interrupted': reason or 'stopped'}
+        return result
+    
+    def _unserved_orders(self, pairs, selected) -> List[int]:
+        """Indices of orders that need capacity but got no wagon in selected"""
+        served = {pairs[p_idx][1] for p_idx in selected}
+        return [
+            o_idx for o_idx, order in enumerate(self.orders)
+            if o_idx not in served and (order.get('required_capacity', 0) or 0) > 0
+        ]
+    
+    def _unreachable_orders(self, pairs) -> np.ndarray:
+        """Mask of orders whose candidate wagons together fall short of the minimum"""
+        reachable = np.zeros(len(self.orders))
+        if pairs:
+            pair_idx = np.array(pairs, dtype=np.int64)
+            capacities = np.fromiter(
+                (wagon.get('capacity_tonnes', 0) or 0 for wagon in self.wagons),
+                dtype=np.float64, count=len(self.wagons)
+            )
+            np.add.at(reachable, pair_idx[:, 1], capacities[pair_idx[:, 0]])
+        required = np.fromiter(
+            (order.get('required_capacity', 0) or 0 for order in self.orders),
+            dtype=np.float64, count=len(self.orders)
+        )
+        return reachable < required * MIN_FILL_RATIO - SCALE_EPSILON
+    
+    def _order_ids(self, o_indices: List[int]) -> List[Any]:
+        return [self.orders[o_idx].get('id') for o_idx in o_indices]
+    
+    def _unserved_penalty(self, pairs, costs) -> float:
+        """
+        Objective penalty per unserved order in partial mode: more than the
+        cost spread of any assignment (each wagon counted once at its
+        costliest pair), so serving one more order always wins
+        """
+        if not pairs:
+            return 1.0
+        spread = np.zeros(len(self.wagons))
+        np.maximum.at(spread, np.array([w_idx for w_idx, _ in pairs]), np.abs(costs))
+        return float(2 * spread.sum() + 1.0)
+    
+    def _without_penalty(self, pairs, selected, objective, bound, penalty, proven=False):
+        """
+        Objective and bound in cost terms, without the unserved-order
+        penalties. The shifted bound only holds for a proven optimum, so it
+        is None for other solutions that leave orders empty.
+        """
+        if not penalty or objective is None:
+            return objective, bound
+        unserved = len(self._unserved_orders(pairs, selected))
+        if not unserved:
+            return objective, bound
+        return objective - penalty * unserved, (bound - penalty * unserved if proven else None)
+    
+    def _build_linear_model(self, solver, pairs, wagon_pairs, order_pairs, costs, integer=True, deadline=None,
+                            empty=None, penalty=0.0):
+        """
+        Add the assignment model to a pywraplp solver: boolean variables for
+        the MIP, or [0, 1] continuous ones for the LP relaxation. Orders in
+        the empty mask get no wagons; a penalty (partial mode) adds a served
+        flag per other order and charges the penalty for each one left empty.
+        Returns (x, objective), or None once time.perf_counter() passes the
+        optional deadline (the solver is then incomplete)
+        """
+        # Decision variables: x[p] = 1 if wagon w is assigned to order o for pairs[p] = (w, o)
+        # Rows and coefficients go through the low-level API; the natural
+        # expression API costs more than the solve on large fleets
+        x = []
+        for chunk_start in range(0, len(pairs), BUILD_CHUNK_SIZE):
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            chunk_end = min(chunk_start + BUILD_CHUNK_SIZE, len(pairs))
+            x.extend(solver.NumVar(0.0, 1.0, '') for _ in range(chunk_start, chunk_end))
+        if integer:
+            for var in x:
+                var.SetInteger(True)
+        
+        # Constraint 1: Each wagon assigned to at most one order
+        for w_idx, p_indices in enumerate(wagon_pairs):
+            if deadline is not None and w_idx % BUILD_CHUNK_SIZE == 0 and time.perf_counter() >= deadline:
+                return None
+            if len(p_indices) > 1:
+                row = solver.RowConstraint(0, 1, '')
+                for p_idx in p_indices:
+                    row.SetCoefficient(x[p_idx], 1)
+        
+        # Constraint 2: Order capacity constraints
+        capacities = [wagon.get('capacity_tonnes', 0) for wagon in self.wagons]
+        served = [solver.NumVar(0.0, 1.0, '') for _ in self.orders] if penalty else []
+        if integer:
+            for var in served:
+                var.SetInteger(True)
+        for o_idx, order in enumerate(self.orders):
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            # Ensure we meet minimum requirement (95%) but don't exceed max (110%)
+            required = order.get('required_capacity', 0)
+            if empty is not None and empty[o_idx]:
+                rows = [solver.RowConstraint(0, 0, '')]
+                if served:
+                    served[o_idx].SetUb(0)
+            elif not served:
+                rows = [solver.RowConstraint(required * MIN_FILL_RATIO, required * MAX_FILL_RATIO, '')]
+            else:
+                # Partial mode: the window applies to served orders, others stay empty
+                rows = [solver.RowConstraint(0, solver.infinity(), ''), solver.RowConstraint(-solver.infinity(), 0, '')]
+                rows[0].SetCoefficient(served[o_idx], -required * MIN_FILL_RATIO)
+                rows[1].SetCoefficient(served[o_idx], -required * MAX_FILL_RATIO)
+            for row in rows:
+                for p_idx in order_pairs[o_idx]:
+                    row.SetCoefficient(x[p_idx], capacities[pairs[p_idx][0]])
+        
+        # Constraint 3: Wagon type compatibility is enforced by construction,
+        # incompatible pairs never get a variable (see _compatible_pairs)
+        
+        # Objective function: Minimize total cost
+        objective = solver.Objective()
+        for var, cost in zip(x, costs.tolist()):
+            objective.SetCoefficient(var, cost)
+        # penalty * (1 - served) per order
+        for var in served:
+            objective.SetCoefficient(var, -penalty)
+        objective.SetOffset(penalty * len(served))
+        objective.SetMinimization()
+        return x, objective
+    
+    def _solve_scip(self, pairs, wagon_pairs, order_pairs, costs, hinted=(), fixed=(), empty=None,
+                    penalty=0.0) -> Dict:
+        """Build and solve the MIP with SCIP through pywraplp"""
+        solver = pywraplp.Solver.CreateSolver('SCIP')
+        if not solver:
+            return {"error": "Solver not available"}
+        
+        x, objective = self._build_linear_model(
+            solver, pairs, wagon_pairs, order_pairs, costs, empty=empty, penalty=penalty
+        )
+        
+        # Warm start: fix safe pairs and hint a complete previous solution
+        for p_idx in fixed:
+            x[p_idx].SetLb(1)
+        if hinted:
+            solver.SetHint(x, [1.0 if p_idx in hinted else 0.0 for p_idx in range(len(x))])
+        
+        # Solve within the configured wall-clock limit and gap
+        if self.time_limit_seconds:
+            solver.SetTimeLimit(int(self.time_limit_seconds * 1000))
+        params = pywraplp.MPSolverParameters()
+        params.SetDoubleParam(params.RELATIVE_MIP_GAP, self.relative_gap)
+        solve_start = time.perf_counter()
+        watcher = _SolveWatcher(self.should_stop, solver.InterruptSolve)
+        status = watcher.run(lambda: solver.Solve(params))
+        solve_seconds = time.perf_counter() - solve_start
+        
+        if watcher.abandoned or status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+            # Only INFEASIBLE is a proof; a limit or stop without an incumbent is no answer
+            proven = not watcher.abandoned and status == pywraplp.Solver.INFEASIBLE
+            return {'status': 'infeasible' if proven else 'no_solution', 'selected': [], 'objective': None,
+                    'bound': None if watcher.abandoned or proven else _finite(objective.BestBound(), penalty),
+                    'solve_seconds': solve_seconds, 'interrupted': watcher.reason}
+        
+        # SCIP reports FEASIBLE with the incumbent when the time limit hits
+        # or the solve is interrupted
+        selected = [p_idx for p_idx, var in enumerate(x) if var.solution_value() > 0.5]
+        objective_value, bound = self._without_penalty(
+            pairs, selected, objective.Value(), objective.BestBound(), penalty,
+            proven=status == pywraplp.Solver.OPTIMAL
+        )
+        return {
+            'status': 'optimal' if status == pywraplp.Solver.OPTIMAL else 'feasible',
+            'selected': selected,
+            'objective': objective_value,
+            'bound': bound,
+            'solve_seconds': solve_seconds,
+            'interrupted': watcher.reason if status != pywraplp.Solver.OPTIMAL else None,
+        }
+    
+    def _solve_cpsat(self, pairs, wagon_pairs, order_pairs, costs, hinted=(), fixed=(), publish=None,
+                     empty=None, penalty=0.0) -> Dict:
+        """
+        Build and solve the same model with CP-SAT. All variables are boolean,
+        so capacities and costs are scaled to integers and the search runs on
+        several parallel workers. publish(selected, objective, bound) receives
+        every improving solution.
+        """
+        model = cp_model.CpModel()
+        x = [model.NewBoolVar(f'x_{w_idx}_{o_idx}') for w_idx, o_idx in pairs]
+        
+        # Constraint 1: Each wagon assigned to at most one order
+        for p_indices in wagon_pairs:
+            if len(p_indices) > 1:
+                model.AddAtMostOne([x[p_idx] for p_idx in p_indices])
+        
+        # Constraint 2: Order capacity constraints on integer capacities
+        capacities = [
+            int(round(wagon.get('capacity_tonnes', 0) * CAPACITY_SCALE)) for wagon in self.wagons
+        ]
+        served = [model.NewBoolVar(f'served_{o_idx}') for o_idx in range(len(self.orders))] if penalty else []
+        for o_idx, order in enumerate(self.orders):
+            total_capacity = sum(
+                capacities[pairs[p_idx][0]] * x[p_idx] for p_idx in order_pairs[o_idx]
+            )
+            required = order.get('required_capacity', 0) * CAPACITY_SCALE
+            min_capacity = math.ceil(required * MIN_FILL_RATIO - SCALE_EPSILON)
+            max_capacity = math.floor(required * MAX_FILL_RATIO + SCALE_EPSILON)
+            if empty is not None and empty[o_idx]:
+                model.Add(total_capacity == 0)
+                if served:
+                    model.Add(served[o_idx] == 0)
+            elif not served:
+                model.Add(total_capacity >= min_capacity)
+                model.Add(total_capacity <= max_capacity)
+            elif not order_pairs[o_idx]:
+                model.Add(served[o_idx] == int(min_capacity <= 0))
+            else:
+                # Partial mode: the window applies to served orders, others stay empty
+                model.Add(total_capacity >= min_capacity).OnlyEnforceIf(served[o_idx])
+                model.Add(total_capacity <= max_capacity).OnlyEnforceIf(served[o_idx])
+                model.Add(total_capacity == 0).OnlyEnforceIf(served[o_idx].Not())
+        
+        # Objective function: Minimize total cost in integer cost units, plus
+        # penalty * (1 - served) per order in partial mode
+        scaled_costs = np.rint(costs * COST_SCALE).astype(np.int64).tolist()
+        scaled_penalty = int(math.ceil(penalty * COST_SCALE))
+        model.Minimize(
+            sum(cost * var for cost, var in zip(scaled_costs, x)) +
+            sum(scaled_penalty * (1 - var) for var in served)
+        )
+        
+        def publish_solution(selected, objective, bound):
+            # An abandoned search may still call back; it no longer speaks for the job
+            if watcher.abandoned:
+                return
+            publish(selected, *self._without_penalty(pairs, selected, objective, bound, scaled_penalty / COST_SCALE))
+        
+        # Warm start: fix safe pairs and hint a complete previous solution
+        for p_idx in fixed:
+            model.Add(x[p_idx] == 1)
+        if hinted:
+            for p_idx, var in enumerate(x):
+                model.AddHint(var, p_idx in hinted)
+        
+        solver = cp_model.CpSolver()
+        solver.parameters.num_workers = self.num_workers
+        if self.time_limit_seconds:
+            solver.parameters.max_time_in_seconds = float(self.time_limit_seconds)
+        solver.parameters.relative_gap_limit = self.relative_gap
+        watcher = _SolveWatcher(self.should_stop, solver.StopSearch)
+        callback = _IncumbentCallback(x, publish_solution) if publish else None
+        solve_start = time.perf_counter()
+        status = watcher.run(lambda: solver.Solve(model, callback))
+        solve_seconds = time.perf_counter() - solve_start
+        
+        if watcher.abandoned or status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            # Only INFEASIBLE is a proof; UNKNOWN (time limit or stop) is no answer
+            proven = not watcher.abandoned and status == cp_model.INFEASIBLE
+            return {'status': 'infeasible' if proven else 'no_solution', 'selected': [], 'objective': None,
+                    'bound': None if watcher.abandoned or proven else
+                    _finite(solver.BestObjectiveBound() / COST_SCALE, penalty),
+                    'solve_seconds': solve_seconds, 'interrupted': watcher.reason}
+        
+        # FEASIBLE means the time/gap limit stopped the search; the solver
+        # still holds the best incumbent found
+        selected = [p_idx for p_idx, var in enumerate(x) if solver.BooleanValue(var)]
+        objective_value, bound = self._without_penalty(
+            pairs, selected, solver.ObjectiveValue() / COST_SCALE, solver.BestObjectiveBound() / COST_SCALE,
+            scaled_penalty / COST_SCALE, proven=status == cp_model.OPTIMAL
+        )
+        return {
+            'status': 'optimal' if status == cp_model.OPTIMAL else 'feasible',
+            'selected': selected,
+            'objective': objective_value,
+            'bound': bound,
+            'solve_seconds': solve_seconds,
+            'interrupted': watcher.reason if status != cp_model.OPTIMAL else None,
+        }
+    
+    def _solve_heuristic(self, pairs, wagon_pairs, order_pairs, costs, hinted=(), fixed=()) -> Dict:
+        """
+        Fast heuristic for interactive requests: greedy assignment by cost per
+        tonne within the same 95%/110% capacity window, followed by a repair
+        pass for orders left below their minimum. The LP relaxation (GLOP)
+        then gets HEURISTIC_BOUND_TIME_SECONDS of its own for a lower bound;
+        if it runs out, the bound is None.
+        """
+        solve_start = time.perf_counter()
+        capacities = np.fromiter(
+            (wagon.get('capacity_tonnes', 0) or 0 for wagon in self.wagons),
+            dtype=np.float64, count=len(self.wagons)
+        )
+        required = np.fromiter(
+            (order.get('required_capacity', 0) or 0 for order in self.orders),
+            dtype=np.float64, count=len(self.orders)
+        )
+        min_load = required * MIN_FILL_RATIO - SCALE_EPSILON
+        max_load = required * MAX_FILL_RATIO + SCALE_EPSILON
+        load = np.zeros(len(self.orders))
+        wagon_order = {}  # w_idx -> p_idx of its assignment
+        
+        def assign(p_idx):
+            w_idx, o_idx = pairs[p_idx]
+            wagon_order[w_idx] = p_idx
+            load[o_idx] += capacities[w_idx]
+        
+        def unassign(w_idx):
+            p_idx = wagon_order.pop(w_idx)
+            load[pairs[p_idx][1]] -= capacities[w_idx]
+        
+        for p_idx in fixed:
+            assign(p_idx)
+        
+        # Greedy: hints first on warm starts, then cheapest cost per tonne
+        pair_capacities = capacities[[w_idx for w_idx, _ in pairs]] if pairs else np.zeros(0)
+        per_tonne = costs / np.maximum(pair_capacities, SCALE_EPSILON)
+        not_hinted = np.ones(len(pairs), dtype=bool)
+        not_hinted[list(hinted)] = False
+        order_by = np.lexsort((per_tonne, not_hinted)).tolist()
+        
+        # Partial mode: orders whose candidate wagons cannot reach the
+        # minimum even together are left empty up front
+        skipped = self._unreachable_orders(pairs) if self.partial else np.zeros(len(self.orders), dtype=bool)
+        
+        for p_idx in order_by:
+            w_idx, o_idx = pairs[p_idx]
+            if (w_idx not in wagon_order and capacities[w_idx] > 0 and load[o_idx] < min_load[o_idx]
+                    and load[o_idx] + capacities[w_idx] <= max_load[o_idx] and not skipped[o_idx]):
+                assign(p_idx)
+        
+        # Repair orders below their minimum: add a free wagon that fits the
+        # window, swap one of the order's wagons for a bigger free one, or
+        # move a wagon over from an order with slack
+        for o_idx in np.flatnonzero((load < min_load) & ~skipped).tolist():
+            candidates = sorted(order_pairs[o_idx], key=lambda p_idx: per_tonne[p_idx])
+            for _ in range(len(candidates)):
+                if load[o_idx] >= min_load[o_idx]:
+                    break
+                repaired = False
+                for p_idx in candidates:
+                    w_idx = pairs[p_idx][0]
+                    new_load = load[o_idx] + capacities[w_idx]
+                    current = wagon_order.get(w_idx)
+                    if current is None and new_load <= max_load[o_idx]:
+                        assign(p_idx)
+                        repaired = True
+                        break
+                    if current is not None and pairs[current][1] != o_idx:
+                        donor = pairs[current][1]
+                        if (load[donor] - capacities[w_idx] >= min_load[donor]
+                                and new_load <= max_load[o_idx]):
+                            unassign(w_idx)
+                            assign(p_idx)
+                            repaired = True
+                            break
+                if repaired:
+                    continue
+                # Swap: replace an assigned wagon with a bigger free one
+                own = [w_idx for w_idx, p_idx in wagon_order.items()
+                       if pairs[p_idx][1] == o_idx and p_idx not in fixed]
+                for old_w in own:
+                    for p_idx in candidates:
+                        w_idx = pairs[p_idx][0]
+                        if w_idx in wagon_order:
+                            continue
+                        new_load = load[o_idx] - capacities[old_w] + capacities[w_idx]
+                        if min_load[o_idx] <= new_load <= max_load[o_idx]:
+                            unassign(old_w)
+                            assign(p_idx)
+                            repaired = True
+                            break
+                    if repaired:
+                        break
+                if not repaired:
+                    break
+        
+        short = load < min_load
+        if self.partial:
+            # Partial mode: orders the repair could not fill are left empty,
+            # unless warm-start wagons are fixed to them
+            for o_idx in np.flatnonzero(short).tolist():
+                own = [w_idx for w_idx, p_idx in wagon_order.items() if pairs[p_idx][1] == o_idx]
+                if not any(wagon_order[w_idx] in fixed for w_idx in own):
+                    for w_idx in own:
+                        unassign(w_idx)
+                    short[o_idx] = False
+        feasible = not np.any(short)
+        
+        # Lower bound from the LP relaxation within its own budget; it only
+        # bounds solutions that serve every order
+        lp = {'bound': None, 'infeasible': False, 'interrupted': None}
+        if not feasible or np.all(load >= min_load):
+            lp = self._lp_bound(pairs, wagon_pairs, order_pairs, costs, fixed,
+                                time.perf_counter() + HEURISTIC_BOUND_TIME_SECONDS)
+        if not feasible:
+            # Infeasible only when the LP relaxation proves it
+            return {'status': 'infeasible' if lp['infeasible'] else 'no_solution', 'selected': [],
+                    'objective': None, 'bound': lp['bound'],
+                    'solve_seconds': time.perf_counter() - solve_start, 'interrupted': lp['interrupted']}
+        
+        selected = sorted(wagon_order.values())
+        total = float(costs[selected].sum()) if selected else 0.0
+        bound = lp['bound']
+        optimal = bound is not None and total - bound <= SCALE_EPSILON * max(1.0, abs(total))
+        return {
+            'status': 'optimal' if optimal else 'feasible',
+            'selected': selected,
+            'objective': total,
+            'bound': bound,
+            'solve_seconds': time.perf_counter() - solve_start,
+            'interrupted': lp['interrupted'],
+        }
+    
+    def _lp_bound(self, pairs, wagon_pairs, order_pairs, costs, fixed, deadline: float) -> Dict:
+        """
+        LP relaxation (GLOP) of the model, built and solved before the
+        deadline (time.perf_counter()). Returns {'bound', 'infeasible',
+        'interrupted'}; bound is None when the LP ran out of time, was
+        stopped or is infeasible (which proves the integer problem is too).
+        """
+        outcome = {'bound': None, 'infeasible': False, 'interrupted': None}
+        if deadline - time.perf_counter() <= 0:
+            return outcome
+        solver = pywraplp.Solver.CreateSolver('GLOP')
+        if not solver:
+            return outcome
+        model = self._build_linear_model(
+            solver, pairs, wagon_pairs, order_pairs, costs, integer=False, deadline=deadline
+        )
+        remaining = deadline - time.perf_counter()
+        if model is None or remaining <= 0:
+            return outcome
+        x, objective = model
+        for p_idx in fixed:
+            x[p_idx].SetLb(1)
+        solver.SetTimeLimit(max(1, int(remaining * 1000)))
+        watcher = _SolveWatcher(self.should_stop, solver.InterruptSolve)
+        status = watcher.run(solver.Solve)
+        outcome['interrupted'] = watcher.reason
+        if watcher.abandoned:
+            return outcome
+        if status == pywraplp.Solver.OPTIMAL:
+            outcome['bound'] = objective.Value()
+        elif status == pywraplp.Solver.INFEASIBLE:
+            outcome['infeasible'] = True
+        return outcome
+    
+    def _warm_start_pairs(self, pairs, warm_start: Dict[Any, Any]) -> set:
+        """Pair indices of previous (wagon_id, order_id) assignments that are still feasible"""
+        pair_index = {pair: p_idx for p_idx, pair in enumerate(pairs)}
+        wagon_index = {str(wagon.get('id')): w_idx for w_idx, wagon in enumerate(self.wagons)}
+        order_index = {str(order.get('id')): o_idx for o_idx, order in enumerate(self.orders)}
+        
+        hinted = set()
+        for wagon_id, order_id in warm_start.items():
+            w_idx = wagon_index.get(str(wagon_id))
+            o_idx = order_index.get(str(order_id))
+            p_idx = pair_index.get((w_idx, o_idx))
+            if p_idx is not None:
+                hinted.add(p_idx)
+        return hinted
+    
+    def _safe_fixed_pairs(self, pairs, hinted: set) -> set:
+        """
+        Hinted pairs to fix: per order, only if the kept wagons do not
+        already exceed the 110% maximum. This does not guarantee the rest of
+        the fleet can complete every order around them; _optimize re-solves
+        with the hint alone when the fixed model turns out infeasible.
+        """
+        kept_by_order = {}
+        for p_idx in hinted:
+            w_idx, o_idx = pairs[p_idx]
+            kept_by_order.setdefault(o_idx, []).append(p_idx)
+        
+        fixed = set()
+        for o_idx, p_indices in kept_by_order.items():
+            kept_capacity = sum(
+                self.wagons[pairs[p_idx][0]].get('capacity_tonnes', 0) for p_idx in p_indices
+            )
+            required = self.orders[o_idx].get('required_capacity', 0)
+            if kept_capacity <= required * MAX_FILL_RATIO:
+                fixed.update(p_indices)
+        return fixed
+    
+    @staticmethod
+    def _warm_start_report(pairs, warm_start, hinted, fixed, selected) -> Dict:
+        """How many previous assignments were kept and how many changed"""
+        selected = set(selected)
+        kept = len(hinted & selected)
+        added = len(selected - hinted)
+        removed = len(warm_start) - kept
+        return {
+            'previous_assignments': len(warm_start),
+            'kept': kept,
+            'added': added,
+            'removed': removed,
+            'changed': added + removed,
+            'fixed': len(fixed),
+        }
+    
+    @staticmethod
+    def _relative_gap(objective: Optional[float], bound: Optional[float]) -> Optional[float]:
+        """Relative optimality gap |objective - bound| / |objective|"""
+        if objective is None or bound is None:
+            return None
+        return round(abs(objective - bound) / max(abs(objective), 1e-9), 6)
+    
+    def _compatible_pairs(self) -> List[Tuple[int, int]]:
+        """
+        List feasible (wagon, order) index pairs in wagon-major order.
+        Orders are indexed by compatible wagon type (and origin stockyard when
+        an order sets 'origin_stockyard_id') once, so each wagon only visits
+        the orders that can actually take it.
+        """
+        # Keyed by (wagon_type, stockyard_id); None means "any"
+        orders_by_key = {}
+        for o_idx, order in enumerate(self.orders):
+            compatible_types = order.get('compatible_wagon_types') or [None]
+            stockyard_id = order.get('origin_stockyard_id')
+            for wagon_type in set(compatible_types):
+                orders_by_key.setdefault((wagon_type, stockyard_id), []).append(o_idx)
+        
+        # Merge matching order lists once per distinct (type, stockyard)
+        wagon_index = {}
+        pairs = []
+        for w_idx, wagon in enumerate(self.wagons):
+            key = (wagon.get('wagon_type', ''), wagon.get('current_stockyard_id'))
+            o_indices = wagon_index.get(key)
+            if o_indices is None:
+                wagon_type, stockyard_id = key
+                o_indices = sorted(set(
+                    orders_by_key.get((wagon_type, None), []) +
+                    orders_by_key.get((None, None), []) +
+                    (orders_by_key.get((wagon_type, stockyard_id), []) +
+                     orders_by_key.get((None, stockyard_id), []) if stockyard_id is not None else [])
+                ))
+                wagon_index[key] = o_indices
+            pairs.extend((w_idx, o_idx) for o_idx in o_indices)
+        return pairs
+    
+    def _pair_costs(self, pairs: List[Tuple[int, int]]) -> np.ndarray:
+        """
+        Objective coefficient for every pair in one vectorized pass:
+        base cost (distance) + delay penalty + material handling
+        """
+        if not pairs:
+            return np.zeros(0)
+        
+        n_orders = len(self.orders)
+        pair_idx = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        pair_w, pair_o = pair_idx[:, 0], pair_idx[:, 1]
+        
+        if self.cost_matrix is not None:
+            base_cost = self.cost_matrix[pair_w, pair_o]
+        else:
+            # Scatter stored entries onto the pair list; pair keys are sorted
+            # because pairs are generated wagon-major with ascending orders
+            base_cost = np.full(len(pairs), DEFAULT_BASE_COST)
+            rows, cols, values = self.cost_triplets
+            pair_keys = pair_w * n_orders + pair_o
+            in_range = (rows >= 0) & (rows < len(self.wagons)) & (cols >= 0) & (cols < n_orders)
+            entry_keys = rows[in_range] * n_orders + cols[in_range]
+            pos = np.minimum(np.searchsorted(pair_keys, entry_keys), len(pairs) - 1)
+            hit = pair_keys[pos] == entry_keys
+            base_cost[pos[hit]] = values[in_range][hit]
+        
+        wagon_cost = (
+            np.fromiter((w.get('predicted_delay', 0) or 0 for w in self.wagons),
+                        dtype=np.float64, count=len(self.wagons)) * DELAY_PENALTY_PER_MIN +
+            np.fromiter((w.get('material_handling_cost', 0) or 0 for w in self.wagons),
+                        dtype=np.float64, count=len(self.wagons))
+        )
+        return base_cost + wagon_cost[pair_w]
+    
     def _calculate_savings(self, optimized_cost: float) -> float:
         """Calculate cost savings vs naive assignment"""
         # Baseline: assign wagons sequentially without optimization
@@ -129,3 +1121,23 @@ class RakeFormationOptimizer:
         """Estimate time savings from optimized routing"""
         # Simplified: assume 2 hours saved per optimized assignment
         return len(assignments) * 2.0
+
+
+def warm_up_solvers():
+    """
+    Solve a one-variable model with SCIP, GLOP and CP-SAT so native library
+    and plugin initialization happens at worker start, not on the first plan
+    """
+    for backend in ('SCIP', 'GLOP'):
+        solver = pywraplp.Solver.CreateSolver(backend)
+        if solver:
+            x = solver.NumVar(0, 1, 'x')
+            solver.Minimize(x)
+            solver.Solve()
+    
+    model = cp_model.CpModel()
+    x = model.NewBoolVar('x')
+    model.Minimize(x)
+    solver = cp_model.CpSolver()
+    solver.parameters.num_workers = 1
+    solver.Solve(model)
@@ -0,0 +1,220 @@
+"""
+Memo cache for ML predictions
+Predictions are keyed by the predictor, the loaded model version and the
+quantized feature row, so repeated wagon type / load factor / route
+combinations across plans and re-optimizations skip the booster. Loading a
+new model changes the version, which drops the old entries.
+
+Backends (ML_PREDICTION_CACHE_BACKEND):
+- memory: per-process LRU with TTL (default)
+- redis: shared between Celery workers; entries expire via TTL
+- off: caching disabled
+
+Hit/miss/eviction counters are summed in Redis with either backend, since
+predictions run in the Celery workers while stats are read by the API.
+Each process batches its increments and flushes them at most every
+ML_PREDICTION_CACHE_STATS_FLUSH_SECONDS, so lookups do not wait on Redis.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+import atexit
+import os
+import threading
+import time
+
+PREDICTION_CACHE_BACKEND = os.getenv("ML_PREDICTION_CACHE_BACKEND", "memory")
+PREDICTION_CACHE_TTL_SECONDS = int(os.getenv("ML_PREDICTION_CACHE_TTL_SECONDS", "3600"))
+# Per predictor
+PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv("ML_PREDICTION_CACHE_MAX_ENTRIES", "100000"))
+PREDICTION_CACHE_REDIS_URL = os.getenv(
+    "ML_PREDICTION_CACHE_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6000/0")
+)
+PREDICTION_KEY_PREFIX = "ml:prediction:"
+PREDICTION_STATS_KEY = "ml:prediction_cache_stats"
+PREDICTION_CACHE_STATS_FLUSH_SECONDS = float(os.getenv("ML_PREDICTION_CACHE_STATS_FLUSH_SECONDS", "10"))
+# Connect/read timeout so an unreachable Redis costs a lookup little time
+PREDICTION_CACHE_REDIS_TIMEOUT_SECONDS = float(os.getenv("ML_PREDICTION_CACHE_REDIS_TIMEOUT_SECONDS", "0.5"))
+
+
+class PredictionCache:
+    """LRU + TTL store of prediction values with hit/miss/eviction counters"""
+    
+    def __init__(self, backend: str = PREDICTION_CACHE_BACKEND, ttl_seconds: int = PREDICTION_CACHE_TTL_SECONDS,
+                 max_entries: int = PREDICTION_CACHE_MAX_ENTRIES, redis_url: str = PREDICTION_CACHE_REDIS_URL):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.redis_url = redis_url
+        self._namespaces = {}  # namespace -> (model version, OrderedDict key -> (expires_at, value))
+        self._lock = threading.Lock()
+        self._redis = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._unflushed = {}  # counter -> increments not yet added in Redis
+        self._flushed_at = time.monotonic()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.backend != 'off'
+    
+    def _client(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(
+                self.redis_url,
+                socket_connect_timeout=PREDICTION_CACHE_REDIS_TIMEOUT_SECONDS,
+                socket_timeout=PREDICTION_CACHE_REDIS_TIMEOUT_SECONDS
+            )
+        return self._redis
+    
+    def _redis_key(self, namespace: str, version: str, key: bytes) -> bytes:
+        return f"{PREDICTION_KEY_PREFIX}{namespace}:{version}:".encode() + key
+    
+    def _entries(self, namespace: str, version: str, dropped: Dict[str, int]) -> OrderedDict:
+        """
+        Entries of a namespace, dropped when the model version changed (lock
+        held); dropped entries are tallied in dropped for _count
+        """
+        current = self._namespaces.get(namespace)
+        if current is None or current[0] != version:
+            if current is not None:
+                dropped['invalidations'] += 1
+                dropped['evictions'] += len(current[1])
+            current = self._namespaces[namespace] = (version, OrderedDict())
+        return current[1]
+    
+    def get_many(self, namespace: str, version: str, keys: List[bytes]) -> List[Optional[float]]:
+        """Cached values for keys (None for misses)"""
+        if not self.enabled or not keys:
+            return [None] * len(keys)
+        
+        values = [None] * len(keys)
+        dropped = {'evictions': 0, 'invalidations': 0}
+        if self.backend == 'redis':
+            try:
+                payloads = self._client().mget([self._redis_key(namespace, version, key) for key in keys])
+                values = [float(payload) if payload is not None else None for payload in payloads]
+            except Exception:
+                # An unreachable cache must never fail a prediction
+                pass
+        else:
+            now = time.monotonic()
+            with self._lock:
+                entries = self._entries(namespace, version, dropped)
+                for k_idx, key in enumerate(keys):
+                    entry = entries.get(key)
+                    if entry is None:
+                        continue
+                    if entry[0] > now:
+                        entries.move_to_end(key)
+                        values[k_idx] = entry[1]
+                    else:
+                        del entries[key]
+                        dropped['evictions'] += 1
+        
+        hits = sum(value is not None for value in values)
+        self._count(hits=hits, misses=len(keys) - hits, **dropped)
+        return values
+    
+    def set_many(self, namespace: str, version: str, items: Dict[bytes, float]):
+        """Store key -> value pairs with the configured TTL"""
+        if not self.enabled or not items:
+            return
+        
+        if self.backend == 'redis':
+            try:
+                pipeline = self._client().pipeline()
+                for key, value in items.items():
+                    pipeline.setex(self._redis_key(namespace, version, key), self.ttl_seconds, repr(float(value)))
+                pipeline.execute()
+            except Exception:
+                pass
+            return
+        
+        expires_at = time.monotonic() + self.ttl_seconds
+        dropped = {'evictions': 0, 'invalidations': 0}
+        with self._lock:
+            entries = self._entries(namespace, version, dropped)
+            for key, value in items.items():
+                entries[key] = (expires_at, float(value))
+                entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                dropped['evictions'] += 1
+        if any(dropped.values()):
+            self._count(**dropped)
+    
+    def _count(self, **increments: int):
+        """Add to this process's counters; the shared ones get them on the next flush"""
+        with self._lock:
+            for name, amount in increments.items():
+                if amount:
+                    setattr(self, name, getattr(self, name) + amount)
+                    self._unflushed[name] = self._unflushed.get(name, 0) + amount
+            due = time.monotonic() - self._flushed_at >= PREDICTION_CACHE_STATS_FLUSH_SECONDS
+        if due:
+            self.flush_stats()
+    
+    def flush_stats(self):
+        """Add this process's unflushed counter increments to the shared ones in Redis"""
+        with self._lock:
+            unflushed, self._unflushed = self._unflushed, {}
+            self._flushed_at = time.monotonic()
+        if not unflushed:
+            return
+        try:
+            pipeline = self._client().pipeline()
+            for name, amount in unflushed.items():
+                pipeline.hincrby(PREDICTION_STATS_KEY, name, amount)
+            pipeline.execute()
+        except Exception:
+            # Counters are best effort: keep them for the next flush
+            with self._lock:
+                for name, amount in unflushed.items():
+                    self._unflushed[name] = self._unflushed.get(name, 0) + amount
+    
+    def clear(self):
+        with self._lock:
+            self._namespaces.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters summed over every process (from Redis), with this process's
+        own counters, entries and model versions under 'process'. If Redis is
+        unreachable the top-level counters fall back to this process ('scope'
+        says which).
+        Flushes this process's counters first.
+        """
+        self.flush_stats()
+        with self._lock:
+            local = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+            entries = {namespace: len(entries) for namespace, (_, entries) in self._namespaces.items()}
+            versions = {namespace: version for namespace, (version, _) in self._namespaces.items()}
+        counters, scope = local, 'process'
+        try:
+            shared = self._client().hgetall(PREDICTION_STATS_KEY)
+            counters = {name: int(shared.get(name.encode(), 0)) for name in local}
+            scope = 'all processes'
+        except Exception:
+            pass
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'backend': self.backend,
+            'scope': scope,
+            **counters,
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0,
+            'ttl_seconds': self.ttl_seconds,
+            'process': {**local, 'entries': entries, 'model_versions': versions},
+        }
+
+
+# Global instance
+prediction_cache = PredictionCache()
+atexit.register(prediction_cache.flush_stats)
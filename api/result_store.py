@@ -0,0 +1,136 @@
+"""
+Optimization result store
+Large optimization results are written once to the optimization_results
+table keyed by job id, with the assignment list split into zlib-compressed
+JSON chunks (optimization_result_chunks) so a page only decodes the chunks
+it overlaps. The Celery result (kept in Redis and re-read on every status
+poll) then carries only the summary and a reference, and the status
+endpoint pages the assignments out of the tables on demand. A running
+job's latest incumbent is stored the same way under incumbent_ref(job_id).
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import zlib
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Default and maximum assignments per status page
+RESULT_PAGE_SIZE = int(os.getenv("OPTIMIZATION_RESULT_PAGE_SIZE", "1000"))
+RESULT_MAX_PAGE_SIZE = int(os.getenv("OPTIMIZATION_RESULT_MAX_PAGE_SIZE", "10000"))
+# Stored results older than this are purged nightly
+RESULT_RETENTION_DAYS = int(os.getenv("OPTIMIZATION_RESULT_RETENTION_DAYS", "30"))
+# Assignments per stored chunk
+RESULT_CHUNK_SIZE = int(os.getenv("OPTIMIZATION_RESULT_CHUNK_SIZE", "1000"))
+RESULT_COMPRESSION_LEVEL = 6
+INCUMBENT_REF_SUFFIX = ":incumbent"
+
+
+def incumbent_ref(job_id: str) -> str:
+    """Result store key of a running job's latest incumbent"""
+    return f"{job_id}{INCUMBENT_REF_SUFFIX}"
+
+
+def store_result(db: Session, job_id: Optional[str], response: Dict, assignments: List[Dict],
+                 plan_id: Optional[int] = None) -> Dict:
+    """
+    Save assignments under job_id (replacing what was stored there) and
+    return the response without them, carrying 'result_ref' and
+    'assignments_total' instead. Adds the rows to the session; the caller
+    commits. Without a job id (task called
+    directly) the response keeps its assignments inline.
+    """
+    if not job_id:
+        return {**response, 'assignments': assignments}
+    
+    summary = {**response, 'result_ref': job_id, 'assignments_total': len(assignments)}
+    db.merge(models.OptimizationResult(
+        job_id=job_id,
+        plan_id=plan_id,
+        status=response.get('status', 'completed'),
+        summary=summary,
+        assignment_count=len(assignments),
+        assignments=None,
+    ))
+    _delete_chunks(db, [job_id])
+    db.add_all([
+        models.OptimizationResultChunk(
+            job_id=job_id,
+            first_index=first_index,
+            count=len(chunk),
+            assignments=zlib.compress(json.dumps(chunk).encode(), RESULT_COMPRESSION_LEVEL),
+        )
+        for first_index in range(0, len(assignments), RESULT_CHUNK_SIZE)
+        for chunk in [assignments[first_index:first_index + RESULT_CHUNK_SIZE]]
+    ])
+    return summary
+
+
+def load_summary(db: Session, job_id: str) -> Optional[Dict]:
+    """Stored result summary, without reading the assignment blob"""
+    row = db.query(models.OptimizationResult.summary).filter(
+        models.OptimizationResult.job_id == job_id
+    ).first()
+    return row.summary if row is not None else None
+
+
+def load_assignments(db: Session, job_id: str, offset: int = 0,
+                     limit: Optional[int] = RESULT_PAGE_SIZE) -> Optional[Tuple[List[Dict], int]]:
+    """
+    (page of assignments, total) for a stored result, or None if there is
+    none; limit None reads to the end
+    """
+    row = db.query(
+        models.OptimizationResult.assignments,
+        models.OptimizationResult.assignment_count
+    ).filter(models.OptimizationResult.job_id == job_id).first()
+    if row is None:
+        return None
+    end = row.assignment_count if limit is None else offset + limit
+    if row.assignments:
+        # Stored before chunking: one blob
+        return json.loads(zlib.decompress(row.assignments))[offset:end], row.assignment_count
+    
+    chunks = db.query(
+        models.OptimizationResultChunk.first_index,
+        models.OptimizationResultChunk.assignments
+    ).filter(
+        models.OptimizationResultChunk.job_id == job_id,
+        models.OptimizationResultChunk.first_index < end,
+        models.OptimizationResultChunk.first_index + models.OptimizationResultChunk.count > offset
+    ).order_by(models.OptimizationResultChunk.first_index).all()
+    if not chunks:
+        return [], row.assignment_count
+    assignments = [assignment for chunk in chunks for assignment in json.loads(zlib.decompress(chunk.assignments))]
+    start = offset - chunks[0].first_index
+    return assignments[max(start, 0):end - chunks[0].first_index], row.assignment_count
+
+
+def _delete_chunks(db: Session, job_ids):
+    db.query(models.OptimizationResultChunk).filter(
+        models.OptimizationResultChunk.job_id.in_(job_ids)
+    ).delete(synchronize_session=False)
+
+
+def delete_result(db: Session, job_id: str):
+    """Drop a stored result (e.g. a finished job's incumbent); the caller commits"""
+    _delete_chunks(db, [job_id])
+    db.query(models.OptimizationResult).filter(
+        models.OptimizationResult.job_id == job_id
+    ).delete(synchronize_session=False)
+
+
+def purge_results(db: Session, retention_days: int = RESULT_RETENTION_DAYS) -> int:
+    """Delete stored results older than the retention period"""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    _delete_chunks(db, db.query(models.OptimizationResult.job_id).filter(
+        models.OptimizationResult.created_at < cutoff
+    ).scalar_subquery())
+    deleted = db.query(models.OptimizationResult).filter(
+        models.OptimizationResult.created_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,160 @@
+"""
+In-memory route index
+Loads the routes table once per worker process and keys it by place name,
+by (origin, destination) and by (stockyard id, destination), with distance,
+duration and waypoint-derived features precomputed. Wagon-to-route matching
+becomes a dict lookup instead of a leading-wildcard LIKE query per plan.
+
+The index is rebuilt when the routes (or stockyards) table changes: writes
+made through this process mark it stale immediately, and a cheap signature
+query (row counts, latest routes.updated_at) catches other writers at most
+ROUTE_INDEX_CHECK_SECONDS later.
+"""
+from typing import Dict, List, Optional
+import os
+import threading
+import time
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from . import models
+
+ROUTE_INDEX_CHECK_SECONDS = float(os.getenv("ROUTE_INDEX_CHECK_SECONDS", "30"))
+
+
+def place_key(name: Optional[str]) -> str:
+    """Normalized place name used as lookup key"""
+    return (name or '').strip().lower()
+
+
+def _waypoint_stops(waypoints) -> List[Dict]:
+    """[{'name', 'lat', 'lng'}] from a list of stops or a {'stops': [...]} object"""
+    if isinstance(waypoints, dict):
+        waypoints = waypoints.get('stops') or waypoints.get('waypoints') or []
+    if not isinstance(waypoints, list):
+        return []
+    return [
+        {'name': stop.get('name'), 'lat': stop.get('lat'), 'lng': stop.get('lng')} if isinstance(stop, dict)
+        else {'name': str(stop), 'lat': None, 'lng': None}
+        for stop in waypoints
+    ]
+
+
+def route_entry(route: models.Route) -> Dict:
+    """Route dict used by the optimizer and predictors, with derived features"""
+    distance = float(route.distance_km or 0)
+    duration = float(route.estimated_duration_hours or 0)
+    stops = _waypoint_stops(route.waypoints)
+    return {
+        'id': route.id,
+        'route_name': route.route_name,
+        'origin': route.origin,
+        'destination': route.destination,
+        'distance_km': distance,
+        'estimated_duration_hours': duration,
+        'average_speed_kmh': round(distance / duration, 3) if duration else 0.0,
+        'waypoint_count': len(stops),
+        'intermediate_stops': max(0, len(stops) - 2),
+        'km_per_leg': round(distance / max(1, len(stops) - 1), 3),
+        'waypoints': [stop['name'] for stop in stops],
+        'waypoint_coordinates': [
+            (stop['lat'], stop['lng']) if stop['lat'] is not None and stop['lng'] is not None else None
+            for stop in stops
+        ],
+    }
+
+
+class RouteLookup:
+    """Immutable snapshot of the routes table with O(1) lookups"""
+    
+    def __init__(self, routes: List[models.Route], stockyards: List[models.Stockyard]):
+        self.routes = [route_entry(route) for route in routes]
+        self.by_id = {route['id']: route for route in self.routes}
+        self.by_place = {}
+        self.by_origin_destination = {}
+        for route in self.routes:
+            origin, destination = place_key(route['origin']), place_key(route['destination'])
+            self.by_place.setdefault(origin, []).append(route)
+            if destination != origin:
+                self.by_place.setdefault(destination, []).append(route)
+            self.by_origin_destination.setdefault((origin, destination), route)
+        
+        # Stockyards are route origins (e.g. "Bokaro Steel Plant")
+        self.stockyard_names = {stockyard.id: stockyard.name for stockyard in stockyards}
+        self.by_stockyard_destination = {}
+        for stockyard in stockyards:
+            origin = place_key(stockyard.name)
+            for route in self.by_place.get(origin, []):
+                if place_key(route['origin']) == origin:
+                    self.by_stockyard_destination.setdefault(
+                        (stockyard.id, place_key(route['destination'])), route
+                    )
+        self._partial_matches = {}
+    
+    def routes_for_place(self, place: str) -> List[Dict]:
+        """
+        Routes starting or ending at place. Falls back to substring matching
+        over the (few) distinct place names, like the old LIKE filter.
+        """
+        key = place_key(place)
+        routes = self.by_place.get(key)
+        if routes is not None:
+            return list(routes)
+        if key not in self._partial_matches:
+            matches = {}
+            for name, place_routes in self.by_place.items():
+                if key and key in name:
+                    for route in place_routes:
+                        matches[route['id']] = route
+            self._partial_matches[key] = list(matches.values())
+        return list(self._partial_matches[key])
+    
+    def route_for(self, stockyard_id: Optional[int], destination: str) -> Optional[Dict]:
+        """The route from a stockyard to a destination, if one exists"""
+        return self.by_stockyard_destination.get((stockyard_id, place_key(destination)))
+
+
+class RouteIndex:
+    """Process-wide, lazily rebuilt RouteLookup"""
+    
+    def __init__(self, check_seconds: float = ROUTE_INDEX_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._lookup = None
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self.builds = 0
+    
+    def mark_stale(self, *args, **kwargs):
+        """Re-check the signature on the next access (SQLAlchemy event hook)"""
+        self._checked_at = None
+    
+    def _table_signature(self, db: Session):
+        routes = db.query(func.count(models.Route.id), func.max(models.Route.updated_at)).one()
+        stockyards = db.query(func.count(models.Stockyard.id), func.max(models.Stockyard.id)).one()
+        return tuple(routes) + tuple(stockyards)
+    
+    def current(self, db: Session) -> RouteLookup:
+        """The index, rebuilt first if the routes table changed"""
+        now = time.monotonic()
+        if self._lookup is not None and self._checked_at is not None \
+                and now - self._checked_at < self.check_seconds:
+            return self._lookup
+        
+        with self._lock:
+            signature = self._table_signature(db)
+            if self._lookup is None or signature != self._signature:
+                self._lookup = RouteLookup(db.query(models.Route).all(), db.query(models.Stockyard).all())
+                self._signature = signature
+                self.builds += 1
+            self._checked_at = now
+        return self._lookup
+
+
+# Global instance
+route_index = RouteIndex()
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(models.Route, _event_name, route_index.mark_stale)
+    event.listen(models.Stockyard, _event_name, route_index.mark_stale)
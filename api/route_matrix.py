@@ -0,0 +1,243 @@
+"""
+All-pairs stockyard/destination distance matrix
+Turns the route network into a graph whose nodes are places (route origins,
+intermediate waypoints, destinations) and whose edges are the legs between
+consecutive stops, then runs all-pairs shortest paths for distance and
+travel time. The result is a compact float32 matrix with a node index,
+persisted as .npz so new workers load it instead of recomputing.
+
+Leg lengths split a route's distance/duration in proportion to the
+great-circle length of each leg when every stop has coordinates, and evenly
+otherwise. Route changes that only add or shorten legs are applied
+incrementally (O(n^2) per leg); removed or longer legs trigger a full
+recompute.
+"""
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .route_index import route_index, place_key
+
+ROUTE_MATRIX_PATH = os.getenv("ROUTE_MATRIX_PATH", os.path.join("models", "route_matrix.npz"))
+EARTH_RADIUS_KM = 6371.0
+
+
+def _great_circle_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lng1, lat2, lng2 = map(np.radians, (a[0], a[1], b[0], b[1]))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return float(2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h)))
+
+
+def route_edges(routes: List[Dict]) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """
+    Undirected legs {(place_a, place_b): (km, hours)} with place keys in
+    sorted order, keeping the shortest leg when routes overlap. The first and
+    last waypoints are the route's own origin and destination.
+    """
+    edges = {}
+    for route in routes:
+        names = route.get('waypoints') or []
+        coordinates = route.get('waypoint_coordinates') or []
+        if len(names) >= 2:
+            chain = [route['origin']] + names[1:-1] + [route['destination']]
+            chain_coordinates = coordinates if len(coordinates) == len(names) else [None] * len(chain)
+        else:
+            chain = [route['origin'], route['destination']]
+            chain_coordinates = [None, None]
+        
+        n_legs = len(chain) - 1
+        shares = np.full(n_legs, 1.0 / n_legs)
+        if all(point is not None for point in chain_coordinates):
+            lengths = np.array([
+                _great_circle_km(chain_coordinates[l_idx], chain_coordinates[l_idx + 1]) for l_idx in range(n_legs)
+            ])
+            if lengths.sum() > 0:
+                shares = lengths / lengths.sum()
+        
+        for l_idx in range(n_legs):
+            a, b = place_key(chain[l_idx]), place_key(chain[l_idx + 1])
+            if a == b:
+                continue
+            key = (a, b) if a < b else (b, a)
+            leg = (route['distance_km'] * shares[l_idx], route['estimated_duration_hours'] * shares[l_idx])
+            if key not in edges or leg[0] < edges[key][0]:
+                edges[key] = leg
+    return edges
+
+
+def _edges_digest(edges: Dict) -> str:
+    payload = json.dumps(sorted([a, b, round(km, 6), round(hours, 6)] for (a, b), (km, hours) in edges.items()))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class RouteMatrix:
+    """Shortest distance (km) and travel time (hours) between every pair of places"""
+    
+    def __init__(self, nodes: List[str], distance: np.ndarray, duration: np.ndarray, edges: Dict):
+        self.nodes = nodes
+        self.node_index = {node: n_idx for n_idx, node in enumerate(nodes)}
+        self.distance = distance
+        self.duration = duration
+        self.edges = edges
+        self.digest = _edges_digest(edges)
+    
+    @classmethod
+    def build(cls, edges: Dict) -> 'RouteMatrix':
+        """Full all-pairs shortest paths (Dijkstra from every node)"""
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import shortest_path
+        
+        nodes = sorted({place for key in edges for place in key})
+        if not nodes:
+            empty = np.zeros((0, 0), dtype=np.float32)
+            return cls([], empty, empty.copy(), {})
+        index = {node: n_idx for n_idx, node in enumerate(nodes)}
+        rows = np.array([index[a] for a, _ in edges], dtype=np.int64)
+        cols = np.array([index[b] for _, b in edges], dtype=np.int64)
+        legs = np.array(list(edges.values()), dtype=np.float64).reshape(-1, 2)
+        
+        matrices = []
+        for column in range(2):
+            graph = coo_matrix((legs[:, column], (rows, cols)), shape=(len(nodes), len(nodes))).tocsr()
+            matrices.append(shortest_path(graph, method='D', directed=False).astype(np.float32))
+        return cls(nodes, matrices[0], matrices[1], dict(edges))
+    
+    def updated(self, edges: Dict) -> 'RouteMatrix':
+        """
+        Matrix for a new edge set. Added or shortened legs relax the existing
+        matrix in place of a full recompute; anything else rebuilds.
+        """
+        changes = {
+            key: leg for key, leg in edges.items()
+            if key not in self.edges or leg[0] < self.edges[key][0] or leg[1] < self.edges[key][1]
+        }
+        removed_or_longer = any(
+            key not in edges or edges[key][0] > leg[0] or edges[key][1] > leg[1]
+            for key, leg in self.edges.items()
+        )
+        if removed_or_longer or len(changes) > max(1, len(self.nodes) // 10):
+            return RouteMatrix.build(edges)
+        if not changes:
+            return self
+        
+        new_nodes = sorted({place for key in changes for place in key} - set(self.node_index))
+        nodes = self.nodes + new_nodes
+        n_old, n_new = len(self.nodes), len(nodes)
+        matrices = []
+        for current in (self.distance, self.duration):
+            grown = np.full((n_new, n_new), np.inf, dtype=np.float32)
+            grown[:n_old, :n_old] = current
+            np.fill_diagonal(grown, 0)
+            matrices.append(grown)
+        
+        index = {node: n_idx for n_idx, node in enumerate(nodes)}
+        for (a, b), leg in changes.items():
+            u, v = index[a], index[b]
+            for matrix, weight in zip(matrices, leg):
+                # Paths that now use the leg in either direction
+                via_uv = matrix[:, u, None] + np.float32(weight) + matrix[None, v, :]
+                via_vu = matrix[:, v, None] + np.float32(weight) + matrix[None, u, :]
+                np.minimum(matrix, np.minimum(via_uv, via_vu), out=matrix)
+        return RouteMatrix(nodes, matrices[0], matrices[1], dict(edges))
+    
+    def lookup(self, origins: List[Optional[str]], destinations: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (distance, duration) matrices of shape (len(origins), len(destinations)),
+        gathered in one vectorized step; unknown or unreachable pairs are inf.
+        """
+        origin_idx = np.array([self.node_index.get(place_key(place), -1) for place in origins], dtype=np.int64)
+        destination_idx = np.array([self.node_index.get(place_key(place), -1) for place in destinations], dtype=np.int64)
+        valid = (origin_idx[:, None] >= 0) & (destination_idx[None, :] >= 0)
+        # Clip -1 to any node for the gather, then mask it out
+        rows, cols = np.ix_(np.maximum(origin_idx, 0), np.maximum(destination_idx, 0))
+        distance = np.where(valid, self.distance[rows, cols] if len(self.nodes) else np.inf, np.inf)
+        duration = np.where(valid, self.duration[rows, cols] if len(self.nodes) else np.inf, np.inf)
+        return distance, duration
+    
+    def save(self, path: str):
+        """
+        Write atomically as .npz (float32 matrices, node names and the edge
+        list). Each writer gets its own temporary file, so processes saving
+        at the same time never interleave.
+        """
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        keys = list(self.edges)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    nodes=np.array(self.nodes, dtype=str),
+                    distance=self.distance,
+                    duration=self.duration,
+                    edge_places=np.array(keys, dtype=str).reshape(-1, 2),
+                    edge_legs=np.array([self.edges[key] for key in keys], dtype=np.float64).reshape(-1, 2),
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    @classmethod
+    def load(cls, path: str) -> Optional['RouteMatrix']:
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            edges = {
+                (str(a), str(b)): (float(km), float(hours))
+                for (a, b), (km, hours) in zip(data['edge_places'], data['edge_legs'])
+            }
+            return cls([str(node) for node in data['nodes']], data['distance'], data['duration'], edges)
+
+
+class RouteMatrixStore:
+    """
+    Process-wide RouteMatrix kept in step with the route index: rebuilt or
+    incrementally updated whenever the index is, and persisted to disk.
+    """
+    
+    def __init__(self, path: str = ROUTE_MATRIX_PATH):
+        self.path = path
+        self._matrix = None
+        self._lookup = None
+        self._saved_digest = None
+        self._lock = threading.Lock()
+    
+    def current(self, db: Session) -> RouteMatrix:
+        lookup = route_index.current(db)
+        if lookup is self._lookup:
+            return self._matrix
+        
+        with self._lock:
+            if lookup is not self._lookup:
+                edges = route_edges(lookup.routes)
+                if self._matrix is None:
+                    # Start from the persisted matrix when there is one
+                    try:
+                        self._matrix = RouteMatrix.load(self.path)
+                    except Exception:
+                        self._matrix = None
+                    self._saved_digest = self._matrix.digest if self._matrix is not None else None
+                matrix = self._matrix.updated(edges) if self._matrix is not None else RouteMatrix.build(edges)
+                
+                if matrix.digest != self._saved_digest:
+                    try:
+                        matrix.save(self.path)
+                        self._saved_digest = matrix.digest
+                    except OSError:
+                        pass
+                self._matrix = matrix
+                self._lookup = lookup
+        return self._matrix
+
+
+# Global instance
+route_matrix = RouteMatrixStore()
@@ -22,6 +22,13 @@ class FormationPlanCreate(BaseModel):
     origin_stockyard_id: int
     destination: str
     priority: Optional[str] = "Medium"
+    optimization_engine: Optional[str] = None
+
+class BatchOptimizeRequest(BaseModel):
+    # Explicit plans, or every Draft plan at origin_stockyard_id
+    plan_ids: Optional[List[int]] = None
+    origin_stockyard_id: Optional[int] = None
+    engine: Optional[str] = None
 
 class FormationPlanResponse(BaseModel):
     id: int
@@ -32,6 +39,7 @@ class FormationPlanResponse(BaseModel):
     priority: str
     projected_savings: float
     time_savings_hours: float
+    optimization_engine: Optional[str] = None
     created_at: datetime
     
     class Config:
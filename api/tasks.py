@@ -1,18 +1,163 @@
 """
 Celery tasks for background processing
 """
-from celery import Task
+from celery import Task, states
+from celery.exceptions import Retry
+from celery.signals import worker_process_init
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from .celery_app import celery_app
+from .celery_app import celery_app, BULK_QUEUE
 from .database import SessionLocal
-from .optimizer import RakeFormationOptimizer
-from .ml_models import delay_predictor, fulfillment_predictor
+from .decomposition import DecomposedRakeFormationOptimizer
+from .job_events import job_events
+from .job_registry import job_registry, StopCheck
+from .result_store import store_result, load_assignments, purge_results, delete_result, incumbent_ref
+from .ml_models import delay_predictor, fulfillment_predictor, warm_up_models, PREWARM_MODELS
+from .optimizer import warm_up_solvers
+from .route_index import route_index
+from .route_matrix import route_matrix
 from . import models
+import numpy as np
+import os
 import time
 
+# Minimum seconds between incumbent updates published to the result backend
+INCUMBENT_PUBLISH_INTERVAL = 0.5
+
+# Transport cost model for the optimizer's cost matrix
+BASE_HANDLING_COST = float(os.getenv("BASE_HANDLING_COST", "100"))
+COST_PER_KM = float(os.getenv("COST_PER_KM", "1.0"))
+UNREACHABLE_DISTANCE_KM = float(os.getenv("UNREACHABLE_DISTANCE_KM", "3000"))
+
+# Solve a tiny model with each solver when a worker process starts
+PREWARM_SOLVERS = os.getenv("OPTIMIZER_PREWARM_SOLVERS", "true").lower() == "true"
+
+# Solvers are stopped this many seconds before the Celery soft time limit,
+# which cannot interrupt native solver code itself
+SOFT_LIMIT_MARGIN_SECONDS = float(os.getenv("OPTIMIZER_SOFT_LIMIT_MARGIN_SECONDS", "5"))
+# Delay before a bulk job preempted by an urgent plan runs again
+PREEMPT_RETRY_SECONDS = int(os.getenv("OPTIMIZER_PREEMPT_RETRY_SECONDS", "60"))
+
+def _wagon_to_dict(w: models.Wagon) -> dict:
+    """Optimizer input dict for a wagon row"""
+    return {
+        'id': w.id,
+        'wagon_type': w.wagon_type,
+        'capacity_tonnes': float(w.capacity_tonnes),
+        'current_load_tonnes': float(w.current_load_tonnes),
+        'current_stockyard_id': w.current_stockyard_id,
+        'material': w.material,
+        'destination': w.destination,
+    }
+
+def _plan_order(plan: models.FormationPlan, order_id, origin_stockyard_id=None) -> dict:
+    """Simplified order derived from a plan's requirements"""
+    order = {
+        'id': order_id,
+        'required_capacity': 300,  # Example: 300 tonnes needed
+        'compatible_wagon_types': ['BOXN', 'BOBRN'],
+        'destination': plan.destination
+    }
+    if origin_stockyard_id is not None:
+        order['origin_stockyard_id'] = origin_stockyard_id
+    return order
+
+def _build_cost_matrix(wagon_list: list, orders: list, routes, network) -> np.ndarray:
+    """
+    Dense (wagons x orders) cost: a base handling cost plus the shortest-path
+    distance from each wagon's stockyard to each order's destination,
+    gathered from the precomputed route matrix in one step
+    """
+    origins = [routes.stockyard_names.get(wagon['current_stockyard_id']) for wagon in wagon_list]
+    distances, _ = network.lookup(origins, [order['destination'] for order in orders])
+    # Places off the route network cost as a long haul instead of failing
+    distances = np.where(np.isfinite(distances), distances, UNREACHABLE_DISTANCE_KM)
+    return BASE_HANDLING_COST + COST_PER_KM * distances
+
+class WagonConflictError(Exception):
+    """Wagons picked by the solver were assigned to another plan in the meantime"""
+    
+    def __init__(self, wagon_ids: list):
+        super().__init__(f"Wagons no longer available: {', '.join(map(str, wagon_ids))}")
+        self.wagon_ids = wagon_ids
+
+def _persist_assignments(db: Session, plan_assignments: dict, held_wagon_ids=()):
+    """
+    Replace the PlanWagonAssignment rows of the given plans
+    ({plan_id: [assignment, ...]}) with one set-based wagon UPDATE, one
+    DELETE and one bulk INSERT. The UPDATE only claims wagons that are still
+    Available (or already held by these plans), so a wagon taken by a
+    concurrent plan makes the row count fall short: nothing is written and
+    WagonConflictError is raised. Wagons in held_wagon_ids that are no longer
+    used are released. The caller commits.
+    """
+    wagon_ids = [assignment['wagon_id'] for rows in plan_assignments.values() for assignment in rows]
+    held_ids = set(held_wagon_ids)
+    
+    claimable = models.Wagon.status == 'Available'
+    if held_ids:
+        claimable = claimable | (models.Wagon.id.in_(held_ids) & (models.Wagon.status == 'Assigned'))
+    if wagon_ids:
+        claimed = db.query(models.Wagon).filter(
+            models.Wagon.id.in_(wagon_ids),
+            claimable
+        ).update({'status': 'Assigned'}, synchronize_session=False)
+        if claimed != len(set(wagon_ids)):
+            db.rollback()
+            taken = [
+                row.id for row in db.query(models.Wagon.id).filter(
+                    models.Wagon.id.in_(wagon_ids),
+                    ~claimable
+                )
+            ]
+            raise WagonConflictError(sorted(taken))
+    
+    # Release wagons the re-optimized plans no longer use
+    released_ids = list(held_ids - set(wagon_ids))
+    if released_ids:
+        db.query(models.Wagon).filter(
+            models.Wagon.id.in_(released_ids),
+            models.Wagon.status == 'Assigned'
+        ).update({'status': 'Available'}, synchronize_session=False)
+    
+    db.query(models.PlanWagonAssignment).filter(
+        models.PlanWagonAssignment.plan_id.in_(list(plan_assignments))
+    ).delete(synchronize_session=False)
+    
+    rows = [
+        {'plan_id': plan_id, 'wagon_id': assignment['wagon_id'], 'sequence_order': assignment['sequence_order']}
+        for plan_id, assignments in plan_assignments.items()
+        for assignment in assignments
+    ]
+    if rows:
+        db.execute(insert(models.PlanWagonAssignment), rows)
+
+@worker_process_init.connect
+def prewarm_worker(**kwargs):
+    """
+    Pay one-time start-up costs (solver initialization, model loading, the
+    route index and distance matrix) in each worker process before it takes
+    tasks, instead of in the first optimization it runs. This can take
+    seconds, hence celery_app's worker_proc_alive_timeout.
+    """
+    if PREWARM_SOLVERS:
+        warm_up_solvers()
+    if PREWARM_MODELS:
+        warm_up_models()
+    
+    db = SessionLocal()
+    try:
+        route_matrix.current(db)
+    except Exception:
+        # Tables may not exist yet; the first task builds the index instead
+        pass
+    finally:
+        db.close()
+
 class DatabaseTask(Task):
     """Base task with database session"""
     _db = None
+    _started_at = None
     
     @property
     def db(self):
@@ -20,20 +165,166 @@ class DatabaseTask(Task):
             self._db = SessionLocal()
         return self._db
     
-    def after_return(self, *args, **kwargs):
+    def before_start(self, task_id, args, kwargs):
+        self._started_at = time.time()
+        if (self.request.delivery_info or {}).get('routing_key') == BULK_QUEUE:
+            try:
+                job_registry.mark_running_bulk(task_id)
+            except Exception:
+                pass
+    
+    def stop_check(self) -> StopCheck:
+        """
+        should_stop for the optimizer: stop requests for this job (cancel,
+        supersede, preempt) and the soft time limit less a safety margin
+        """
+        soft_limit = (self.request.timelimit or (None, None))[1]
+        deadline = None
+        if soft_limit and self._started_at is not None:
+            deadline = self._started_at + soft_limit - SOFT_LIMIT_MARGIN_SECONDS
+        return StopCheck(self.request.id, deadline)
+    
+    def store_cancelled(self, response: dict, plan_id: int = None) -> dict:
+        """Move a cancelled job's incumbent assignments to the result store"""
+        if 'incumbent' not in response:
+            return response
+        incumbent = dict(response['incumbent'])
+        assignments = incumbent.pop('assignments', [])
+        response = store_result(self.db, self.request.id, {**response, 'incumbent': incumbent}, assignments, plan_id=plan_id)
+        self.db.commit()
+        return response
+    
+    def requeue_preempted(self, result: dict, plan_id: int = None):
+        """
+        Run the job again later after an urgent plan preempted it. The
+        interrupted solve's incumbent is kept under incumbent_ref so the
+        retry starts from it (see resume_warm_start).
+        """
+        if result.get('assignments'):
+            incumbent = {key: value for key, value in result.items() if key != 'assignments'}
+            store_result(self.db, incumbent_ref(self.request.id), incumbent, result['assignments'], plan_id=plan_id)
+            self.db.commit()
+        job_registry.clear_stop(self.request.id)
+        raise self.retry(countdown=PREEMPT_RETRY_SECONDS, max_retries=None)
+    
+    def resume_warm_start(self) -> dict:
+        """
+        wagon_id -> order_id of the incumbent a preempted run left behind
+        (or the last one published in anytime mode), empty on a first run
+        """
+        if not self.request.retries:
+            return {}
+        stored = load_assignments(self.db, incumbent_ref(self.request.id), 0, None)
+        if stored is None:
+            return {}
+        return {assignment['wagon_id']: assignment['order_id'] for assignment in stored[0]}
+    
+    def report_progress(self, progress: int, task_id: str = None, **meta):
+        """
+        Record progress in the task state (for polling) and publish it to the
+        job's event stream; meta with an incumbent is an incumbent event.
+        task_id defaults to the current request's.
+        """
+        task_id = task_id or self.request.id
+        meta = {'progress': progress, **meta}
+        self.update_state(task_id=task_id, state='PROGRESS', meta=meta)
+        job_events.publish(task_id, 'incumbent' if 'incumbent' in meta else 'progress', meta)
+    
+    def report_incumbent(self, incumbent: dict, job_id: str = None, plan_id: int = None):
+        """
+        Save an improving incumbent to the result store and report only its
+        summary (objective, gap, assignment count and result_ref), so the
+        task state and event stream stay small. It may run in the solver's
+        thread, where self.request is empty: the caller passes the job id,
+        and the incumbent gets its own session.
+        """
+        incumbent = dict(incumbent)
+        assignments = incumbent.pop('assignments', [])
+        db = SessionLocal()
+        try:
+            summary = store_result(db, job_id and incumbent_ref(job_id), incumbent, assignments, plan_id=plan_id)
+            db.commit()
+        finally:
+            db.close()
+        self.report_progress(70, task_id=job_id, incumbent=summary)
+    
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        job_registry.mark_finished(task_id)
+        if task_id and status != states.RETRY:
+            # The final result (or the error) replaces the running incumbent
+            db = SessionLocal()
+            try:
+                delete_result(db, incumbent_ref(task_id))
+                db.commit()
+            except Exception:
+                pass
+            finally:
+                db.close()
+        if status == states.RETRY:
+            job_events.publish(task_id, 'progress', {'progress': 0, 'preempted': True})
+        elif isinstance(retval, dict):
+            job_events.publish(task_id, 'completion', retval)
+        else:
+            job_events.publish(task_id, 'completion', {'status': 'error', 'message': str(retval)})
         if self._db is not None:
             self._db.close()
             self._db = None
 
-@celery_app.task(base=DatabaseTask, bind=True)
-def optimize_formation_task(self, plan_id: int):
+class PlanOptimizationTask(DatabaseTask):
+    """Single-plan optimization that holds the plan's in-flight registry entry"""
+    
+    def is_superseded(self, plan_id: int) -> bool:
+        """True once a newer job for the plan replaced this one"""
+        return not job_registry.is_current(plan_id, self.request.id)
+    
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        plan_id = args[0] if args else kwargs.get('plan_id')
+        if plan_id is not None and task_id and status != states.RETRY:
+            job_registry.release(plan_id, task_id)
+        super().after_return(status, retval, task_id, args, kwargs, einfo)
+
+def _cancelled(result: dict, last_incumbent: dict = None, **ids) -> dict:
+    """Result of a cancelled job with the best incumbent found so far (not saved)"""
+    incumbent = result if result.get('assignments') else last_incumbent
+    response = {
+        'status': 'cancelled',
+        **ids,
+        'message': 'Optimization cancelled; the best incumbent found so far was not saved'
+    }
+    if incumbent:
+        response['incumbent'] = {
+            key: incumbent[key] for key in ('assignments', 'total_cost', 'objective_value', 'best_bound', 'gap')
+            if key in incumbent
+        }
+    return response
+
+def _superseded(plan_id: int) -> dict:
+    return {
+        'status': 'superseded',
+        'plan_id': plan_id,
+        'message': 'A newer optimization of this plan replaced this job'
+    }
+
+@celery_app.task(base=PlanOptimizationTask, bind=True)
+def optimize_formation_task(
+    self,
+    plan_id: int,
+    engine: str = None,
+    anytime: bool = False,
+    incremental: bool = False
+):
     """
     Background task to optimize rake formation using OR-Tools
-    This runs asynchronously and doesn't block the API
+    This runs asynchronously and doesn't block the API.
+    engine overrides the plan's optimization_engine for this run.
+    anytime publishes each improving incumbent in the task state
+    (meta['incumbent']) while the solve continues.
+    incremental warm-starts from the plan's current PlanWagonAssignment
+    rows and keeps the assignments that are still valid fixed.
     """
     try:
         # Update progress
-        self.update_state(state='PROGRESS', meta={'progress': 10})
+        self.report_progress(10)
         
         # Fetch plan from database
         plan = self.db.query(models.FormationPlan).filter(
@@ -43,129 +334,407 @@ def optimize_formation_task(self, plan_id: int):
         if not plan:
             return {'status': 'error', 'message': 'Plan not found'}
         
-        self.update_state(state='PROGRESS', meta={'progress': 20})
+        self.report_progress(20)
         
-        # Fetch available wagons at origin stockyard
+        # Current assignments of this plan: released if the new solution
+        # drops them, and the warm start in incremental mode
+        held_wagon_ids = [
+            row.wagon_id for row in self.db.query(models.PlanWagonAssignment.wagon_id).filter(
+                models.PlanWagonAssignment.plan_id == plan_id
+            ).order_by(models.PlanWagonAssignment.sequence_order)
+        ]
+        previous_wagon_ids = held_wagon_ids if incremental else []
+        
+        # Fetch available wagons at origin stockyard; in incremental mode also
+        # the wagons this plan already holds, unless their status changed
+        status_filter = models.Wagon.status == 'Available'
+        if previous_wagon_ids:
+            status_filter = status_filter | (
+                models.Wagon.id.in_(previous_wagon_ids) & (models.Wagon.status == 'Assigned')
+            )
         wagons = self.db.query(models.Wagon).filter(
             models.Wagon.current_stockyard_id == plan.origin_stockyard_id,
-            models.Wagon.status == 'Available'
+            status_filter
         ).all()
         
         # Convert to dict format
-        wagon_list = [
-            {
-                'id': w.id,
-                'wagon_type': w.wagon_type,
-                'capacity_tonnes': float(w.capacity_tonnes),
-                'current_load_tonnes': float(w.current_load_tonnes),
-                'current_stockyard_id': w.current_stockyard_id,
-                'material': w.material,
-                'destination': w.destination,
-            }
-            for w in wagons
-        ]
+        wagon_list = [_wagon_to_dict(w) for w in wagons]
         
-        self.update_state(state='PROGRESS', meta={'progress': 40})
+        self.report_progress(40)
         
-        # Get routes
-        routes = self.db.query(models.Route).filter(
-            models.Route.origin.contains(plan.destination) |
-            models.Route.destination.contains(plan.destination)
-        ).all()
-        
-        route_list = [
-            {
-                'id': r.id,
-                'distance_km': float(r.distance_km),
-                'estimated_duration_hours': float(r.estimated_duration_hours)
-            }
-            for r in routes
-        ]
+        # Get routes from the in-memory index and match each wagon to the
+        # route from its stockyard to the plan destination
+        routes = route_index.current(self.db)
+        route_list = routes.routes_for_place(plan.destination)
+        for wagon in wagon_list:
+            route = routes.route_for(wagon['current_stockyard_id'], plan.destination)
+            if route is not None:
+                wagon['route_id'] = route['id']
         
         # ML: Predict delays for wagons
-        self.update_state(state='PROGRESS', meta={'progress': 50})
-        delays = delay_predictor.predict_batch(wagon_list, route_list)
-        for idx, wagon in enumerate(wagon_list):
-            wagon['predicted_delay'] = delays[idx] if idx < len(delays) else 0
+        self.report_progress(50)
+        # Seeded per plan so re-optimizing unchanged inputs reproduces them
+        delays = delay_predictor.predict_batch(wagon_list, route_list, seed=plan_id)
+        delay_inference = delay_predictor.last_inference
+        for wagon, delay in zip(wagon_list, delays):
+            wagon['predicted_delay'] = delay
         
         # Create simplified orders from plan requirements
-        orders = [
-            {
-                'id': 1,
-                'required_capacity': 300,  # Example: 300 tonnes needed
-                'compatible_wagon_types': ['BOXN', 'BOBRN'],
-                'destination': plan.destination
-            }
-        ]
+        orders = [_plan_order(plan, order_id=1)]
         
-        # Build cost matrix (simplified)
-        cost_matrix = {}
-        for w_idx in range(len(wagon_list)):
-            for o_idx in range(len(orders)):
-                # Base cost on distance + material handling
-                base_cost = 100 + (w_idx * 10)  # Simplified
-                cost_matrix[f"{w_idx}_{o_idx}"] = base_cost
+        cost_matrix = _build_cost_matrix(wagon_list, orders, routes, route_matrix.current(self.db))
         
-        self.update_state(state='PROGRESS', meta={'progress': 60})
+        if self.is_superseded(plan_id):
+            return _superseded(plan_id)
+        self.report_progress(60)
         
-        # Run OR-Tools optimization
-        optimizer = RakeFormationOptimizer(
+        # Run OR-Tools optimization (independent components solved in parallel)
+        optimizer = DecomposedRakeFormationOptimizer(
             wagons=wagon_list,
             orders=orders,
-            cost_matrix=cost_matrix
+            cost_matrix=cost_matrix,
+            engine=engine or plan.optimization_engine,
+            should_stop=self.stop_check()
         )
         
-        result = optimizer.optimize()
+        last_published = [0.0]
+        last_incumbent = [None]
+        job_id = self.request.id
         
-        self.update_state(state='PROGRESS', meta={'progress': 80})
+        def publish_incumbent(incumbent):
+            last_incumbent[0] = incumbent
+            now = time.monotonic()
+            if now - last_published[0] < INCUMBENT_PUBLISH_INTERVAL:
+                return
+            last_published[0] = now
+            self.report_incumbent(incumbent, job_id=job_id, plan_id=plan_id)
         
-        # Save optimized assignments to database
-        if result['status'] == 'optimal':
-            # Delete existing assignments
-            self.db.query(models.PlanWagonAssignment).filter(
-                models.PlanWagonAssignment.plan_id == plan_id
-            ).delete()
+        # Previous assignments all belong to the plan's single order. A run
+        # requeued after preemption starts from where it stopped instead
+        # (as a hint only).
+        resumed = self.resume_warm_start()
+        warm_start = resumed or {wagon_id: orders[0]['id'] for wagon_id in previous_wagon_ids}
+        
+        result = optimizer.optimize(
+            on_solution=publish_incumbent if anytime else None,
+            warm_start=warm_start or None,
+            fix_warm_start=incremental and not resumed
+        )
+        
+        self.report_progress(80)
+        
+        # Stop requests interrupt the solver; a timed-out solve is saved like
+        # any other time-limited one
+        stopped = result.get('interrupted')
+        if stopped == 'preempted':
+            self.requeue_preempted(result, plan_id=plan_id)
+        if stopped == 'superseded':
+            return _superseded(plan_id)
+        if stopped == 'cancelled':
+            return self.store_cancelled(_cancelled(result, last_incumbent[0], plan_id=plan_id), plan_id=plan_id)
+        
+        # Save optimized assignments to database (proven optimal or the best
+        # incumbent from a time/gap-limited solve)
+        if result['status'] in ('optimal', 'feasible'):
+            # The plan changed during the solve: leave saving to the newer job
+            if self.is_superseded(plan_id):
+                return _superseded(plan_id)
             
-            # Create new assignments
-            for assignment in result['assignments']:
-                db_assignment = models.PlanWagonAssignment(
-                    plan_id=plan_id,
-                    wagon_id=assignment['wagon_id'],
-                    sequence_order=assignment['sequence_order']
-                )
-                self.db.add(db_assignment)
-                
-                # Update wagon status
-                wagon = self.db.query(models.Wagon).filter(
-                    models.Wagon.id == assignment['wagon_id']
-                ).first()
-                if wagon:
-                    wagon.status = 'Assigned'
+            # Claim the wagons and write the assignments in one transaction
+            _persist_assignments(self.db, {plan_id: result['assignments']}, held_wagon_ids=held_wagon_ids)
             
             # Update plan with optimization results
             plan.status = 'Approved'
             plan.projected_savings = result['cost_savings']
             plan.time_savings_hours = result['time_savings_hours']
             
-            self.db.commit()
-            
-            self.update_state(state='PROGRESS', meta={'progress': 100})
-            
-            return {
+            response = {
                 'status': 'completed',
                 'plan_id': plan_id,
-                'assignments': result['assignments'],
                 'cost_savings': result['cost_savings'],
                 'time_savings_hours': result['time_savings_hours'],
-                'total_wagons_assigned': len(result['assignments'])
+                'total_wagons_assigned': len(result['assignments']),
+                'solution_status': result['status'],
+                'objective_value': result['objective_value'],
+                'best_bound': result['best_bound'],
+                'engine': result['engine'],
+                'solve_time_seconds': result['solve_time_seconds'],
+                'gap': result['gap'],
+                'ml_inference': delay_inference
+            }
+            if 'warm_start' in result:
+                response['warm_start'] = result['warm_start']
+            # The assignments go to the result store in the same transaction;
+            # the Celery result only references them
+            response = store_result(self.db, self.request.id, response, result['assignments'], plan_id=plan_id)
+            self.db.commit()
+            
+            self.report_progress(100)
+            return response
+        elif result['status'] == 'no_solution':
+            # Out of time before any solution: not evidence that the plan is infeasible
+            return {
+                'status': 'timed_out',
+                'plan_id': plan_id,
+                'message': result['message'],
+                'best_bound': result.get('best_bound'),
+                'solve_time_seconds': result.get('solve_time_seconds')
             }
         else:
             return {
                 'status': 'failed',
-                'message': result.get('message', 'Optimization failed')
+                'message': result.get('message', result.get('error', 'Optimization failed'))
             }
-            
+    
+    except Retry:
+        raise
+    except WagonConflictError as e:
+        return {
+            'status': 'conflict',
+            'plan_id': plan_id,
+            'message': str(e),
+            'wagon_ids': e.wagon_ids
+        }
+    except Exception as e:
+        self.db.rollback()
+        return {
+            'status': 'error',
+            'message': str(e)
+        }
+
+@celery_app.task(base=DatabaseTask, bind=True)
+def optimize_formation_batch_task(self, plan_ids: list, engine: str = None):
+    """
+    Jointly optimize several formation plans in one model, so plans that
+    share a stockyard draw on the same wagon pool instead of competing in
+    back-to-back solves. Wagons are fetched once and all assignments are
+    written in a single transaction.
+    A plan that cannot be served does not sink the batch: the other plans
+    are saved, it keeps its previous assignments and status, and it is
+    reported with status 'infeasible' (overall status 'partial'). A plan
+    left without a solution when the time limit ran out is handled the same
+    way but reported as 'timed_out'.
+    """
+    try:
+        self.report_progress(10)
+        
+        plans = self.db.query(models.FormationPlan).filter(
+            models.FormationPlan.id.in_(plan_ids)
+        ).order_by(models.FormationPlan.id).all()
+        
+        if not plans:
+            return {'status': 'error', 'message': 'No plans found'}
+        
+        self.report_progress(20)
+        
+        # Current assignments of the batch plans: the served plans release
+        # what they no longer use
+        held = [
+            (row.plan_id, row.wagon_id) for row in self.db.query(
+                models.PlanWagonAssignment.plan_id, models.PlanWagonAssignment.wagon_id
+            ).filter(models.PlanWagonAssignment.plan_id.in_([plan.id for plan in plans]))
+        ]
+        
+        # Fetch available wagons at every origin stockyard once, plus the
+        # wagons the batch plans already hold, unless their status changed
+        stockyard_ids = {plan.origin_stockyard_id for plan in plans}
+        status_filter = models.Wagon.status == 'Available'
+        if held:
+            status_filter = status_filter | (
+                models.Wagon.id.in_([wagon_id for _, wagon_id in held]) & (models.Wagon.status == 'Assigned')
+            )
+        wagons = self.db.query(models.Wagon).filter(
+            models.Wagon.current_stockyard_id.in_(stockyard_ids),
+            status_filter
+        ).all()
+        wagon_list = [_wagon_to_dict(w) for w in wagons]
+        
+        self.report_progress(40)
+        
+        # Get routes for all plan destinations from the in-memory index
+        routes = route_index.current(self.db)
+        route_list = list({
+            route['id']: route
+            for destination in sorted({plan.destination for plan in plans})
+            for route in routes.routes_for_place(destination)
+        }.values())
+        
+        # ML: Predict delays for wagons
+        self.report_progress(50)
+        delays = delay_predictor.predict_batch(wagon_list, route_list, seed=min(plan_ids))
+        delay_inference = delay_predictor.last_inference
+        for wagon, delay in zip(wagon_list, delays):
+            wagon['predicted_delay'] = delay
+        
+        # One order per plan, keyed by plan id and restricted to its origin
+        orders = [
+            _plan_order(plan, order_id=plan.id, origin_stockyard_id=plan.origin_stockyard_id)
+            for plan in plans
+        ]
+        cost_matrix = _build_cost_matrix(wagon_list, orders, routes, route_matrix.current(self.db))
+        
+        self.report_progress(60)
+        
+        # Plans at different stockyards become independent components;
+        # partial leaves plans that cannot be served empty
+        optimizer = DecomposedRakeFormationOptimizer(
+            wagons=wagon_list,
+            orders=orders,
+            cost_matrix=cost_matrix,
+            engine=engine,
+            should_stop=self.stop_check(),
+            partial=True
+        )
+        # A run requeued after preemption starts from where it stopped
+        result = optimizer.optimize(warm_start=self.resume_warm_start() or None)
+        
+        self.report_progress(80)
+        
+        stopped = result.get('interrupted')
+        if stopped == 'preempted':
+            self.requeue_preempted(result)
+        if stopped == 'cancelled':
+            return self.store_cancelled(_cancelled(result, plan_ids=[plan.id for plan in plans]))
+        
+        if result['status'] not in ('optimal', 'feasible'):
+            return {
+                'status': 'timed_out' if result['status'] == 'no_solution' else 'failed',
+                'plan_ids': [plan.id for plan in plans],
+                'infeasible_plan_ids': result.get('unserved_order_ids', []),
+                'timed_out_plan_ids': result.get('unsolved_order_ids', []),
+                'best_bound': result.get('best_bound'),
+                'message': result.get('message', result.get('error', 'Optimization failed'))
+            }
+        
+        # Group assignments by served plan and renumber sequences within each plan
+        unserved_ids = set(result.get('unserved_order_ids', []))
+        unsolved_ids = set(result.get('unsolved_order_ids', []))
+        served = [plan for plan in plans if plan.id not in unserved_ids | unsolved_ids]
+        plan_assignments = {plan.id: [] for plan in served}
+        for assignment in result['assignments']:
+            rows = plan_assignments[assignment['order_id']]
+            rows.append({**assignment, 'sequence_order': len(rows) + 1})
+        
+        # Persist every served plan in one transaction, releasing the wagons
+        # they held before and no longer use. Wagons moved over from a plan
+        # that was not served are taken off that plan.
+        assigned_ids = [assignment['wagon_id'] for assignment in result['assignments']]
+        assigned = set(assigned_ids)
+        moved_ids = [
+            wagon_id for plan_id, wagon_id in held
+            if plan_id not in plan_assignments and wagon_id in assigned
+        ]
+        held_wagon_ids = [wagon_id for plan_id, wagon_id in held if plan_id in plan_assignments]
+        _persist_assignments(self.db, plan_assignments, held_wagon_ids=held_wagon_ids + moved_ids)
+        if moved_ids:
+            self.db.query(models.PlanWagonAssignment).filter(
+                models.PlanWagonAssignment.plan_id.notin_(list(plan_assignments)),
+                models.PlanWagonAssignment.wagon_id.in_(moved_ids)
+            ).delete(synchronize_session=False)
+        
+        # Split the joint savings across plans by their share of wagons
+        total_assigned = max(len(assigned_ids), 1)
+        for plan in served:
+            share = len(plan_assignments[plan.id]) / total_assigned
+            plan.status = 'Approved'
+            plan.projected_savings = result['cost_savings'] * share
+            plan.time_savings_hours = optimizer._calculate_time_savings(plan_assignments[plan.id])
+        
+        plan_reports = []
+        for plan in plans:
+            if plan.id in unserved_ids:
+                plan_reports.append({
+                    'plan_id': plan.id,
+                    'status': 'infeasible',
+                    'message': 'Not enough compatible wagons to fill this plan'
+                })
+            elif plan.id in unsolved_ids:
+                plan_reports.append({
+                    'plan_id': plan.id,
+                    'status': 'timed_out',
+                    'message': 'No solution found for this plan within the time limit'
+                })
+            else:
+                plan_reports.append({
+                    'plan_id': plan.id,
+                    'status': 'completed',
+                    'total_wagons_assigned': len(plan_assignments[plan.id]),
+                    'projected_savings': plan.projected_savings,
+                    'time_savings_hours': plan.time_savings_hours
+                })
+        
+        response = {
+            'status': 'partial' if unserved_ids or unsolved_ids else 'completed',
+            'plan_ids': [plan.id for plan in plans],
+            'infeasible_plan_ids': [plan.id for plan in plans if plan.id in unserved_ids],
+            'timed_out_plan_ids': [plan.id for plan in plans if plan.id in unsolved_ids],
+            'plans': plan_reports,
+            'cost_savings': result['cost_savings'],
+            'time_savings_hours': result['time_savings_hours'],
+            'total_wagons_assigned': len(assigned_ids),
+            'solution_status': result['status'],
+            'objective_value': result['objective_value'],
+            'best_bound': result['best_bound'],
+            'engine': result['engine'],
+            'solve_time_seconds': result['solve_time_seconds'],
+            'gap': result['gap'],
+            'ml_inference': delay_inference
+        }
+        # Stored plan by plan (order_id is the plan id), sequences per plan
+        response = store_result(
+            self.db, self.request.id, response,
+            [assignment for plan in served for assignment in plan_assignments[plan.id]]
+        )
+        self.db.commit()
+        
+        self.report_progress(100)
+        return response
+    
+    except Retry:
+        raise
+    except WagonConflictError as e:
+        return {
+            'status': 'conflict',
+            'plan_ids': plan_ids,
+            'message': str(e),
+            'wagon_ids': e.wagon_ids
+        }
+    except Exception as e:
+        self.db.rollback()
+        return {
+            'status': 'error',
+            'message': str(e)
+        }
+
+@celery_app.task(base=DatabaseTask, bind=True)
+def train_models_task(self, full: bool = False):
+    """
+    Retrain the delay and fulfillment models from plan history (scheduled
+    nightly by Celery beat). Incremental unless full is set.
+    """
+    from .training import train_models  # imports XGBoost; keep it off the task module import
+    
+    try:
+        report = train_models(self.db, full=full)
+        if report['status'] == 'trained':
+            # Serve the new boosters from this worker right away; other
+            # processes pick them up on their next reload check
+            delay_predictor.reload()
+            fulfillment_predictor.reload()
+        return report
+    except Exception as e:
+        return {
+            'status': 'error',
+            'message': str(e)
+        }
+
+@celery_app.task(base=DatabaseTask, bind=True)
+def purge_results_task(self):
+    """Delete stored optimization results past their retention (scheduled nightly)"""
+    try:
+        return {'status': 'completed', 'deleted': purge_results(self.db)}
     except Exception as e:
+        self.db.rollback()
         return {
             'status': 'error',
             'message': str(e)
@@ -0,0 +1,317 @@
+"""
+Offline training pipeline for the delay and fulfillment models
+Streams plan history (PlanWagonAssignment rows joined with the wagons and
+the plan's RakeMovement record) from the database in keyset-paginated
+chunks, builds the same features the predictors score with and spills each
+chunk to disk. XGBoost then reads the chunks through a DataIter, so the
+history is never held in memory in full.
+
+Incremental runs continue boosting from the previous booster using only
+plans with movements newer than the last run's watermark. Once that would
+grow a booster past ML_TRAINING_MAX_ROUNDS trees that booster is retrained
+from scratch instead, so model size and scoring time stay bounded.
+
+Usage:
+    python -m api.training           # incremental (full when no model exists)
+    python -m api.training --full
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import xgboost as xgb
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+from .ml_models import (
+    delay_predictor, fulfillment_predictor,
+    DELAY_FEATURES, FULFILLMENT_FEATURES, MODEL_DIR, DELAY_MODEL_PATH, FULFILLMENT_MODEL_PATH
+)
+
+TRAINING_STATE_PATH = os.path.join(MODEL_DIR, "training_state.json")
+# Plans per streamed chunk
+TRAINING_CHUNK_PLANS = int(os.getenv("ML_TRAINING_CHUNK_PLANS", "1000"))
+FULL_BOOST_ROUNDS = int(os.getenv("ML_TRAINING_ROUNDS", "100"))
+INCREMENTAL_BOOST_ROUNDS = int(os.getenv("ML_TRAINING_INCREMENTAL_ROUNDS", "20"))
+# Trees a booster may reach through incremental runs before a full retrain
+MAX_BOOST_ROUNDS = int(os.getenv("ML_TRAINING_MAX_ROUNDS", "300"))
+
+DELAY_PARAMS = {'objective': 'reg:squarederror', 'max_depth': 6, 'eta': 0.1}
+FULFILLMENT_PARAMS = {'objective': 'binary:logistic', 'max_depth': 6, 'eta': 0.1}
+
+# Only finished plans carry a fulfillment outcome
+FULFILLMENT_LABELS = {'Completed': 1.0, 'Rejected': 0.0}
+# Same simplified requirement _plan_order uses when optimizing a plan
+PLAN_REQUIRED_CAPACITY = 300.0
+
+
+def _plan_history_chunks(db: Session, since: Optional[datetime], chunk_size: int):
+    """
+    Yield lists of per-plan movement summaries (plan_id, delay, last_seen),
+    chunk_size plans at a time. The ids of the plans to train on (those with
+    a movement newer than since, if given) are collected in one pass; each
+    chunk then aggregates only its own plans' movements.
+    """
+    query = db.query(models.RakeMovement.plan_id).filter(models.RakeMovement.plan_id.isnot(None))
+    if since is not None:
+        query = query.filter(models.RakeMovement.timestamp > since)
+    plan_ids = [row.plan_id for row in query.distinct().order_by(models.RakeMovement.plan_id)]
+    
+    for c_start in range(0, len(plan_ids), chunk_size):
+        yield db.query(
+            models.RakeMovement.plan_id,
+            func.max(models.RakeMovement.delay_minutes).label('delay'),
+            func.max(models.RakeMovement.timestamp).label('last_seen')
+        ).filter(
+            models.RakeMovement.plan_id.in_(plan_ids[c_start:c_start + chunk_size])
+        ).group_by(models.RakeMovement.plan_id).order_by(models.RakeMovement.plan_id).all()
+
+
+def _chunk_examples(db: Session, history) -> Dict[str, np.ndarray]:
+    """Delay (one row per assigned wagon) and fulfillment (one row per finished plan) examples"""
+    plan_ids = [row.plan_id for row in history]
+    plan_delay = {row.plan_id: float(row.delay or 0) for row in history}
+    
+    plans = db.query(
+        models.FormationPlan.id,
+        models.FormationPlan.status,
+        models.Route.distance_km,
+        models.Route.estimated_duration_hours
+    ).outerjoin(
+        models.Route, models.Route.route_name == models.FormationPlan.route
+    ).filter(models.FormationPlan.id.in_(plan_ids)).all()
+    plan_index = {plan.id: p_idx for p_idx, plan in enumerate(plans)}
+    routes = [
+        {'distance_km': plan.distance_km or 0, 'estimated_duration_hours': plan.estimated_duration_hours or 0}
+        for plan in plans
+    ]
+    
+    assignments = db.query(
+        models.PlanWagonAssignment.plan_id,
+        models.Wagon.wagon_type,
+        models.Wagon.capacity_tonnes,
+        models.Wagon.current_load_tonnes
+    ).join(
+        models.Wagon, models.Wagon.id == models.PlanWagonAssignment.wagon_id
+    ).filter(models.PlanWagonAssignment.plan_id.in_(plan_ids)).all()
+    assignments = [row for row in assignments if row.plan_id in plan_index]
+    
+    wagons = [
+        {'wagon_type': row.wagon_type, 'capacity_tonnes': row.capacity_tonnes,
+         'current_load_tonnes': row.current_load_tonnes}
+        for row in assignments
+    ]
+    route_indices = np.fromiter((plan_index[row.plan_id] for row in assignments), dtype=np.int64, count=len(assignments))
+    examples = {
+        f'delay_{column}': values
+        for column, values in delay_predictor.batch_features(wagons, routes, route_indices=route_indices).items()
+    }
+    examples['delay_label'] = np.fromiter((plan_delay[row.plan_id] for row in assignments), dtype=np.float64, count=len(assignments))
+    
+    # Capacity each finished plan actually received
+    allocated = np.bincount(
+        route_indices,
+        weights=np.fromiter((row.capacity_tonnes or 0 for row in assignments), dtype=np.float64, count=len(assignments)),
+        minlength=len(plans)
+    )
+    finished = [p_idx for p_idx, plan in enumerate(plans) if plan.status in FULFILLMENT_LABELS]
+    fulfillment = fulfillment_predictor.batch_features([
+        {'capacity_allocated': allocated[p_idx], 'required_capacity': PLAN_REQUIRED_CAPACITY,
+         'distance_km': routes[p_idx]['distance_km']}
+        for p_idx in finished
+    ])
+    examples.update({f'fulfillment_{column}': values for column, values in fulfillment.items()})
+    examples['fulfillment_label'] = np.array([FULFILLMENT_LABELS[plans[p_idx].status] for p_idx in finished])
+    return examples
+
+
+class _ChunkIterator(xgb.DataIter):
+    """Feeds spilled .npz chunks to XGBoost one at a time"""
+    
+    def __init__(self, paths: List[str], prefix: str, feature_columns):
+        self._paths = paths
+        self._prefix = prefix
+        self._feature_columns = feature_columns
+        self._position = 0
+        super().__init__(cache_prefix=None)
+    
+    def next(self, input_data) -> bool:
+        if self._position == len(self._paths):
+            return False
+        with np.load(self._paths[self._position]) as chunk:
+            data = np.column_stack([
+                chunk[f'{self._prefix}_{column}'].astype(np.float32) for column in self._feature_columns
+            ])
+            input_data(data=data, label=chunk[f'{self._prefix}_label'])
+        self._position += 1
+        return True
+    
+    def reset(self):
+        self._position = 0
+
+
+def _train_booster(paths: List[str], prefix: str, feature_columns, params: Dict,
+                   rounds: int, previous: Optional[xgb.Booster]) -> Optional[xgb.Booster]:
+    """Train (or continue training) one booster over the spilled chunks"""
+    if not paths:
+        return None
+    dtrain = xgb.QuantileDMatrix(_ChunkIterator(paths, prefix, feature_columns))
+    return xgb.train(params, dtrain, num_boost_round=rounds, xgb_model=previous)
+
+
+def _load_booster(path: str) -> Optional[xgb.Booster]:
+    if not os.path.exists(path):
+        return None
+    return xgb.Booster(model_file=path)
+
+
+def _save_booster(booster: xgb.Booster, path: str):
+    """Write atomically so a predictor never loads a half-written file"""
+    base, extension = os.path.splitext(path)
+    tmp_path = f"{base}.tmp{extension}"  # save_model picks the format from the extension
+    booster.save_model(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _save_state(state: Dict):
+    tmp_path = f"{TRAINING_STATE_PATH}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, TRAINING_STATE_PATH)
+
+
+def _load_state() -> Dict:
+    if not os.path.exists(TRAINING_STATE_PATH):
+        return {}
+    with open(TRAINING_STATE_PATH) as f:
+        return json.load(f)
+
+
+def _previous_booster(path: str, full: bool) -> Optional[xgb.Booster]:
+    """The booster to continue, or None when it must be trained from scratch"""
+    booster = None if full else _load_booster(path)
+    if booster is not None and booster.num_boosted_rounds() + INCREMENTAL_BOOST_ROUNDS > MAX_BOOST_ROUNDS:
+        return None
+    return booster
+
+
+def train_models(db: Session, full: bool = False, chunk_size: int = TRAINING_CHUNK_PLANS) -> Dict:
+    """
+    Train the delay and fulfillment boosters from plan history.
+    Incremental (the default) continues each existing booster on plans with
+    movements newer than the stored watermark; full retrains from scratch.
+    The choice is made per booster: one that is missing or would exceed
+    MAX_BOOST_ROUNDS trees is retrained on the full history while the other
+    still continues on the new plans ('mode': 'mixed').
+    """
+    start = time.perf_counter()
+    state = _load_state()
+    last_watermark = datetime.fromisoformat(state['watermark']) if state.get('watermark') else None
+    previous_delay = _previous_booster(DELAY_MODEL_PATH, full or last_watermark is None)
+    previous_fulfillment = _previous_booster(FULFILLMENT_MODEL_PATH, full or last_watermark is None)
+    modes = {
+        'delay': 'full' if previous_delay is None else 'incremental',
+        'fulfillment': 'full' if previous_fulfillment is None else 'incremental',
+    }
+    # Stream only the new plans unless a booster needs the whole history
+    since = last_watermark if 'full' not in modes.values() else None
+    
+    report = {
+        'mode': modes['delay'] if modes['delay'] == modes['fulfillment'] else 'mixed',
+        'delay_mode': modes['delay'],
+        'fulfillment_mode': modes['fulfillment'],
+        'since': state.get('watermark') if 'incremental' in modes.values() else None,
+        'plans': 0,
+        'delay_rows': 0,
+        'fulfillment_rows': 0,
+    }
+    watermark = last_watermark
+    
+    with tempfile.TemporaryDirectory(prefix='training-') as spill_dir:
+        paths = {'delay': [], 'fulfillment': []}
+        for c_idx, history in enumerate(_plan_history_chunks(db, since, chunk_size)):
+            # (history, spill path) per mode; a mixed run's continued booster
+            # only sees the new plans
+            chunks = {'full': (history, os.path.join(spill_dir, f'chunk-{c_idx:05d}.npz'))}
+            chunks['incremental'] = chunks['full']
+            if since is None and 'incremental' in modes.values():
+                chunks['incremental'] = (
+                    [row for row in history if row.last_seen is not None and row.last_seen > last_watermark],
+                    os.path.join(spill_dir, f'chunk-{c_idx:05d}-new.npz')
+                )
+            spilled = {}
+            for mode in set(modes.values()):
+                chunk_history, path = chunks[mode]
+                if chunk_history and path not in spilled:
+                    spilled[path] = _chunk_examples(db, chunk_history)
+                    np.savez(path, **spilled[path])
+            for prefix, mode in modes.items():
+                path = chunks[mode][1]
+                rows = len(spilled[path][f'{prefix}_label']) if path in spilled else 0
+                if rows:
+                    paths[prefix].append(path)
+                report[f'{prefix}_rows'] += rows
+            
+            report['plans'] += len(history)
+            seen = [row.last_seen for row in history if row.last_seen is not None]
+            if seen and (watermark is None or max(seen) > watermark):
+                watermark = max(seen)
+            # Release the chunk before streaming the next one
+            db.expunge_all()
+        
+        if not paths['delay'] and not paths['fulfillment']:
+            return {'status': 'skipped', 'message': 'No new plan history to train on', **report}
+        
+        rounds = {
+            prefix: INCREMENTAL_BOOST_ROUNDS if mode == 'incremental' else FULL_BOOST_ROUNDS
+            for prefix, mode in modes.items()
+        }
+        delay_booster = _train_booster(
+            paths['delay'], 'delay', DELAY_FEATURES, DELAY_PARAMS, rounds['delay'], previous_delay
+        )
+        fulfillment_booster = _train_booster(
+            paths['fulfillment'], 'fulfillment', FULFILLMENT_FEATURES, FULFILLMENT_PARAMS,
+            rounds['fulfillment'], previous_fulfillment
+        )
+    
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    if delay_booster is not None:
+        _save_booster(delay_booster, DELAY_MODEL_PATH)
+    if fulfillment_booster is not None:
+        _save_booster(fulfillment_booster, FULFILLMENT_MODEL_PATH)
+    
+    report.update({
+        'status': 'trained',
+        'watermark': watermark.isoformat() if watermark is not None else None,
+        'delay_trees': delay_booster.num_boosted_rounds() if delay_booster is not None else None,
+        'fulfillment_trees': fulfillment_booster.num_boosted_rounds() if fulfillment_booster is not None else None,
+        'trained_at': datetime.utcnow().isoformat(),
+        'seconds': round(time.perf_counter() - start, 3),
+    })
+    _save_state({**state, **report})
+    return report
+
+
+def main():
+    from .database import SessionLocal
+    
+    parser = argparse.ArgumentParser(description='Train the delay and fulfillment models from plan history')
+    parser.add_argument('--full', action='store_true', help='Retrain from scratch instead of continuing the previous models')
+    parser.add_argument('--chunk-size', type=int, default=TRAINING_CHUNK_PLANS, help='Plans per streamed chunk')
+    args = parser.parse_args()
+    
+    db = SessionLocal()
+    try:
+        print(json.dumps(train_models(db, full=args.full, chunk_size=args.chunk_size), indent=2))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+Optimizer benchmark suite
+Runs RakeFormationOptimizer over synthetic fleets of increasing size for each
+engine and mode, recording model build time, solve time, peak memory and
+solution quality, and writes the results to JSON for before/after comparison.
+Timings come from an untraced run; --trace-memory adds a separate, untimed
+run per case under tracemalloc for the Python heap peak.
+
+Usage:
+    python benchmarks/bench_optimizer.py --sizes 10,100,1000 --engines cpsat,heuristic
+    python benchmarks/bench_optimizer.py --sizes 1000 --trace-memory
+    python benchmarks/bench_optimizer.py --compare benchmarks/results/baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic_fleet import generate_fleet
+
+DEFAULT_SIZES = [10, 100, 1000, 5000, 20000]
+DEFAULT_ENGINES = ['scip', 'cpsat', 'heuristic']
+MODES = ['monolithic', 'decomposed', 'incremental']
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+# Fraction of wagons that become unavailable before the incremental re-solve
+INCREMENTAL_DROP_RATIO = 0.01
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _run_case(n_wagons: int, engine: str, mode: str, seed: int, time_limit: float, queue, traced: bool = False):
+    """
+    Subprocess body: generate the fleet, solve once and report metrics. A
+    traced run (tracemalloc slows allocation-heavy code) only reports the
+    traced heap peak.
+    """
+    from api.optimizer import RakeFormationOptimizer
+    from api.decomposition import DecomposedRakeFormationOptimizer
+    
+    try:
+        wagons, orders, cost_matrix = generate_fleet(n_wagons, seed=seed)
+        if traced:
+            tracemalloc.start()
+        optimizer_class = DecomposedRakeFormationOptimizer if mode == 'decomposed' else RakeFormationOptimizer
+        start = time.perf_counter()
+        optimizer = optimizer_class(
+            wagons, orders, cost_matrix,
+            engine=engine, time_limit_seconds=time_limit, use_cache=False
+        )
+        result = optimizer.optimize()
+        
+        if mode == 'incremental' and result.get('assignments'):
+            # Re-solve after a few wagons drop out, warm-started from the first
+            # plan with the unaffected assignments fixed (as incremental=true does)
+            previous = {a['wagon_id']: a['order_id'] for a in result['assignments']}
+            dropped = set(list(previous)[::max(1, int(1 / INCREMENTAL_DROP_RATIO))])
+            remaining = [wagon for wagon in wagons if wagon['id'] not in dropped]
+            keep_rows = [w_idx for w_idx, wagon in enumerate(wagons) if wagon['id'] not in dropped]
+            start = time.perf_counter()
+            optimizer = RakeFormationOptimizer(
+                remaining, orders, cost_matrix[keep_rows],
+                engine=engine, time_limit_seconds=time_limit, use_cache=False
+            )
+            result = optimizer.optimize(warm_start={
+                wagon_id: order_id for wagon_id, order_id in previous.items() if wagon_id not in dropped
+            }, fix_warm_start=True)
+        
+        wall_seconds = time.perf_counter() - start
+        if traced:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            queue.put({'peak_traced_mb': round(traced_peak / (1024 * 1024), 1)})
+            return
+        queue.put({
+            'status': result.get('status'),
+            'objective_value': result.get('objective_value'),
+            'best_bound': result.get('best_bound'),
+            'gap': result.get('gap'),
+            'assignments': len(result.get('assignments', [])),
+            'components': result.get('components', 1),
+            'model_build_seconds': result.get('model_build_seconds'),
+            'solve_time_seconds': result.get('solve_time_seconds'),
+            'wall_seconds': round(wall_seconds, 4),
+            'peak_rss_mb': _peak_rss_mb(),
+            'warm_start': result.get('warm_start'),
+            'error': result.get('error'),
+        })
+    except Exception as e:
+        queue.put({'status': 'error', 'error': str(e)})
+
+
+def _spawn_case(n_wagons: int, engine: str, mode: str, seed: int, time_limit: float, traced: bool) -> dict:
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(n_wagons, engine, mode, seed, time_limit, queue, traced))
+    process.start()
+    try:
+        # Generous deadline: model build is not covered by the solver time limit
+        metrics = queue.get(timeout=time_limit * 10 + 300)
+    except Exception:
+        process.terminate()
+        metrics = {'status': 'error', 'error': 'benchmark case timed out'}
+    process.join()
+    return metrics
+
+
+def run_case(n_wagons: int, engine: str, mode: str, seed: int, time_limit: float,
+             trace_memory: bool = False) -> dict:
+    """
+    Run one case in a fresh spawned process so peak memory is per case and
+    not inflated by earlier, larger runs; with trace_memory the traced heap
+    peak comes from a second, untimed process.
+    """
+    metrics = _spawn_case(n_wagons, engine, mode, seed, time_limit, traced=False)
+    if trace_memory and metrics.get('status') != 'error':
+        traced = _spawn_case(n_wagons, engine, mode, seed, time_limit, traced=True)
+        metrics['peak_traced_mb'] = traced.get('peak_traced_mb')
+    return {'n_wagons': n_wagons, 'engine': engine, 'mode': mode, **metrics}
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def _metadata(args) -> dict:
+    try:
+        import ortools
+        ortools_version = ortools.__version__
+    except Exception:
+        ortools_version = None
+    return {
+        'git_revision': _git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'ortools': ortools_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'time_limit_seconds': args.time_limit,
+        'trace_memory': args.trace_memory,
+    }
+
+
+def _case_key(case: dict):
+    return case['n_wagons'], case['engine'], case['mode']
+
+
+def compare(current: dict, baseline: dict):
+    """Print per-case timing ratios and objective changes against a baseline run"""
+    previous = {_case_key(case): case for case in baseline.get('cases', [])}
+    print(f"\nComparison against {baseline['metadata'].get('git_revision')} "
+          f"({baseline['metadata'].get('timestamp')})")
+    print(f"{'wagons':>7} {'engine':<10} {'mode':<12} {'build x':>8} {'solve x':>8} {'rss x':>7} {'objective':>12}")
+    for case in current['cases']:
+        before = previous.get(_case_key(case))
+        if before is None or case.get('status') == 'error' or before.get('status') == 'error':
+            continue
+        
+        def ratio(field):
+            if not before.get(field) or case.get(field) is None:
+                return '-'
+            return f"{case[field] / before[field]:.2f}"
+        
+        objective_change = '-'
+        if case.get('objective_value') is not None and before.get('objective_value'):
+            objective_change = f"{(case['objective_value'] - before['objective_value']) / before['objective_value']:+.2%}"
+        print(f"{case['n_wagons']:>7} {case['engine']:<10} {case['mode']:<12} "
+              f"{ratio('model_build_seconds'):>8} {ratio('solve_time_seconds'):>8} "
+              f"{ratio('peak_rss_mb'):>7} {objective_change:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the rake formation optimizer')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Comma-separated fleet sizes (number of wagons)')
+    parser.add_argument('--engines', default=','.join(DEFAULT_ENGINES))
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--time-limit', type=float, default=60.0,
+                        help='Solver time limit per case in seconds')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Also measure the traced Python heap peak in a separate untimed run per case')
+    parser.add_argument('--output', help='Result JSON path (default: benchmarks/results/<rev>-<time>.json)')
+    parser.add_argument('--compare', help='Baseline result JSON to compare against')
+    args = parser.parse_args()
+    
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    engines = [engine for engine in args.engines.split(',') if engine]
+    modes = [mode for mode in args.modes.split(',') if mode]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"Unknown mode '{mode}'. Choose one of: {', '.join(MODES)}")
+    
+    report = {'metadata': _metadata(args), 'cases': []}
+    print(f"{'wagons':>7} {'engine':<10} {'mode':<12} {'status':<10} {'build s':>8} {'solve s':>8} "
+          f"{'rss MB':>7} {'objective':>12} {'gap':>7}")
+    for n_wagons in sizes:
+        for engine in engines:
+            for mode in modes:
+                case = run_case(n_wagons, engine, mode, args.seed, args.time_limit, args.trace_memory)
+                report['cases'].append(case)
+                objective = case.get('objective_value')
+                gap = case.get('gap')
+                print(f"{n_wagons:>7} {engine:<10} {mode:<12} {str(case.get('status')):<10} "
+                      f"{case.get('model_build_seconds') or 0:>8.3f} {case.get('solve_time_seconds') or 0:>8.3f} "
+                      f"{case.get('peak_rss_mb') or 0:>7.1f} "
+                      f"{round(objective, 2) if objective is not None else '-':>12} "
+                      f"{gap if gap is not None else '-':>7}", flush=True)
+                if case.get('error'):
+                    print(f"        error: {case['error']}")
+    
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(
+            RESULTS_DIR, f"{report['metadata']['git_revision']}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
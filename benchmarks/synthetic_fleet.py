@@ -0,0 +1,93 @@
+"""
+Seeded synthetic fleet generator for optimizer benchmarks
+Produces wagons, orders and a cost matrix shaped like the dicts
+optimize_formation_task feeds to RakeFormationOptimizer.
+"""
+from typing import Dict, List, Tuple
+import numpy as np
+
+WAGON_TYPES = ['BOXN', 'BOBRN', 'BCN', 'BCNA']
+WAGON_CAPACITY = {'BOXN': 58.0, 'BOBRN': 60.0, 'BCN': 55.0, 'BCNA': 63.0}
+MATERIALS = ['Iron Ore', 'Coal', 'Steel Coils', 'Limestone']
+DESTINATIONS = ['Mumbai Port', 'Kolkata Port', 'Visakhapatnam Port', 'Chennai Port', 'Delhi']
+COMPATIBILITY_SETS = [['BOXN', 'BOBRN'], ['BCN', 'BCNA'], ['BOXN'], []]
+
+
+def default_order_count(n_wagons: int) -> int:
+    """Dozens of orders at fleet scale, at least one for tiny fleets"""
+    return int(min(60, max(1, n_wagons // 40)))
+
+
+def generate_fleet(
+    n_wagons: int,
+    n_orders: int = None,
+    n_stockyards: int = 4,
+    seed: int = 42,
+    fill_ratio: float = 0.4,
+) -> Tuple[List[Dict], List[Dict], np.ndarray]:
+    """
+    Generate (wagons, orders, cost_matrix) for a fleet of n_wagons.
+    
+    Orders together claim about fill_ratio of the fleet; cost_matrix is a dense (wagons x orders) array.
+    Like formation plans, each order only takes wagons at its origin
+    stockyard, so the instance splits into at least one independent
+    component per stockyard (for the decomposed benchmark).
+    """
+    rng = np.random.default_rng(seed)
+    n_orders = n_orders or default_order_count(n_wagons)
+    
+    type_idx = rng.integers(0, len(WAGON_TYPES), n_wagons)
+    stockyards = rng.integers(1, n_stockyards + 1, n_wagons)
+    capacity_noise = rng.normal(0, 1.5, n_wagons)
+    delays = np.round(rng.gamma(2.0, 4.0, n_wagons), 1)
+    handling = np.round(rng.uniform(0, 40, n_wagons), 2)
+    
+    wagons = []
+    for w_idx in range(n_wagons):
+        wagon_type = WAGON_TYPES[type_idx[w_idx]]
+        wagons.append({
+            'id': f'{wagon_type}-{w_idx:06d}',
+            'wagon_type': wagon_type,
+            'capacity_tonnes': round(WAGON_CAPACITY[wagon_type] + float(capacity_noise[w_idx]), 1),
+            'current_load_tonnes': 0.0,
+            'current_stockyard_id': int(stockyards[w_idx]),
+            'material': MATERIALS[w_idx % len(MATERIALS)],
+            'destination': DESTINATIONS[w_idx % len(DESTINATIONS)],
+            'predicted_delay': float(delays[w_idx]),
+            'material_handling_cost': float(handling[w_idx]),
+        })
+    
+    # Reserve a disjoint set of compatible wagons per order and ask for exactly
+    # their capacity, so every instance is feasible despite the fill window
+    capacities = np.array([wagon['capacity_tonnes'] for wagon in wagons])
+    reserved = np.zeros(n_wagons, dtype=bool)
+    per_order = max(1, int(n_wagons * fill_ratio / n_orders))
+    orders = []
+    for o_idx in range(n_orders):
+        compatible = COMPATIBILITY_SETS[o_idx % len(COMPATIBILITY_SETS)]
+        # Cycle through stockyards and compatibility sets independently
+        stockyard_id = (o_idx // len(COMPATIBILITY_SETS) + o_idx) % n_stockyards + 1
+        at_stockyard = ~reserved & (stockyards == stockyard_id)
+        mask = at_stockyard.copy()
+        if compatible:
+            mask &= np.isin(type_idx, [WAGON_TYPES.index(t) for t in compatible])
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            compatible = []
+            candidates = np.flatnonzero(at_stockyard)
+        if len(candidates) == 0:
+            stockyard_id = None
+            candidates = np.flatnonzero(~reserved)
+        chosen = rng.choice(candidates, size=min(per_order, len(candidates)), replace=False)
+        reserved[chosen] = True
+        orders.append({
+            'id': o_idx + 1,
+            'required_capacity': round(float(capacities[chosen].sum()), 1),
+            'compatible_wagon_types': list(compatible),
+            'origin_stockyard_id': stockyard_id,
+            'destination': DESTINATIONS[o_idx % len(DESTINATIONS)],
+        })
+    
+    # Distance-like base cost per (wagon, order)
+    cost_matrix = np.round(rng.uniform(80, 400, (n_wagons, n_orders)), 2)
+    return wagons, orders, cost_matrix
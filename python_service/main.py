@@ -6,15 +6,22 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Optional
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional, Union, Any
+import time
 import uvicorn
 
-from api.ml_models import DelayPredictor, FulfillmentPredictor
+from api.ml_models import delay_predictor, fulfillment_predictor, warm_up_models, PREWARM_MODELS
 from api.optimizer import RakeFormationOptimizer
+from api.decomposition import DecomposedRakeFormationOptimizer
+from api.optimization_cache import optimization_cache
+from api.prediction_cache import prediction_cache
 
 app = FastAPI(title="SAIL Rake Optimizer - ML/OR Service")
 
+# Largest number of items accepted by one batch prediction request
+MAX_PREDICTION_BATCH = int(os.getenv("ML_MAX_PREDICTION_BATCH", "10000"))
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -24,9 +31,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize models
-delay_predictor = DelayPredictor()
-fulfillment_predictor = FulfillmentPredictor()
+@app.on_event("startup")
+async def prewarm_models():
+    """Load the shared ML models before serving the first request"""
+    if PREWARM_MODELS:
+        warm_up_models()
 
 # Pydantic models for request/response
 class WagonData(BaseModel):
@@ -52,10 +61,27 @@ class FulfillmentPredictionRequest(BaseModel):
     required_capacity: float
     distance_km: float
 
+class DelayBatchPredictionRequest(BaseModel):
+    items: List[DelayPredictionRequest] = Field(..., max_length=MAX_PREDICTION_BATCH)
+
+class FulfillmentBatchPredictionRequest(BaseModel):
+    assignments: List[FulfillmentPredictionRequest] = Field(..., max_length=MAX_PREDICTION_BATCH)
+
 class OptimizationRequest(BaseModel):
     wagons: List[Dict]
     orders: List[Dict]
-    cost_matrix: Dict
+    # Dense [[cost per order] per wagon], sparse {"rows", "cols", "values"}
+    # triplets, or the legacy {"<w_idx>_<o_idx>": cost} dict
+    cost_matrix: Union[List[List[float]], Dict[str, Any]]
+    engine: Optional[str] = None  # 'scip', 'cpsat' or 'heuristic' (fast, approximate)
+    time_limit_seconds: Optional[float] = None
+    num_workers: Optional[int] = None
+    relative_gap: Optional[float] = None
+    # Previous solution {wagon_id: order_id} used as a solver hint
+    warm_start: Optional[Dict[str, Any]] = None
+    fix_warm_start: bool = False
+    # Solve independent wagon/order components concurrently
+    decompose: bool = True
 
 @app.get("/")
 async def root():
@@ -64,8 +90,12 @@ async def root():
         "status": "running",
         "endpoints": [
             "/predict/delay",
+            "/predict/delay/batch",
             "/predict/fulfillment",
-            "/optimize/formation"
+            "/predict/fulfillment/batch",
+            "/predict/cache/stats",
+            "/optimize/formation",
+            "/optimize/cache/stats"
         ]
     }
 
@@ -81,7 +111,8 @@ async def predict_delay(request: DelayPredictionRequest):
         return {
             "predicted_delay_minutes": delay,
             "wagon": wagon_dict,
-            "route": route_dict
+            "route": route_dict,
+            "inference": delay_predictor.last_inference
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -97,7 +128,45 @@ async def predict_fulfillment(request: FulfillmentPredictionRequest):
         return {
             "fulfillment_probability": probability,
             "fulfillment_percentage": round(probability * 100, 1),
-            "assignment": assignment_dict
+            "assignment": assignment_dict,
+            "inference": fulfillment_predictor.last_inference
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/delay/batch")
+async def predict_delay_batch(request: DelayBatchPredictionRequest):
+    """Predict delays for many wagon/route pairs in one pass"""
+    try:
+        start = time.perf_counter()
+        wagons = [item.wagon.model_dump() for item in request.items]
+        routes = [item.route.model_dump() for item in request.items]
+        
+        delays = delay_predictor.predict_delay_batch(wagons, routes)
+        
+        return {
+            "predicted_delay_minutes": delays,
+            "count": len(delays),
+            "elapsed_seconds": round(time.perf_counter() - start, 6),
+            "inference": delay_predictor.last_inference if delays else None
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/fulfillment/batch")
+async def predict_fulfillment_batch(request: FulfillmentBatchPredictionRequest):
+    """Predict fulfillment probabilities for many assignments in one pass"""
+    try:
+        start = time.perf_counter()
+        assignments = [assignment.model_dump() for assignment in request.assignments]
+        
+        probabilities = fulfillment_predictor.predict_fulfillment_batch(assignments)
+        
+        return {
+            "fulfillment_probabilities": probabilities,
+            "count": len(probabilities),
+            "elapsed_seconds": round(time.perf_counter() - start, 6),
+            "inference": fulfillment_predictor.last_inference if probabilities else None
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -106,13 +175,24 @@ async def predict_fulfillment(request: FulfillmentPredictionRequest):
 async def optimize_formation(request: OptimizationRequest):
     """Optimize rake formation using OR-Tools"""
     try:
-        optimizer = RakeFormationOptimizer(
-            wagons=request.wagons,
-            orders=request.orders,
-            cost_matrix=request.cost_matrix
-        )
+        try:
+            optimizer_class = DecomposedRakeFormationOptimizer if request.decompose else RakeFormationOptimizer
+            optimizer = optimizer_class(
+                wagons=request.wagons,
+                orders=request.orders,
+                cost_matrix=request.cost_matrix,
+                engine=request.engine,
+                time_limit_seconds=request.time_limit_seconds,
+                num_workers=request.num_workers,
+                relative_gap=request.relative_gap
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        result = optimizer.optimize()
+        result = optimizer.optimize(
+            warm_start=request.warm_start,
+            fix_warm_start=request.fix_warm_start
+        )
         
         if 'error' in result:
             raise HTTPException(status_code=400, detail=result['error'])
@@ -123,6 +203,16 @@ async def optimize_formation(request: OptimizationRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/predict/cache/stats")
+async def prediction_cache_stats():
+    """Hit rate and eviction counters of the prediction memo cache"""
+    return prediction_cache.stats()
+
+@app.get("/optimize/cache/stats")
+async def optimization_cache_stats():
+    """Hit/miss counters of the optimization result cache"""
+    return optimization_cache.stats()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "models": "loaded"}
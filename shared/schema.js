@@ -1,4 +1,6 @@
-import { pgTable, serial, text, uuid, numeric, timestamp, integer, boolean, jsonb, index, uniqueIndex } from 'drizzle-orm/pg-core';
+import { pgTable, serial, text, uuid, numeric, timestamp, integer, boolean, jsonb, index, uniqueIndex, customType } from 'drizzle-orm/pg-core';
+
+const bytea = customType({ dataType: () => 'bytea' });
 
 // Profiles table
 export const profiles = pgTable('profiles', {
@@ -57,6 +59,7 @@ export const formationPlans = pgTable('formation_plans', {
   updatedAt: timestamp('updated_at', { withTimezone: true }).defaultNow(),
   submittedAt: timestamp('submitted_at', { withTimezone: true }),
   approvedAt: timestamp('approved_at', { withTimezone: true }),
+  optimizationEngine: text('optimization_engine'),
 }, (table) => ({
   createdByStatusIdx: index('idx_formation_plans_created_by').on(table.createdBy, table.status),
   statusIdx: index('idx_formation_plans_status').on(table.status),
@@ -76,6 +79,20 @@ export const planWagonAssignments = pgTable('plan_wagon_assignments', {
   uniquePlanSequence: uniqueIndex('unique_plan_sequence').on(table.planId, table.sequenceOrder),
 }));
 
+// Optimization job results (assignments stored as zlib-compressed JSON)
+export const optimizationResults = pgTable('optimization_results', {
+  jobId: text('job_id').primaryKey(),
+  planId: integer('plan_id').references(() => formationPlans.id, { onDelete: 'cascade' }),
+  status: text('status').notNull(),
+  summary: jsonb('summary'),
+  assignmentCount: integer('assignment_count').default(0),
+  assignments: bytea('assignments'),
+  createdAt: timestamp('created_at', { withTimezone: true }).defaultNow(),
+}, (table) => ({
+  planIdIdx: index('idx_optimization_results_plan_id').on(table.planId),
+  createdAtIdx: index('idx_optimization_results_created_at').on(table.createdAt),
+}));
+
 // Rake movements table
 export const rakeMovements = pgTable('rake_movements', {
   id: serial('id').primaryKey(),
@@ -102,6 +119,7 @@ export const routes = pgTable('routes', {
   waypoints: jsonb('waypoints'),
   status: text('status').default('Active'),
   createdAt: timestamp('created_at', { withTimezone: true }).defaultNow(),
+  updatedAt: timestamp('updated_at', { withTimezone: true }).defaultNow(),
 }, (table) => ({
   statusIdx: index('idx_routes_status').on(table.status),
 }));
@@ -0,0 +1,11 @@
+/*
+  # Optimization engine selection
+
+  ## Changes
+  - formation_plans.optimization_engine: per-plan solver engine override
+    ('scip', 'cpsat' or 'heuristic'); NULL uses the service default
+*/
+
+ALTER TABLE formation_plans
+  ADD COLUMN IF NOT EXISTS optimization_engine text;
+
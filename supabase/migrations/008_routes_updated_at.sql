@@ -0,0 +1,17 @@
+/*
+  # Route change tracking
+
+  ## Changes
+  - routes.updated_at: maintained by trigger; workers compare
+    (count, max(updated_at)) to know when to rebuild their in-memory
+    route index
+*/
+
+ALTER TABLE routes
+  ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+
+DROP TRIGGER IF EXISTS update_routes_updated_at ON routes;
+CREATE TRIGGER update_routes_updated_at
+  BEFORE UPDATE ON routes
+  FOR EACH ROW
+  EXECUTE FUNCTION update_updated_at_column();
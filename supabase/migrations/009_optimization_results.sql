@@ -0,0 +1,25 @@
+/*
+  # Optimization results
+
+  ## Tables
+  - optimization_results: result of an optimization job keyed by its
+    Celery job id. The task result in Redis only references the row; the
+    assignment list is stored once as zlib-compressed JSON and paged by the
+    status endpoint
+*/
+
+CREATE TABLE IF NOT EXISTS optimization_results (
+  job_id text PRIMARY KEY,
+  plan_id integer REFERENCES formation_plans(id) ON DELETE CASCADE,
+  status text NOT NULL,
+  summary jsonb,
+  assignment_count integer DEFAULT 0,
+  assignments bytea,
+  created_at timestamptz DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_optimization_results_plan_id ON optimization_results(plan_id);
+CREATE INDEX IF NOT EXISTS idx_optimization_results_created_at ON optimization_results(created_at);
+
+-- Only the backend (service role) reads and writes job results
+ALTER TABLE optimization_results ENABLE ROW LEVEL SECURITY;
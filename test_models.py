@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 """Test script for ML and OR models"""
 import sys
-sys.path.insert(0, 'api')
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from ml_models import DelayPredictor, FulfillmentPredictor
-from optimizer import RakeFormationOptimizer
+from api.ml_models import DelayPredictor, FulfillmentPredictor
+from api.optimizer import RakeFormationOptimizer
 
 print("=" * 50)
 print("Testing ML Models")
@@ -85,6 +86,411 @@ if 'error' not in result:
 else:
     print(f"   ✗ Error: {result['error']}")
 
+print("\n" + "=" * 50)
+print("Testing Compiled Tree Inference")
+print("=" * 50)
+
+# Compiled inference must match XGBoost on the same booster
+print("\n4. Testing compiled vs XGBoost inference parity...")
+import tempfile
+import numpy as np
+import xgboost as xgb
+from api.ml_models import DELAY_FEATURES
+from api.prediction_cache import prediction_cache
+from api.tree_inference import CompiledEnsemble
+
+rng = np.random.default_rng(7)
+features = (rng.random((2000, len(DELAY_FEATURES))) * [3, 1, 2000, 30]).astype(np.float32)
+features[rng.random(features.shape) < 0.05] = np.nan  # exercise default directions
+delays = np.nan_to_num(features[:, 2]) / 20 + np.nan_to_num(features[:, 1]) * 10
+
+parity_ok = True
+for objective, labels in [('reg:squarederror', delays), ('binary:logistic', (delays > 50).astype(int))]:
+    booster = xgb.train({'objective': objective, 'max_depth': 6}, xgb.DMatrix(features, label=labels), 50)
+    expected = booster.inplace_predict(features)
+    compiled = CompiledEnsemble.from_booster(booster).predict(features)
+    max_error = float(np.max(np.abs(expected - compiled) / np.maximum(1.0, np.abs(expected))))
+    parity_ok &= max_error < 1e-4
+    print(f"   {'✓' if max_error < 1e-4 else '✗'} {objective}: max relative difference {max_error:.2e}")
+
+# DelayPredictor end to end in both modes (cache off so each mode really runs)
+with tempfile.TemporaryDirectory() as model_dir:
+    model_path = os.path.join(model_dir, 'delay_predictor.ubj')
+    xgb.train({'objective': 'reg:squarederror', 'max_depth': 6}, xgb.DMatrix(features, label=delays), 50).save_model(model_path)
+    cache_backend, prediction_cache.backend = prediction_cache.backend, 'off'
+    standard = DelayPredictor(model_path=model_path, inference_mode='xgboost').predict_delay(test_wagon, test_route)
+    compiled_predictor = DelayPredictor(model_path=model_path, inference_mode='compiled')
+    fast = compiled_predictor.predict_delay(test_wagon, test_route)
+    prediction_cache.backend = cache_backend
+    modes_match = standard == fast and compiled_predictor.last_inference['backend'] == 'compiled'
+    parity_ok &= modes_match
+    print(f"   {'✓' if modes_match else '✗'} DelayPredictor: xgboost {standard} min, compiled {fast} min")
+
+if not parity_ok:
+    print("   ✗ Compiled inference does not match XGBoost")
+    sys.exit(1)
+
+print("\n" + "=" * 50)
+print("Testing Optimizer Behavior")
+print("=" * 50)
+
+# Modules below import the ORM; the checks themselves use their own SQLite engine
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import itertools
+import scipy.sparse
+from api import decomposition
+from api.decomposition import DecomposedRakeFormationOptimizer
+from api.optimizer import MIN_FILL_RATIO, MAX_FILL_RATIO
+
+behavior_ok = True
+
+
+def check(ok: bool, message: str):
+    global behavior_ok
+    behavior_ok &= bool(ok)
+    print(f"   {'✓' if ok else '✗'} {message}")
+
+
+def brute_force_optimum(wagons, orders, costs):
+    """Cheapest assignment by enumeration (each wagon to one order or none), None if infeasible"""
+    best = None
+    for choice in itertools.product(range(-1, len(orders)), repeat=len(wagons)):
+        loads = [0.0] * len(orders)
+        for w_idx, o_idx in enumerate(choice):
+            if o_idx >= 0:
+                loads[o_idx] += wagons[w_idx]['capacity_tonnes']
+        if all(order['required_capacity'] * MIN_FILL_RATIO <= load <= order['required_capacity'] * MAX_FILL_RATIO
+               for order, load in zip(orders, loads)):
+            cost = sum(costs[w_idx][o_idx] for w_idx, o_idx in enumerate(choice) if o_idx >= 0)
+            best = cost if best is None or cost < best else best
+    return best
+
+
+rng = np.random.default_rng(11)
+small_wagons = [
+    {'id': f'W{w_idx}', 'wagon_type': 'BOXN', 'capacity_tonnes': float(capacity)}
+    for w_idx, capacity in enumerate(rng.integers(50, 65, size=8))
+]
+small_orders = [
+    {'id': 1, 'required_capacity': 120.0, 'compatible_wagon_types': ['BOXN']},
+    {'id': 2, 'required_capacity': 170.0, 'compatible_wagon_types': ['BOXN']},
+]
+small_costs = rng.uniform(100, 400, size=(len(small_wagons), len(small_orders))).round(2)
+optimum = brute_force_optimum(small_wagons, small_orders, small_costs)
+
+# Optimizer results must match the enumerated optimum for every engine and cost format
+print("\n5. Testing exact engines against brute force...")
+rows, cols = np.nonzero(np.ones_like(small_costs))
+cost_formats = {
+    'dense': small_costs,
+    'legacy dict': {f"{w_idx}_{o_idx}": small_costs[w_idx, o_idx] for w_idx, o_idx in zip(rows, cols)},
+    'triplets': {'rows': rows.tolist(), 'cols': cols.tolist(), 'values': small_costs[rows, cols].tolist()},
+    'scipy.sparse': scipy.sparse.csr_matrix(small_costs),
+}
+for engine in ('scip', 'cpsat'):
+    for name, cost_matrix in cost_formats.items():
+        result = RakeFormationOptimizer(small_wagons, small_orders, cost_matrix, use_cache=False).optimize(engine=engine)
+        objective = result.get('objective_value')
+        check(result.get('status') == 'optimal' and objective is not None and abs(objective - optimum) < 0.05,
+              f"{engine} / {name}: {objective} vs brute force {optimum:.2f}")
+
+# Only a proven INFEASIBLE is 'infeasible'; running out of time is not
+print("\n6. Testing infeasible and no-solution statuses...")
+from benchmarks.synthetic_fleet import generate_fleet
+
+unfillable = [{**small_orders[0], 'required_capacity': 10000.0}]
+for engine in ('scip', 'cpsat'):
+    result = RakeFormationOptimizer(small_wagons, unfillable, small_costs[:, :1], use_cache=False).optimize(engine=engine)
+    check(result.get('status') == 'infeasible', f"{engine} / unfillable order: {result.get('status')}")
+fleet_wagons, fleet_orders, fleet_costs = generate_fleet(1000, seed=3)
+result = RakeFormationOptimizer(fleet_wagons, fleet_orders, fleet_costs, use_cache=False,
+                                time_limit_seconds=0.5).optimize(engine='cpsat')
+check(result.get('status') != 'infeasible' and (result['status'] != 'no_solution' or result['best_bound'] is not None),
+      f"cpsat / 1000 wagons in 0.5 s: {result.get('status')}, bound {result.get('best_bound')}")
+
+# Fixed warm-start wagons that no assignment can complete fall back to a hint
+print("\n7. Testing fixed warm starts...")
+warm_wagons = [
+    {'id': wagon_id, 'wagon_type': 'BOXN', 'capacity_tonnes': capacity}
+    for wagon_id, capacity in (('A', 50.0), ('B', 50.0), ('C', 90.0))
+]
+warm_orders = [{'id': 1, 'required_capacity': 145.0, 'compatible_wagon_types': ['BOXN']}]
+warm_costs = np.full((len(warm_wagons), 1), 100.0)
+for engine in ('scip', 'cpsat', 'heuristic'):
+    result = RakeFormationOptimizer(warm_wagons, warm_orders, warm_costs, use_cache=False).optimize(
+        engine=engine, warm_start={'A': 1, 'B': 1}, fix_warm_start=True
+    )
+    assigned = sorted(assignment['wagon_id'] for assignment in result.get('assignments', []))
+    check(result.get('status') in ('optimal', 'feasible') and result['warm_start']['fixed'] == 0,
+          f"{engine} / A+B fixed (cannot reach 145 t): {result.get('status')} with {assigned}")
+result = RakeFormationOptimizer(warm_wagons, warm_orders, warm_costs, use_cache=False).optimize(
+    engine='cpsat', warm_start={'A': 1, 'C': 1}, fix_warm_start=True
+)
+check(result.get('status') == 'optimal' and result['warm_start']['fixed'] == 2,
+      f"cpsat / A+C fixed (completable): {result.get('status')}, {result['warm_start']['fixed']} fixed")
+
+# Solving independent components in a pool must give the single-solve answer
+print("\n8. Testing decomposed solves against a single solve...")
+split_wagons = [
+    {**wagon, 'id': f'{stockyard}-{wagon["id"]}', 'current_stockyard_id': stockyard}
+    for stockyard in (1, 2) for wagon in small_wagons
+]
+split_orders = [
+    {**order, 'id': order['id'] + 10 * stockyard, 'origin_stockyard_id': stockyard}
+    for stockyard in (1, 2) for order in small_orders
+]
+split_costs = np.vstack([np.hstack([small_costs, small_costs + 1000]), np.hstack([small_costs + 1000, small_costs])])
+infeasible_orders = split_orders[:3] + [{**split_orders[3], 'required_capacity': 10000.0}]
+min_pairs_for_pool, decomposition.MIN_PAIRS_FOR_POOL = decomposition.MIN_PAIRS_FOR_POOL, 0
+for label, orders, partial in [('all feasible', split_orders, False), ('partly infeasible', infeasible_orders, True)]:
+    single = RakeFormationOptimizer(split_wagons, orders, split_costs, use_cache=False, partial=partial).optimize()
+    split = DecomposedRakeFormationOptimizer(split_wagons, orders, split_costs, use_cache=False,
+                                             partial=partial).optimize()
+    check(split.get('components') == 2 and single['status'] == split['status'] == 'optimal'
+          and abs(single['objective_value'] - split['objective_value']) < 1e-6
+          and single.get('unserved_order_ids') == split.get('unserved_order_ids'),
+          f"{label}: single {single['objective_value']:.2f} {single.get('unserved_order_ids', [])}, "
+          f"decomposed {split['objective_value']:.2f} {split.get('unserved_order_ids', [])}")
+strict = DecomposedRakeFormationOptimizer(split_wagons, infeasible_orders, split_costs, use_cache=False).optimize()
+check(strict['status'] == 'infeasible', f"partly infeasible without partial mode: {strict['status']}")
+decomposition.MIN_PAIRS_FOR_POOL = min_pairs_for_pool
+
+# The heuristic may be worse than the optimum, never better, and its bound must hold
+print("\n9. Testing heuristic engine against the optimum...")
+result = RakeFormationOptimizer(small_wagons, small_orders, small_costs, use_cache=False).optimize(engine='heuristic')
+objective, bound = result.get('objective_value'), result.get('best_bound')
+check(result.get('status') in ('optimal', 'feasible') and objective >= optimum - 1e-6,
+      f"heuristic objective {objective} >= optimum {optimum:.2f}")
+check(bound is None or bound <= optimum + 1e-6, f"heuristic lower bound {bound} <= optimum {optimum:.2f}")
+
+# A full run, then incremental runs on new plans only; a missing booster is retrained in full
+print("\n10. Testing incremental model training...")
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from api import models, training
+
+db_engine = create_engine('sqlite://')
+models.Base.metadata.create_all(bind=db_engine)
+db = sessionmaker(bind=db_engine)()
+db.add(models.Route(route_name='R1', origin='Bokaro', destination='Mumbai Port',
+                    distance_km=1500, estimated_duration_hours=30))
+
+
+def add_history(plan_ids):
+    for plan_id in plan_ids:
+        db.add(models.FormationPlan(id=plan_id, plan_name=f'P{plan_id}', route='R1', created_by='test',
+                                    destination='Mumbai Port', status=['Completed', 'Rejected', 'Approved'][plan_id % 3]))
+        db.add(models.Wagon(id=f'W{plan_id}', wagon_type='BOXN', capacity_tonnes=58,
+                            current_load_tonnes=float(plan_id % 50), status='Assigned'))
+        db.add(models.PlanWagonAssignment(plan_id=plan_id, wagon_id=f'W{plan_id}', sequence_order=1))
+        db.add(models.RakeMovement(plan_id=plan_id, delay_minutes=plan_id * 7 % 300,
+                                   timestamp=datetime(2026, 1, 1) + timedelta(hours=plan_id)))
+    db.commit()
+
+
+model_paths = (training.MODEL_DIR, training.DELAY_MODEL_PATH, training.FULFILLMENT_MODEL_PATH, training.TRAINING_STATE_PATH)
+with tempfile.TemporaryDirectory() as model_dir:
+    training.MODEL_DIR, training.DELAY_MODEL_PATH, training.FULFILLMENT_MODEL_PATH, training.TRAINING_STATE_PATH = (
+        model_dir, *(os.path.join(model_dir, os.path.basename(path)) for path in model_paths[1:])
+    )
+    add_history(range(1, 41))
+    report = training.train_models(db, chunk_size=7)
+    check(report['mode'] == 'full' and report['plans'] == 40 and report['delay_trees'] == training.FULL_BOOST_ROUNDS,
+          f"first run: {report['mode']} on {report['plans']} plans, {report['delay_trees']} trees")
+    add_history(range(41, 51))
+    report = training.train_models(db, chunk_size=7)
+    check(report['mode'] == 'incremental' and report['plans'] == 10
+          and report['delay_trees'] == training.FULL_BOOST_ROUNDS + training.INCREMENTAL_BOOST_ROUNDS,
+          f"new plans: {report['mode']} on {report['plans']} plans, {report['delay_trees']} trees")
+    os.remove(training.FULFILLMENT_MODEL_PATH)
+    add_history(range(51, 56))
+    report = training.train_models(db, chunk_size=7)
+    check(report['mode'] == 'mixed' and report['fulfillment_mode'] == 'full' and report['delay_rows'] == 5
+          and report['fulfillment_trees'] == training.FULL_BOOST_ROUNDS,
+          f"missing fulfillment model: {report['delay_mode']} delay on {report['delay_rows']} rows, "
+          f"{report['fulfillment_mode']} fulfillment on {report['fulfillment_rows']} rows")
+training.MODEL_DIR, training.DELAY_MODEL_PATH, training.FULFILLMENT_MODEL_PATH, training.TRAINING_STATE_PATH = model_paths
+db.close()
+
+# Counters stay in process until a flush; a new model version drops old entries
+print("\n11. Testing prediction cache...")
+import fakeredis
+from api.prediction_cache import PredictionCache, PREDICTION_STATS_KEY
+
+cache = PredictionCache(backend='memory')
+cache._redis = fakeredis.FakeRedis()
+cache.set_many('delay', 'v1', {b'a': 1.5, b'b': 2.5})
+check(cache.get_many('delay', 'v1', [b'a', b'b', b'c']) == [1.5, 2.5, None], "hits return the stored values")
+check(not cache._redis.exists(PREDICTION_STATS_KEY), "lookups do not write counters to Redis")
+stats = cache.stats()
+check(stats['scope'] == 'all processes' and stats['hits'] == 2 and stats['misses'] == 1,
+      f"stats flush the counters: {stats['hits']} hits, {stats['misses']} misses")
+check(cache.get_many('delay', 'v2', [b'a']) == [None] and cache.stats()['invalidations'] == 1,
+      "a new model version drops the old entries")
+
+# Relaxing the route matrix with new legs must match rebuilding it
+print("\n12. Testing incremental route matrix against a full rebuild...")
+from api.route_matrix import RouteMatrix
+
+# Few enough new legs (at most a tenth of the places) to take the relaxation path
+places = [f'place-{p_idx:02d}' for p_idx in range(30)]
+edges = {}
+for p_idx in range(len(places) - 1):
+    edges[(places[p_idx], places[p_idx + 1])] = (float(rng.uniform(50, 500)), float(rng.uniform(1, 10)))
+base = RouteMatrix.build(edges)
+added = dict(edges)
+added[(places[0], places[6])] = (60.0, 1.0)
+added[(places[3], 'place-new')] = (40.0, 0.5)
+incremental, rebuilt = base.updated(added), RouteMatrix.build(added)
+order_idx = [incremental.node_index[node] for node in rebuilt.nodes]
+check(np.allclose(incremental.distance[np.ix_(order_idx, order_idx)], rebuilt.distance, rtol=1e-5)
+      and np.allclose(incremental.duration[np.ix_(order_idx, order_idx)], rebuilt.duration, rtol=1e-5),
+      "added legs: incremental matrix equals full rebuild")
+with tempfile.TemporaryDirectory() as matrix_dir:
+    matrix_path = os.path.join(matrix_dir, 'route_matrix.npz')
+    incremental.save(matrix_path)
+    loaded = RouteMatrix.load(matrix_path)
+    check(os.listdir(matrix_dir) == ['route_matrix.npz'] and loaded.nodes == incremental.nodes
+          and np.array_equal(loaded.distance, incremental.distance) and loaded.edges == incremental.edges,
+          "save and load round trip, no temporary file left")
+
+# Saving assignments must not steal wagons another plan claimed meanwhile
+print("\n13. Testing wagon conflict detection...")
+from api.tasks import _persist_assignments, WagonConflictError
+
+db_engine = create_engine('sqlite://')
+models.Base.metadata.create_all(bind=db_engine)
+db = sessionmaker(bind=db_engine)()
+db.add_all([
+    models.Wagon(id='W-free', wagon_type='BOXN', capacity_tonnes=58, status='Available'),
+    models.Wagon(id='W-taken', wagon_type='BOXN', capacity_tonnes=58, status='Assigned'),
+])
+db.commit()
+try:
+    _persist_assignments(db, {1: [{'wagon_id': 'W-free', 'sequence_order': 1},
+                                  {'wagon_id': 'W-taken', 'sequence_order': 2}]})
+    check(False, "WagonConflictError raised")
+except WagonConflictError as e:
+    db.expire_all()
+    check(e.wagon_ids == ['W-taken'] and db.get(models.Wagon, 'W-free').status == 'Available',
+          f"WagonConflictError for {e.wagon_ids}; nothing written")
+db.close()
+
+# Subscribers get live events until completion; late ones get the last event at once
+print("\n14. Testing job event streaming...")
+import asyncio
+from api.job_events import JobEvents, format_sse
+
+redis_server = fakeredis.FakeServer()
+events = JobEvents()
+events._redis = fakeredis.FakeRedis(server=redis_server)
+events._async_redis = fakeredis.FakeAsyncRedis(server=redis_server)
+
+
+async def collect(job_id, publish=()):
+    """Events streamed for job_id while the given (event, data) pairs are published"""
+    streamed = []
+    
+    async def consume():
+        async for event in events.subscribe(job_id, heartbeat_seconds=0.05):
+            if event is not None:
+                streamed.append(event)
+    
+    consumer = asyncio.create_task(consume())
+    await asyncio.sleep(0.1)
+    for event, data in publish:
+        events.publish(job_id, event, data)
+    await asyncio.wait_for(consumer, 5)
+    return streamed
+
+
+streamed = asyncio.run(collect('job-sse', [
+    ('progress', {'progress': 50}),
+    ('completion', {'status': 'completed', 'assignments': [{'wagon_id': 'W1'}]}),
+]))
+check([event['event'] for event in streamed] == ['progress', 'completion']
+      and 'assignments' not in streamed[-1]['data'], "live: progress, then completion without assignments")
+late = asyncio.run(collect('job-sse'))
+check([event['event'] for event in late] == ['completion'], "late subscriber gets the completion and stops")
+check(format_sse(streamed[0]) == 'event: progress\ndata: {"progress": 50}\n\n'
+      and format_sse(None) == ': keep-alive\n\n', "SSE frames and keep-alive comments")
+
+# One in-flight job per plan: dedup, supersede, release and lost-job takeover
+print("\n15. Testing job registry...")
+from api.job_registry import JobRegistry
+
+registry = JobRegistry(pending_grace_seconds=0)
+registry._redis = fakeredis.FakeRedis()
+job_states = {}
+registry._job_state = lambda job_id: job_states.get(job_id, 'PENDING')
+job_states['job-a'] = 'STARTED'
+check(registry.claim(1, 'inputs-1', 'job-a') == ('job-a', None), "first submit claims the plan")
+check(registry.claim(1, 'inputs-1', 'job-b') == ('job-a', None), "same inputs are deduplicated")
+job_states['job-c'] = 'STARTED'
+check(registry.claim(1, 'inputs-2', 'job-c') == ('job-c', 'job-a'), "changed inputs supersede the running job")
+check(not registry.is_current(1, 'job-a') and registry.is_current(1, 'job-c'), "superseded job is no longer current")
+registry.release(1, 'job-a')
+check(registry.current(1)['job_id'] == 'job-c', "a stale job cannot release the new one's entry")
+job_states['job-c'] = 'SUCCESS'
+check(registry.claim(1, 'inputs-2', 'job-d') == ('job-d', None), "a finished job's entry is taken over")
+check(registry.claim(1, 'inputs-2', 'job-e') == ('job-e', None), "a lost (PENDING) job's entry is taken over")
+registry.release(1, 'job-e')
+check(registry.current(1) is None, "release frees the plan")
+
+# Urgent plans get a queue every pool reads first; preemption is capped; stops interrupt every engine
+print("\n16. Testing preemption and cancellation...")
+from api.celery_app import optimization_queue_options, URGENT_QUEUE, BULK_QUEUE
+
+urgent, bulk = optimization_queue_options(5000, urgent=True), optimization_queue_options(5000)
+check(urgent['queue'] == URGENT_QUEUE and bulk['queue'] == BULK_QUEUE and urgent['time_limit'] == bulk['time_limit'],
+      "urgent plans use the urgent queue with the time limits of their size")
+registry = JobRegistry(max_preemptions=2)
+registry._redis = fakeredis.FakeRedis()
+registry.mark_running_bulk('bulk-a')
+preempted = []
+for _ in range(3):
+    preempted.append(registry.preempt_bulk_jobs())
+    registry.clear_stop('bulk-a')
+check(preempted == [['bulk-a'], ['bulk-a'], []], f"a bulk job yields at most twice: {preempted}")
+for engine in ('scip', 'cpsat', 'heuristic'):
+    result = RakeFormationOptimizer(small_wagons, small_orders, small_costs, use_cache=False,
+                                    should_stop=lambda: 'cancelled').optimize(engine=engine)
+    check(result.get('interrupted') == 'cancelled' and result['status'] in ('interrupted', 'feasible'),
+          f"{engine} / cancelled: {result['status']}")
+
+# Pages come out of the stored chunks in order, whatever the page and chunk sizes
+print("\n17. Testing result store paging...")
+from api import result_store
+
+db_engine = create_engine('sqlite://')
+models.Base.metadata.create_all(bind=db_engine)
+db = sessionmaker(bind=db_engine)()
+stored = [{'wagon_id': f'W{a_idx}', 'order_id': 1, 'sequence_order': a_idx + 1} for a_idx in range(25)]
+chunk_size, result_store.RESULT_CHUNK_SIZE = result_store.RESULT_CHUNK_SIZE, 7
+summary = result_store.store_result(db, 'job-r', {'status': 'completed'}, stored)
+db.commit()
+pages_ok = all(
+    result_store.load_assignments(db, 'job-r', offset, limit) == (stored[offset:offset + limit], len(stored))
+    for offset in range(0, 30, 4) for limit in (1, 6, 7, 20)
+)
+check(pages_ok and summary['assignments_total'] == 25 and 'assignments' not in summary
+      and db.query(models.OptimizationResultChunk).count() == 4, "pages match the stored list across chunks")
+result_store.store_result(db, 'job-r', {'status': 'completed'}, stored[:3])
+db.commit()
+check(result_store.load_assignments(db, 'job-r', 0, None) == (stored[:3], 3), "storing again replaces the chunks")
+result_store.delete_result(db, 'job-r')
+db.commit()
+check(result_store.load_assignments(db, 'job-r') is None and db.query(models.OptimizationResultChunk).count() == 0,
+      "delete removes the result and its chunks")
+result_store.RESULT_CHUNK_SIZE = chunk_size
+db.close()
+
+if not behavior_ok:
+    print("\n   ✗ Optimizer behavior checks failed")
+    sys.exit(1)
+
 print("\n" + "=" * 50)
 print("All Models Tested Successfully!")
 print("=" * 50)